@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
-"""Electricity costs and gain from the Octopus API."""
+"""Electricity and gas costs and export gain from the Octopus API."""
 
 import os
 import asyncio
 import logging
 import logging.handlers
-from datetime import datetime
 from dotenv import dotenv_values
 
 from influxconnection import InfluxConnection
@@ -38,43 +37,25 @@ async def main():
             # client.set_period_from("2021-07-01T00:00")
             # client.set_period_to("2021-08-01T00:00")
             client.set_page_size(25000)
-            charge = client.electricity_standing_charge
             influx_tags = {
                 'account_number': client.account_number,
             }
             logger.info("Adding Octopus Cost information to influxdb")
-            # Obtain half hour cost figures and add to influxdb
-            cost = client.calculate_electricity_cost(30)
-            for day in cost:
-                cost[day] = int(cost[day] + charge)
-                influx_fields = {
-                    'cost': cost[day],
-                    'month': day.strftime("%b %Y")
-                }
+            # Rebuild the daily bill using the standing charge which applied on each day
+            bill = client.get_bill(30, gas_units=env.get('octopus_gas_units', 'kWh'))
+            for line in bill.days:
                 influx_data = [
                     {
-                        'measurement': 'daily_electricity_cost',
-                        'time': datetime.strftime(day, '%Y-%m-%dT%H:%MZ'),
+                        'measurement': measurement,
+                        'time': line.period.strftime('%Y-%m-%dT%H:%MZ'),
                         'tags': influx_tags,
-                        'fields': influx_fields,
-                    }
-                ]
-                connection.influxdb.write_points(influx_data)
-
-            # Obtain half hour gain figures and add to influxdb
-            gain = client.calculate_electricity_gain(30)
-            for day in gain:
-                influx_fields = {
-                    'gain': int(gain[day]),
-                    'month': day.strftime("%b %Y")
-                }
-                influx_data = [
-                    {
-                        'measurement': 'daily_export_gain',
-                        'time': datetime.strftime(day, '%Y-%m-%dT%H:%MZ'),
-                        'tags': influx_tags,
-                        'fields': influx_fields,
+                        'fields': {**fields, 'month': line.period.strftime("%b %Y")},
                     }
+                    for measurement, fields in (
+                        ('daily_electricity_cost', {'cost': int(line.electricity)}),
+                        ('daily_export_gain', {'gain': int(line.export_credit)}),
+                        ('daily_gas_cost', {'cost': int(line.gas)}),
+                    )
                 ]
                 connection.influxdb.write_points(influx_data)
 
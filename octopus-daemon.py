@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Run the Octopus collectors on a schedule from a single long running process.
+
+The daemon keeps one Octopus client, its connection pool and one InfluxDB connection open
+and runs the usage, cost, peak and monthly collectors at configurable intervals."""
+
+import argparse
+import os
+import signal
+from datetime import datetime, timedelta, timezone
+
+from octopusapi.aggregate import period_start, rollup
+from octopusapi.api import OctopusClient
+from octopusapi.const import Group
+from octopusapi.plan import CollectionPlan, Dataset, Output
+from octopusapi.scheduler import Job, NotReady, Scheduler
+from utilities import InfluxConnection, get_env, get_logger
+
+logger = get_logger(destination="syslog", level="INFO")
+
+USAGE = [
+    ("gas_consumption", Dataset.GAS_CONSUMPTION),
+    ("electricity_consumption", Dataset.IMPORT_CONSUMPTION),
+    ("electricity_export", Dataset.EXPORT_CONSUMPTION),
+]
+
+MONTHLY = [
+    ("electricity_monthly_consumption", Dataset.IMPORT_CONSUMPTION),
+    ("electricity_monthly_export", Dataset.EXPORT_CONSUMPTION),
+    ("gas__monthly_consumption", Dataset.GAS_CONSUMPTION),
+]
+
+
+def getopts():
+    """Get arguments for this script."""
+    parser = argparse.ArgumentParser(description="Collect Octopus data into influxdb on a schedule")
+    parser.add_argument("--usage", type=int, default=60, help="Minutes between usage collections")
+    parser.add_argument("--cost", type=int, default=24 * 60, help="Minutes between cost collections")
+    parser.add_argument("--peak", type=int, default=24 * 60, help="Minutes between peak collections")
+    parser.add_argument("--monthly", type=int, default=24 * 60, help="Minutes between monthly collections")
+    parser.add_argument("--live", type=int, default=0,
+                        help="Seconds between live telemetry polls, 0 disables them")
+    parser.add_argument("--graphql", default=None, help="GraphQL URL to poll instead of the Octopus API")
+    parser.add_argument("--jitter", type=int, default=5, help="Maximum random delay in minutes added to each run")
+    parser.add_argument("--state", default=os.path.expanduser("~/.octopus-daemon.json"),
+                        help="File used to remember when each collector last ran")
+    return parser.parse_args()
+
+
+def catch_up(since: datetime, days: int) -> int:
+    """Return the number of days to collect, covering any time the daemon was not running."""
+    if since is None:
+        return days
+    return max(days, (datetime.now(timezone.utc) - since).days + 1)
+
+
+def point(measurement: str, time: datetime, tags: dict, fields: dict) -> dict:
+    """Return an influxdb data point."""
+    return {
+        "measurement": measurement,
+        "time": time.strftime("%Y-%m-%dT%H:%MZ"),
+        "tags": tags,
+        "fields": fields,
+    }
+
+
+def usage_collector(client: OctopusClient, influxdb):
+    """Collect daily usage, only fetching days which are not yet complete."""
+
+    def collect(since: datetime) -> datetime:
+        midnight = period_start(datetime.now(timezone.utc), Group.DAY)
+        # Fetch from the start of the day so that the daily totals written are complete
+        start = None if since is None else period_start(since, Group.DAY)
+        latest = []
+        for measurement, dataset in USAGE:
+            entries = client.fetch(dataset, days=30) if start is None else client.fetch(dataset, since=start)
+            if not entries:
+                continue
+            latest.append(max(entry.interval_end for entry in entries))
+            influxdb.write_points([
+                point(measurement, data.interval_start,
+                      {"account_number": client.account_number,
+                       "month": data.interval_start.strftime("%Y %m"),
+                       "year": data.interval_start.strftime("%Y")},
+                      {"consumption": data.consumption})
+                for data in rollup(entries, Group.DAY)
+            ])
+        logger.info("Added Octopus usage information to influxdb")
+        if not latest or min(latest) < midnight:
+            # Only the days which are still incomplete need to be polled again
+            raise NotReady("consumption for yesterday has not been published",
+                           since=min(latest) if latest else since)
+        return min(latest)
+
+    return collect
+
+
+def cost_collector(client: OctopusClient, influxdb):
+    """Collect the daily electricity cost and export gain."""
+
+    def collect(since: datetime) -> None:
+        days = catch_up(since, 30)
+        results = client.collect(CollectionPlan().add(Output.DAILY_COST, days).add(Output.DAILY_GAIN, days))
+        tags = {"account_number": client.account_number}
+        influx_data = [point("daily_electricity_cost", datetime.combine(day, datetime.min.time()), tags,
+                             {"cost": int(cost), "month": day.strftime("%b %Y")})
+                       for day, cost in results[Output.DAILY_COST].items()]
+        influx_data += [point("daily_export_gain", datetime.combine(day, datetime.min.time()), tags,
+                              {"gain": int(gain), "month": day.strftime("%b %Y")})
+                        for day, gain in results[Output.DAILY_GAIN].items()]
+        logger.info("Adding Octopus Cost information to influxdb")
+        influxdb.write_points(influx_data)
+
+    return collect
+
+
+def peak_collector(client: OctopusClient, influxdb):
+    """Collect daily and monthly peak and offpeak usage."""
+
+    def collect(since: datetime) -> None:
+        today = datetime.now()
+        days = catch_up(since, today.day + 31)
+        results = client.collect(CollectionPlan().add(Output.PEAK_SPLIT, days))[Output.PEAK_SPLIT]
+        names = {"Standard": "standard consumption", "Peak": "peak consumption", "OffPeak": "offpeak consumption"}
+        for group, measurement in ((Group.DAY, "electricity_peak_offpeak_daily"),
+                                   (Group.MONTH, "electricity_peak_offpeak_monthly")):
+            influxdb.write_points([
+                point(measurement, data.interval_start,
+                      {"account_number": client.account_number,
+                       "year": data.interval_start.strftime("%Y"),
+                       "month": data.interval_start.strftime("%Y %m")},
+                      {names[key]: float(round(value, 2)) for key, value in data.ranges.items() if value})
+                for data in results[group]
+            ])
+        logger.info("Adding  Octopus peak usage information to influxdb")
+
+    return collect
+
+
+def monthly_collector(client: OctopusClient, influxdb):
+    """Collect monthly consumption and export."""
+
+    def collect(since: datetime) -> None:
+        results = client.collect(CollectionPlan().add(Output.MONTHLY_TOTALS, 365))[Output.MONTHLY_TOTALS]
+        for measurement, dataset in MONTHLY:
+            influxdb.write_points([
+                point(measurement, data.interval_start,
+                      {"account_number": client.account_number,
+                       "year": data.interval_start.strftime("%Y"),
+                       "month": data.interval_start.strftime("%Y %m")},
+                      {"consumption": data.consumption})
+                for data in results[dataset]
+            ])
+        logger.info("Adding  Octopus monthly usage information to influxdb")
+
+    return collect
+
+
+def live_collector(client: OctopusClient, influxdb):
+    """Collect live consumption from the smart meter Home Mini telemetry."""
+
+    def collect(since: datetime) -> datetime:
+        # Only readings from the last hour are kept by the telemetry API
+        since = max(since, datetime.now(timezone.utc) - timedelta(hours=1)) if since else None
+        entries = client.get_live_consumption(since=since)
+        if not entries:
+            return since
+        influxdb.write_points([
+            point("electricity_live", data.interval_start,
+                  {"account_number": client.account_number},
+                  {"consumption": data.consumption})
+            for data in entries
+        ])
+        return max(entry.interval_start for entry in entries)
+
+    return collect
+
+
+def main() -> None:
+    """Run the collectors until the process is stopped."""
+    env = get_env()
+    args = getopts()
+    scheduler = Scheduler(state_file=args.state)
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: scheduler.stop())
+    jitter = timedelta(minutes=args.jitter)
+    with InfluxConnection(database="octopus", reset=False).connect() as connection:
+        with OctopusClient(apikey=env.get("octopus_apikey"), account=env.get("octopus_account")) as client:
+            client.set_page_size(25000)
+            client.set_graphql_url(args.graphql)
+            collectors = [
+                ("usage", usage_collector, args.usage),
+                ("cost", cost_collector, args.cost),
+                ("peak", peak_collector, args.peak),
+                ("monthly", monthly_collector, args.monthly),
+                ("account", lambda client, influxdb: lambda since: client.refresh_account(), 24 * 60),
+            ]
+            for name, collector, minutes in collectors:
+                if minutes > 0:
+                    scheduler.add(Job(name=name, function=collector(client, connection),
+                                      interval=timedelta(minutes=minutes), jitter=jitter))
+            if args.live > 0:
+                # Live polls run at a fixed cadence so they are not delayed by jitter
+                scheduler.add(Job(name="live", function=live_collector(client, connection),
+                                  interval=timedelta(seconds=args.live), jitter=timedelta(0),
+                                  retry=timedelta(seconds=args.live)))
+            scheduler.run()
+
+
+if __name__ == "__main__":
+    main()
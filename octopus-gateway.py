@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Serve Octopus API data to local consumers from one shared client.
+
+Home Assistant, Grafana, battery controllers and scripts can read the REST API endpoints and the
+derived views from the gateway instead of each polling the Octopus API themselves."""
+
+import argparse
+
+from octopusapi.api import OctopusClient
+from octopusapi.gateway import Gateway
+from octopusapi.store import Store
+from utilities import get_env, get_logger
+
+logger = get_logger(destination="stdout", level="INFO")
+
+
+def getopts():
+    """Get arguments for this script."""
+    parser = argparse.ArgumentParser(description="Serve cached Octopus API data over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--ttl", type=float, default=300, help="Seconds rates, consumption and views are cached")
+    parser.add_argument("--slow-ttl", type=float, default=3600,
+                        help="Seconds accounts, products and standing charges are cached")
+    parser.add_argument("--rate", type=float, default=2, help="Upstream requests allowed per second")
+    parser.add_argument("--burst", type=int, default=4, help="Upstream requests allowed in a burst")
+    parser.add_argument("--store", default=None, help="SQLite store used to cache consumption and rates")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Serve the gateway until interrupted."""
+    env = get_env()
+    args = getopts()
+    with OctopusClient(apikey=env.get("octopus_apikey"), account=env.get("octopus_account")) as client:
+        client.set_rate_limit(args.rate, args.burst)
+        if args.store:
+            client.set_store(Store(args.store))
+        gateway = Gateway(client, ttl=args.ttl, slow_ttl=args.slow_ttl, host=args.host, port=args.port)
+        logger.info("Octopus gateway listening on %s", gateway.url)
+        gateway.serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@
 
 from datetime import datetime
 
+from octopusapi.aggregate import rollup
 from octopusapi.api import OctopusClient
 from utilities import InfluxConnection, get_env, get_logger
 
@@ -27,8 +28,7 @@ def log_usage(usage, influxdb, account_number, measurement) -> None:
             },
             "fields": {"consumption": data.consumption},
         }
-        for data in usage
-        if data.interval_start.strftime("%d") == "01"
+        for data in rollup(usage, "month")
     ]
     logger.info("Adding  Octopus monthly usage information to influxdb")
     influxdb.write_points(influx_data)
@@ -40,8 +40,9 @@ def main() -> None:  # sourcery skip: extract-method
     env = get_env()
     with InfluxConnection(database="octopus", reset=False).connect() as connection:
         with OctopusClient(apikey=env.get("octopus_apikey"), account=env.get("octopus_account")) as client:
-            client.set_page_size(9999)
-            client.set_group_by("month")
+            # Query half hourly data and group it into months locally
+            client.set_page_size(25000)
+            client.set_group_by(None)
             log_usage(
                 client.get_electricity_consumption(ago=365, days=365),
                 connection,
@@ -70,6 +70,11 @@ def main() -> None:
             startday = (now.date() - firstofmonth).days
             if args.reset is True:
                 querydays = 365
+                startday = querydays
+                # A full reload is split into shards which are fetched concurrently
+                client.set_max_workers(8)
+                client.set_rate_limit(5, burst=8)
+                client.set_sharding(True)
             if querydays > 0:
                 usage = client.get_electricity_consumption_byrange(ago=startday, days=startday, daily=False)
                 log_usage(usage, connection, client.account_number, "electricity_peak_offpeak_monthly")
@@ -1,7 +1,16 @@
 #!/usr/bin/env python3
 """Gas and Electricity usage from the Octopus API."""
 
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from octopusapi.aggregate import period_start, rollup
 from octopusapi.api import OctopusClient
+from octopusapi.const import Group
+from octopusapi.plan import Dataset
+from octopusapi.rolling import RollingStats
+from octopusapi.store import Store
 from utilities import InfluxConnection, get_env, get_logger
 
 logger = get_logger(destination="syslog")
@@ -22,34 +31,79 @@ def log_usage(usage, influxdb, account_number, measurement) -> None:
                 "consumption": data.consumption,
             },
         }
-        for data in usage
+        for data in rollup(usage, "day")
     ]
     logger.info("Adding  Octopus usage information to influxdb")
     influxdb.write_points(influx_data)
 
 
+def log_rolling(stats, influxdb, account_number, measurement, meters) -> None:
+    """Load the rolling statistics of the meters updated into influxdb."""
+    influx_data = []
+    for meter in meters:
+        summary = stats.summary(meter)
+        if summary.through is None:
+            continue
+        fields = {f"average_{days}d": average for days, average in summary.averages.items()}
+        fields.update({f"peak_{days}d": peak for days, (_, peak) in summary.peaks.items()})
+        if summary.baseload is not None:
+            fields["baseload"] = summary.baseload
+        influx_data.append({
+            "measurement": f"{measurement}_rolling",
+            "time": summary.through.strftime("%Y-%m-%dT%H:%MZ"),
+            "tags": {"account_number": account_number, "meter": meter},
+            "fields": fields,
+        })
+    logger.info("Adding Octopus rolling statistics to influxdb")
+    influxdb.write_points(influx_data)
+
+
 def main() -> None:  # sourcery skip: extract-method
-    """Query historical data and load into influxdb."""
+    """Repair any gaps in the half hourly history and load the days affected into influxdb."""
 
     env = get_env()
-    ago = 30
     days = 30
+    history = 365
     measurements = [
-        ("gas_consumption", "get_gas_consumption"),
-        ("electricity_consumption", "get_electricity_consumption"),
-        ("electricity_export", "get_electricity_export"),
+        ("gas_consumption", Dataset.GAS_CONSUMPTION),
+        ("electricity_consumption", Dataset.IMPORT_CONSUMPTION),
+        ("electricity_export", Dataset.EXPORT_CONSUMPTION),
     ]
-    with InfluxConnection(database="octopus", reset=False).connect() as connection:
+    store_path = env.get("octopus_store", os.path.expanduser("~/.octopus.db"))
+    rolling_path = env.get("octopus_rolling", os.path.expanduser("~/.octopus-rolling.json"))
+    try:
+        with open(rolling_path, encoding="utf-8") as checkpoint:
+            rolling = {name: RollingStats.from_dict(state) for name, state in json.load(checkpoint).items()}
+    except FileNotFoundError:
+        rolling = {}
+    with InfluxConnection(database="octopus", reset=False).connect() as connection, Store(store_path) as store:
         with OctopusClient(apikey=env.get("octopus_apikey"), account=env.get("octopus_account")) as client:
             client.set_page_size(25000)
-            client.set_group_by("day")
-            for measurement, method in measurements:
+            # Half hourly data is kept locally so that only the missing half hours are requested
+            client.set_store(store)
+            recent = datetime.now(timezone.utc) - timedelta(days=days)
+            for measurement, dataset in measurements:
+                report = client.backfill(dataset, days=history)
+                if report.missing:
+                    logger.warning("%s half hours of %s are still missing", report.missing, measurement)
+                # Rewrite the recent days and any earlier day which has been repaired
+                since = min(report.earliest or recent, recent)
                 log_usage(
-                    getattr(client, method)(ago=ago, days=days),
+                    client.fetch(dataset, since=period_start(since, Group.DAY)),
                     connection,
                     client.account_number,
                     measurement,
                 )
+                # Rolling statistics only need the half hours since the last run
+                stats = rolling.setdefault(measurement, RollingStats())
+                meters = set()
+                for arguments, results in client.iter_dataset(dataset, since=stats.through() or recent):
+                    meter = "/".join(arguments.values())
+                    if stats.update(meter, results):
+                        meters.add(meter)
+                log_rolling(stats, connection, client.account_number, measurement, meters)
+    with open(rolling_path, "w", encoding="utf-8") as checkpoint:
+        json.dump({name: stats.to_dict() for name, stats in rolling.items()}, checkpoint)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,13 @@
 """Octupus energy API client ."""
 import logging
-from .api import OctopusClient # noqa F401
 
 # Set default logging handler to avoid "No handler found" warnings.
 logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+def __getattr__(name: str):
+    # The client is imported when it is first used, so that the octopus command starts quickly
+    if name == "OctopusClient":
+        from .api import OctopusClient  # pylint: disable=import-outside-toplevel
+        return OctopusClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,106 @@
+"""Client side rollup of half hourly consumption into hours, days, weeks, months and quarters.
+
+The Octopus API can group consumption itself but every grouping is another request.
+These functions build the same groupings from half hourly data which has already been
+fetched, so a single query can serve every granularity that is needed."""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Iterable
+from zoneinfo import ZoneInfo
+
+from octopusapi.const import Group, usagerollup
+
+# Octopus tariffs and billing periods follow UK local time
+LONDON = ZoneInfo("Europe/London")
+
+
+def period_start(when: datetime, group: Group, tz: ZoneInfo = LONDON) -> datetime:
+    """Return the start of the period containing a time.
+
+    Hours are aligned in UTC so that the repeated hour when the clocks go back is kept as two
+    separate hours. All other periods start at local midnight, which is never ambiguous in the UK.
+
+    Args:
+        when (datetime): A timezone aware time
+        group (Group): The grouping to use
+        tz (ZoneInfo, optional): The local timezone. Defaults to Europe/London.
+    """
+    if group is Group.HOUR:
+        return when.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0).astimezone(tz)
+    local = when.astimezone(tz).date()
+    if group is Group.WEEK:
+        local -= timedelta(days=local.weekday())
+    elif group is Group.MONTH:
+        local = local.replace(day=1)
+    elif group is Group.QUARTER:
+        local = date(local.year, 3 * ((local.month - 1) // 3) + 1, 1)
+    return datetime(local.year, local.month, local.day, tzinfo=tz)
+
+
+def period_end(start: datetime, group: Group) -> datetime:
+    """Return the start of the period following the one starting at start."""
+    if group is Group.HOUR:
+        return (start.astimezone(timezone.utc) + timedelta(hours=1)).astimezone(start.tzinfo)
+    if group is Group.DAY:
+        day = start.date() + timedelta(days=1)
+    elif group is Group.WEEK:
+        day = start.date() + timedelta(days=7)
+    else:
+        months = 1 if group is Group.MONTH else 3
+        month = start.month - 1 + months
+        day = date(start.year + month // 12, month % 12 + 1, 1)
+    return datetime(day.year, day.month, day.day, tzinfo=start.tzinfo)
+
+
+def rollup(usage: Iterable, group: Group | str = Group.DAY, classify: Callable = None,
+           tz: ZoneInfo = LONDON) -> list[usagerollup]:
+    """Roll half hourly consumption up into periods.
+
+    Args:
+        usage (Iterable): Consumption entries with interval_start, interval_end and consumption
+        group (Group | str, optional): The grouping to use. Defaults to Group.DAY.
+        classify (Callable, optional): Returns a PriceType for an interval start time, used to split
+            each period into peak, offpeak and standard consumption. Defaults to None.
+        tz (ZoneInfo, optional): The local timezone. Defaults to Europe/London.
+
+    Returns:
+        list[usagerollup]: One entry per period which has data, in time order
+    """
+    if isinstance(group, str):
+        group = Group(group)
+    entries = list(usage)
+    if any(entries[i].interval_start > entries[i + 1].interval_start for i in range(len(entries) - 1)):
+        entries.sort(key=lambda entry: entry.interval_start)
+    results = []
+    current = None
+    for entry in entries:
+        # Only work out period boundaries when an interval falls outside the current period
+        if current is None or entry.interval_start >= current.interval_end:
+            start = period_start(entry.interval_start, group, tz)
+            current = usagerollup(interval_start=start, interval_end=period_end(start, group))
+            results.append(current)
+        value = entry.consumption
+        current.consumption += value
+        current.count += 1
+        if current.minimum is None or value < current.minimum:
+            current.minimum = value
+        if current.maximum is None or value > current.maximum:
+            current.maximum = value
+        if classify is not None:
+            pricetype = classify(entry.interval_start).value
+            current.ranges[pricetype] = current.ranges.get(pricetype, 0) + value
+    for result in results:
+        result.consumption = round(result.consumption, 3)
+        result.ranges = {key: round(value, 3) for key, value in result.ranges.items()}
+    return results
+
+
+def rollup_all(usage: Iterable, groups: Iterable = tuple(Group), classify: Callable = None,
+               tz: ZoneInfo = LONDON) -> dict[Group, list[usagerollup]]:
+    """Roll the same half hourly consumption up into several groupings.
+
+    Returns:
+        dict[Group, list[usagerollup]]: The rollup for each requested grouping
+    """
+    entries = sorted(usage, key=lambda entry: entry.interval_start)
+    return {Group(group): rollup(entries, group, classify, tz) for group in groups}
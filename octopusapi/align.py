@@ -0,0 +1,189 @@
+"""Import, export and generation joined onto one half hour grid.
+
+Import and export are returned as separate lists, and generation from an inverter or a
+generation meter comes from somewhere else again. Each series is placed on a grid of half hours
+in a single numpy pass, readings at a finer resolution are summed into their half hour, and the
+unit rates are looked up for every slot with a binary search over their start times. Net flow,
+self consumption and net cost are then whole array operations, so years of data are joined
+without building a dict per series.
+
+A half hour missing from a series which was given is NaN and marked in its missing mask, rather
+than being taken as zero, so a series which was given but is empty is missing throughout. A series
+which was not given at all is taken as zero.
+
+numpy is needed for alignment and pandas for to_frame()."""
+
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
+
+from octopusapi import frames
+from octopusapi.aggregate import LONDON
+
+SLOT = timedelta(minutes=30)
+_SECONDS = int(SLOT.total_seconds())
+# The series which can be aligned, in column order
+SERIES = ("import_kwh", "export_kwh", "generation_kwh")
+# The columns which are summed by totals() and daily()
+SUMMED = SERIES + ("net_kwh", "self_consumed_kwh", "demand_kwh", "import_cost", "export_credit", "net_cost")
+
+
+def _seconds(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _place(np, entries: list, start: int, slots: int) -> tuple:
+    """Sum a series into the slots of the grid, returning the totals with NaN where a slot has no reading."""
+    count = len(entries)
+    starts = (entry.interval_start for entry in entries)
+    times = frames._times(np, starts, count).astype("int64")  # pylint: disable=protected-access
+    values = np.fromiter((entry.consumption for entry in entries), dtype="float64", count=count)
+    index = (times - start) // _SECONDS
+    inside = (index >= 0) & (index < slots)
+    index, values = index[inside], values[inside]
+    totals = np.bincount(index, weights=values, minlength=slots).astype("float64", copy=False)
+    missing = np.bincount(index, minlength=slots) == 0
+    totals[missing] = np.nan
+    return totals, missing
+
+
+def _prices(np, rates: list, times):
+    """Return the unit rate applying at the start of each slot, NaN where no rate applies."""
+    ordered = sorted((entry for entry in rates if entry.valid_from is not None), key=lambda entry: entry.valid_from)
+    if not ordered:
+        return np.full(len(times), np.nan)
+    starts = np.fromiter((_seconds(entry.valid_from) for entry in ordered), dtype="int64", count=len(ordered))
+    ends = np.fromiter((np.inf if entry.valid_to is None else _seconds(entry.valid_to) for entry in ordered),
+                       dtype="float64", count=len(ordered))
+    values = np.fromiter((entry.value_inc_vat for entry in ordered), dtype="float64", count=len(ordered))
+    index = np.searchsorted(starts, times, side="right") - 1
+    found = index >= 0
+    index = np.where(found, index, 0)
+    return np.where(found & (times < ends[index]), values[index], np.nan)
+
+
+class Aligned:
+    """Half hourly energy flows and their cost on a single grid.
+
+    Args:
+        times: The start of each half hour as seconds since the epoch
+        columns (dict): The numpy array of each column
+        missing (dict): A boolean array of the half hours missing from each series which was given
+    """
+
+    def __init__(self, times, columns: dict, missing: dict) -> None:
+        self.times = times
+        self.columns = columns
+        self.missing = missing
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __getitem__(self, name: str):
+        return self.columns[name]
+
+    @property
+    def complete(self):
+        """A boolean array of the half hours present in every series which was given."""
+        np = frames._numpy()  # pylint: disable=protected-access
+        present = np.ones(len(self.times), dtype=bool)
+        for missing in self.missing.values():
+            present &= ~missing
+        return present
+
+    def totals(self) -> dict:
+        """Return the sum of each flow and cost over the half hours present, and the overall ratios."""
+        np = frames._numpy()  # pylint: disable=protected-access
+        totals = {name: round(float(np.nansum(self.columns[name])), 3) for name in SUMMED}
+        totals["self_consumption"] = (round(totals["self_consumed_kwh"] / totals["generation_kwh"], 4)
+                                      if totals["generation_kwh"] else None)
+        totals["self_sufficiency"] = (round(totals["self_consumed_kwh"] / totals["demand_kwh"], 4)
+                                      if totals["demand_kwh"] else None)
+        totals.update({f"missing_{name}": int(missing.sum()) for name, missing in self.missing.items()})
+        return totals
+
+    def daily(self, tz=LONDON) -> dict:
+        """Return the flows and costs summed for each local day, with the days as datetime64."""
+        np = frames._numpy()  # pylint: disable=protected-access
+        if not len(self.times):
+            return {"date": np.array([], dtype="datetime64[D]")}
+        first = datetime.fromtimestamp(int(self.times[0]), tz).date()
+        last = datetime.fromtimestamp(int(self.times[-1]), tz).date()
+        days = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+        # Only the midnights are converted to local time, each slot is then found by a binary search
+        midnights = np.array([_seconds(datetime(day.year, day.month, day.day, tzinfo=tz)) for day in days])
+        index = np.searchsorted(midnights, self.times, side="right") - 1
+        result = {"date": np.array(days, dtype="datetime64[D]")}
+        for name in SUMMED:
+            result[name] = np.bincount(index, weights=np.nan_to_num(self.columns[name]), minlength=len(days))
+        return result
+
+    def to_numpy(self) -> dict:
+        """Return the slot starts as UTC datetime64 and the numpy array of every column."""
+        return {"interval_start": self.times.astype("datetime64[s]"), **self.columns}
+
+    def to_frame(self, tz: str = frames.LOCAL):
+        """Return a DataFrame with a column for each flow and cost, indexed by the start of each half hour."""
+        return frames.to_frame(self.to_numpy(), "interval_start", tz)
+
+
+def align(import_consumption: Iterable = None, export: Iterable = None, generation: Iterable = None,
+          import_rates: Iterable = (), export_rates: Iterable = (), start: datetime = None,
+          end: datetime = None) -> Aligned:
+    """Join import, export and generation onto one half hour grid and price each half hour.
+
+    Columns, all in kWh or pence including VAT:
+        import_kwh, export_kwh, generation_kwh: The energy in each series, NaN where it is missing
+        net_kwh: Import less export, positive when drawing from the grid
+        self_consumed_kwh: Generation used on site, generation less export
+        demand_kwh: Energy used on site, import plus the generation used on site
+        self_consumption: The share of generation used on site
+        import_price, export_price: The unit rates applying
+        import_cost, export_credit, net_cost: The cost of the import, the credit for the export and their difference
+
+    Args:
+        import_consumption (Iterable, optional): Half hourly import consumption. Defaults to None.
+        export (Iterable, optional): Half hourly export. Defaults to None.
+        generation (Iterable, optional): Generation readings with interval_start and consumption, at half
+            hourly or finer resolution. Defaults to None, in which case nothing is self consumed.
+        import_rates (Iterable, optional): Import unit rates. Defaults to ().
+        export_rates (Iterable, optional): Export unit rates. Defaults to ().
+        start (datetime, optional): The start of the grid. Defaults to the earliest reading.
+        end (datetime, optional): The end of the grid. Defaults to the end of the latest reading.
+
+    Returns:
+        Aligned: The flows and costs of each half hour
+    """
+    np = frames._numpy()  # pylint: disable=protected-access
+    given = zip(SERIES, (import_consumption, export, generation))
+    series = {name: list(entries) for name, entries in given if entries is not None}
+    readings = [entry.interval_start for entries in series.values() for entry in entries]
+    if start is None:
+        start = min(readings, default=datetime.now(timezone.utc))
+    first = _seconds(start) // _SECONDS * _SECONDS
+    # The grid ends with the half hour containing the end, or the latest reading
+    last = _seconds(end) - 1 if end is not None else _seconds(max(readings, default=start))
+    slots = max(0, last // _SECONDS * _SECONDS - first + _SECONDS) // _SECONDS
+    times = first + np.arange(slots, dtype="int64") * _SECONDS
+    columns = {}
+    missing = {}
+    for name in SERIES:
+        if name in series:
+            columns[name], missing[name] = _place(np, series[name], first, slots)
+        else:
+            # A series which was not given contributes nothing rather than being missing
+            columns[name] = np.zeros(slots)
+    imported, exported, generated = (columns[name] for name in SERIES)
+    columns["net_kwh"] = imported - exported
+    columns["self_consumed_kwh"] = np.clip(generated - exported, 0, None)
+    columns["demand_kwh"] = imported + columns["self_consumed_kwh"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columns["self_consumption"] = np.where(generated > 0, columns["self_consumed_kwh"] / generated, np.nan)
+    columns["import_price"] = _prices(np, list(import_rates), times)
+    columns["export_price"] = _prices(np, list(export_rates), times)
+    columns["import_cost"] = imported * np.nan_to_num(columns["import_price"])
+    columns["export_credit"] = exported * np.nan_to_num(columns["export_price"])
+    columns["net_cost"] = columns["import_cost"] - columns["export_credit"]
+    return Aligned(times, columns, missing)
+
@@ -1,21 +1,58 @@
 """Contains the Octopus API class and its methods."""
 
+import copy
 import logging
-from collections import defaultdict
-from datetime import date, datetime, timedelta, timezone
-from typing import Callable
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from types import SimpleNamespace
+from datetime import date, datetime, time, timedelta, timezone
+from typing import TYPE_CHECKING, Callable
 
 import dateutil.parser
 import requests
+import requests.adapters
 import ujson
 from requests.auth import HTTPBasicAuth
 
 import octopusapi.const
-from octopusapi.const import APIConstants, APIList, Octopus, PriceType, DatetimeFormat
+from octopusapi import conditional, frames, merge, plan, pricing, shard, views
+from octopusapi.const import APIConstants, APIList, Octopus, DatetimeFormat
+
+if TYPE_CHECKING:
+    # Features are imported by the methods which use them, so that clients which only fetch data stay lean
+    from octopusapi import align, battery, bill, gaps, schedule
+    from octopusapi.catalogue import Catalogue
+    from octopusapi.store import Store
 
 # Only export the Octopus Client
 __all__ = ["OctopusClient"]
 
+# The arguments identifying the meter for each consumption endpoint when results are kept in a store
+STORE_METERS = {
+    APIList.ElectricityConsumption: ("mpan", "electricity_serial_number"),
+    APIList.ElectricityExport: ("export_mpan", "export_serial_number"),
+    APIList.GasConsumption: ("mprn", "gas_serial_number"),
+}
+
+# The kind of rate returned by each rate endpoint when results are kept in a store
+STORE_RATES = {
+    APIList.ElectricityStandardUnitRates: "standard",
+    APIList.ElectricityDayUnitRates: "day",
+    APIList.ElectricityNightUnitRates: "night",
+    APIList.ElectricityStandingCharges: "standing",
+    APIList.GasStandardUnitRates: "standard",
+    APIList.GasStandingCharges: "standing",
+}
+
+# The unit rates endpoint for each electricity register
+REGISTER_RATES = {
+    octopusapi.const.Rate.STANDARD: APIList.ElectricityStandardUnitRates,
+    octopusapi.const.Rate.ECO7_DAY: APIList.ElectricityDayUnitRates,
+    octopusapi.const.Rate.ECO7_NIGHT: APIList.ElectricityNightUnitRates,
+}
+
 
 class OctopusError(Exception):
     def __init__(self, msg):
@@ -49,17 +86,34 @@ class OctopusClient():
         self.logger.info("Initialising Octopus API Client")
         self._session = requests.Session()
         self._api = Octopus
+        # Number of API requests which may be in flight at the same time
+        self.set_max_workers(4)
+        # Optional local store used as a cache for consumption and rates
+        self._store = None
+        # Optional limit on the rate of API requests, shared by every concurrent request
+        self._limiter = None
+        # Whether long consumption and rates queries are split into shards fetched concurrently
+        self._sharded = False
+        # Parsed responses from endpoints which rarely change, revalidated on each call
+        self._responses = conditional.ResponseCache()
+        # Whether consumption and rates rows are parsed lazily as they are read
+        self._lazy = False
+        # UTC times of the Economy 7 night register
+        self._night_window = pricing.NIGHT
+        # GraphQL client for live telemetry, created when it is first used
+        self._kraken = None
+        self._graphql_url = None
         # Octopus API uses the API key as user and accepts any value as the password
         self._user = apikey
         self._passwd = "anything"
         # If an account number if provided then check for an API key and then get details
         if account is not None and apikey is None:
-            raise OctopusError("Account provided without API key.")            
+            raise OctopusError("Account provided without API key.")
         if self._user:
             self._api.arguments.account = account
             self._get_account_information()
             self._account_info.regionid = self._validate_mpan()
-            self.logger.info("Grid Supply Region is %s", self._account_info.regionid.value)               
+            self.logger.info("Grid Supply Region is %s", self._account_info.regionid.value)
         # If no account number then check for a postcode and if provided set the regionid
         elif postcode:
             self._api.parameters.postcode = postcode
@@ -92,8 +146,8 @@ class OctopusClient():
         for agreement in meter_point.agreements:
             if self._is_current(agreement):
                 self.logger.info("Current Gas tariff is : %s", agreement.tariff_code)
-                self._account_info.gas_tariff = agreement.tariff_code             
-                
+                self._account_info.gas_tariff = agreement.tariff_code
+
     def _parse_electricity_meterpoint(self, meter_point) -> None:
         if meter_point.is_export:
             self._api.arguments.export_mpan = meter_point.mpan
@@ -108,15 +162,43 @@ class OctopusClient():
             for agreement in meter_point.agreements:
                 if self._is_current(agreement):
                     self.logger.info("Current Electricity tariff is : %s", agreement.tariff_code)
-                    self._account_info.import_tariff = agreement.tariff_code                         
-                                    
+                    self._account_info.import_tariff = agreement.tariff_code
+            self._account_info.import_registers = self._registers(
+                meter_point, getattr(self._account_info, "import_tariff", None))
+            self.logger.info("Import registers are: %s", ", ".join(rate.value for rate in self._account_info.import_registers))
+
+    @staticmethod
+    def _registers(meter_point, tariff_code: str = None) -> tuple:
+        """Return the registers of an electricity meter point from its meters and its tariff code."""
+        rates = {entry.value for entry in octopusapi.const.Rate}
+        registers = {octopusapi.const.Rate(register.rate) for meter in meter_point.meters
+                     for register in meter.registers or [] if register.is_settlement_register and register.rate in rates}
+        # Dual register tariff codes start E-2R
+        if (tariff_code or "").startswith("E-2R") or octopusapi.const.Rate.ECO7_NIGHT in registers:
+            return (octopusapi.const.Rate.ECO7_DAY, octopusapi.const.Rate.ECO7_NIGHT)
+        return (octopusapi.const.Rate.STANDARD,)
+
+    def _is_dual_register(self, tariff_code: str) -> bool:
+        """Return whether a tariff has separate day and night unit rates."""
+        if tariff_code.startswith("E-2R"):
+            return True
+        return (tariff_code == getattr(self._account_info, "import_tariff", None)
+                and octopusapi.const.Rate.ECO7_NIGHT in getattr(self._account_info, "import_registers", ()))
+
+    def refresh_account(self) -> None:
+        """Query the account again to pick up any change of meters or tariffs."""
+        self._get_account_information()
+        self._account_info.regionid = self._validate_mpan()
+
     def _get_account_information(self) -> None:
         """Populate information required for other API calls when provided an account ID and API key."""
-        self._account_info = self._call_api(api_name=APIList.Account)
+        # The parsed account may be shared through the response cache, so the tariffs, registers and
+        # region found for this client are kept on a copy of it
+        self._account_info = copy.copy(self._call_api(api_name=APIList.Account))
         # Get the information for the first property in the account only
         for property in self._account_info.properties:
             for meter_point in property.electricity_meter_points:
-                self._parse_electricity_meterpoint(meter_point)                
+                self._parse_electricity_meterpoint(meter_point)
             for meter_point in property.gas_meter_points:
                 self._parse_gas_meterpoint(meter_point)
 
@@ -150,16 +232,70 @@ class OctopusClient():
             active = dateutil.parser.parse(active)
         self._api.parameters.tariffs_active_at = datetime.strftime(active, DatetimeFormat.OCTOPUSDATETIME.value)
 
+    def set_max_workers(self, workers: int) -> None:
+        """Set the number of API requests which may run concurrently."""
+        self._max_workers = max(1, workers)
+        # Shared by every thread so that sharded calls made inside a concurrent fetch stay within the limit
+        self._requests = threading.BoundedSemaphore(self._max_workers)
+        # Keep enough pooled connections open for every concurrent request to reuse one
+        self._session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=self._max_workers))
+
+    def set_store(self, store: "Store | None") -> None:
+        """Use a local store to cache consumption and rates fetched concurrently, None stops using it."""
+        self._store = store
+
+    def set_rate_limit(self, rate: float | None, burst: int = 1) -> None:
+        """Limit API requests to a number per second, allowing bursts of up to burst requests, None removes the limit."""
+        from octopusapi.ratelimit import TokenBucket  # pylint: disable=import-outside-toplevel
+        self._limiter = None if rate is None else TokenBucket(rate, burst)
+        self._kraken = None
+
+    def set_sharding(self, sharded: bool = True) -> None:
+        """Split long consumption and rates queries into time shards which are fetched concurrently."""
+        self._sharded = sharded
+
+    def set_response_cache(self, size: int | None = 256) -> None:
+        """Keep up to size responses from endpoints which rarely change and revalidate them, None fetches them every time."""
+        self._responses = None if size is None else conditional.ResponseCache(size)
+
+    def set_lazy(self, lazy: bool = True) -> None:
+        """Return consumption and rates as lazy views of the JSON rows, only parsing times when they are read."""
+        self._lazy = lazy
+
+    def set_night_window(self, start: str | time, end: str | time) -> None:
+        """Set the UTC start and end times of the Economy 7 night register, for example "00:30" and "07:30"."""
+        self._night_window = tuple(time.fromisoformat(value) if isinstance(value, str) else value
+                                   for value in (start, end))
+
+    def set_graphql_url(self, url: str | None) -> None:
+        """Use another URL for the GraphQL API, for example a local stand-in, None uses the Octopus API."""
+        self._graphql_url = url
+        self._kraken = None
+
+    def set_rest_url(self, url: str | None) -> None:
+        """Use another URL for the REST API, for example a local stand-in, None uses the Octopus API."""
+        # The settings are shared with the Octopus API configuration and only the URL builders differ
+        self._api = Octopus if url is None else replace(Octopus, url=url.rstrip("/"))
+        if self._responses is not None:
+            self._responses.clear()
+
     def set_page_size(self, size: int) -> None:
         """Set the page size for any queries."""
         self._api.parameters.page_size = size
 
-    def set_group_by(self, time: str) -> None:
-        """Set the group by interval for any queries."""
+    def set_group_by(self, time: str | None) -> None:
+        """Set the group by interval for any queries, None returns half hourly data."""
+        if time is None:
+            self._api.parameters.group_by = None
         for grouping in octopusapi.const.Group:
             if time == grouping.value:
                 self._api.parameters.group_by = time
 
+    @property
+    def rest_url(self) -> str:
+        """The URL of the REST API in use."""
+        return self._api.url
+
     @property
     def account_number(self) -> str:
         """The account number property."""
@@ -172,11 +308,16 @@ class OctopusClient():
             ago (int): number of days ago for the start of the period
             days (int): number of days ago for the end of the period
         """
+        window = self._window(ago, days)
+        self._api.parameters.period_from = window["period_from"]
+        self._api.parameters.period_to = window["period_to"]
+
+    def _window(self, ago: int, days: int) -> dict:
+        """Return the period_from and period_to parameters for a period without changing the client settings."""
         start = datetime.combine(date.today() - timedelta(days=ago), datetime.min.time())
         end = start + timedelta(days=days) - timedelta(minutes=5)
-        # print("setting", start,end)
-        self.set_period_from(start)
-        self.set_period_to(end)
+        return {"period_from": datetime.strftime(start, DatetimeFormat.OCTOPUSDATETIME.value),
+                "period_to": datetime.strftime(end, DatetimeFormat.OCTOPUSDATETIME.value)}
 
     def get_gas_consumption(self, ago: int = 7, days: int = 7) -> dict:
         """Get gas consumption information."""
@@ -184,14 +325,14 @@ class OctopusClient():
         response = {'results': [], 'count': 0}
         meters = (meter for property in self._account_info.properties
                     for meter_point in property.gas_meter_points
-                    for meter in meter_point.meters)        
-        for meter in meters:                    
+                    for meter in meter_point.meters)
+        for meter in meters:
             self._api.arguments.gas_serial_number = meter.serial_number
             results = self._call_api(api_name=APIList.GasConsumption)
             if results.count > 0:
                 response['results'] += results.results
                 response['count'] += results.count
-        return response['results']
+        return frames.ConsumptionList(response['results'])
 
     def get_electricity_consumption_byrange(self, ago: int = 1, days: int = 1, daily: bool = True) -> dict:
         """Get electricity consumption information.
@@ -206,12 +347,12 @@ class OctopusClient():
         self._set_startend(ago, days)
         self._api.parameters.group_by = None
         consumption = self.get_electricity_consumption(ago=ago, days=days)
-        price_range = self.price_ranges
-        price_dict = {price.valid_from: price for price in self.import_prices}        
+        classify = self.tariff_schedule.classify
+        price_dict = {price.valid_from: price for price in self.import_prices}
         #pprint.pprint(price_dict)
         currentcost = iter(sorted(price_dict.keys()))
         coststart = next(currentcost)
-        usage = defaultdict(dict)        
+        usage = frames.RangeDict()
         for entry in consumption:
             if daily:
                 date = entry.interval_start.replace(hour=0, minute=0, second=0, microsecond=0,tzinfo=timezone.utc)
@@ -221,25 +362,50 @@ class OctopusClient():
             while price_dict[coststart].valid_to <= entry.interval_start:
                 coststart = next(currentcost)
             if price_dict[coststart].valid_to >= entry.interval_end:
-                pricetype = price_range[price_dict[coststart].value_inc_vat].value
+                pricetype = classify(entry.interval_start).value
                 usage[date][pricetype] = round(usage[date].setdefault(pricetype, 0) + entry.consumption, 3)
         return usage
 
-    
+    def get_electricity_consumption_rollup(self, ago: int = 7, days: int = 7,
+                                           groups: tuple = tuple(octopusapi.const.Group),
+                                           split: bool = False) -> dict:
+        """Get electricity consumption grouped by several periods from a single half hourly query.
+
+        Args:
+            ago (int, optional): number of days ago for the start of the period. Defaults to 7.
+            days (int, optional): number of days in the period. Defaults to 7.
+            groups (tuple, optional): The groupings required. Defaults to all of them.
+            split (bool, optional): Split consumption into peak, offpeak and standard. Defaults to False.
+
+        Returns:
+            dict: A list of usagerollup entries for each grouping
+        """
+        group_by = self._api.parameters.group_by
+        self._api.parameters.group_by = None
+        try:
+            consumption = self.get_electricity_consumption(ago=ago, days=days)
+        finally:
+            self._api.parameters.group_by = group_by
+        from octopusapi import aggregate  # pylint: disable=import-outside-toplevel
+        classify = None
+        if split:
+            classify = self.tariff_schedule.classify
+        return aggregate.rollup_all(consumption, groups, classify)
+
     def get_electricity_consumption(self, ago: int = 7, days: int = 7) -> dict:
         """Get electricity consumption information."""
         self._set_startend(ago, days)
         response = {'results': [], 'count': 0}
         meters = (meter for property in self._account_info.properties
             for meter_point in property.electricity_meter_points
-            for meter in meter_point.meters if not meter_point.is_export)  
+            for meter in meter_point.meters if not meter_point.is_export)
         for meter in meters:
             self._api.arguments.electricity_serial_number = meter.serial_number
             results = self._call_api(api_name=APIList.ElectricityConsumption)
             if results.count > 0:
                 response['results'] += results.results
                 response['count'] += results.count
-        return response['results'] 
+        return frames.ConsumptionList(response['results'])
 
 
     def get_electricity_export(self, ago: int = 7, days: int = 7) -> dict | None:
@@ -248,58 +414,52 @@ class OctopusClient():
         response = {'results': [], 'count': 0}
         meters = (meter for property in self._account_info.properties
             for meter_point in property.electricity_meter_points
-            for meter in meter_point.meters if meter_point.is_export)  
-        for meter in meters:        
+            for meter in meter_point.meters if meter_point.is_export)
+        for meter in meters:
             self._api.arguments.export_serial_number = meter.serial_number
             results = self._call_api(api_name=APIList.ElectricityExport)
             if results.count > 0:
                 response['results'] += results.results
                 response['count'] += results.count
-        return response['results']
+        return frames.ConsumptionList(response['results'])
+
 
+    def get_unit_rates(self) -> list:
+        """Get the unit rates for the current tariff and period.
+
+        Day and night rates for a dual register tariff are fetched concurrently and combined into one
+        series which switches between them at the night register times.
+        """
+        if not self._is_dual_register(self._api.arguments.tariff_code or ""):
+            return self.get_standard_unit_rates()
+        calls = [(REGISTER_RATES[rate], None, None)
+                 for rate in (octopusapi.const.Rate.ECO7_DAY, octopusapi.const.Rate.ECO7_NIGHT)]
+        return frames.RateList(self._combine_results(calls, self._fetch_concurrently(calls)))
 
     def get_standard_unit_rates(self) -> octopusapi.const.rates:
-        return self._call_api(api_name=APIList.ElectricityStandardUnitRates).results
-    
+        return frames.RateList(self._call_api(api_name=APIList.ElectricityStandardUnitRates).results)
+
     def get_gas_standard_unit_rates(self) -> octopusapi.const.rates:
-        return self._call_api(api_name=APIList.GasStandardUnitRates).results
-        
+        return frames.RateList(self._call_api(api_name=APIList.GasStandardUnitRates).results)
+
     def get_electricity_prices(self, ago: int = 7) -> octopusapi.const.rates:
         """Calculate the total cost for electricity for a day."""
         self.import_product
         self._set_startend(ago, ago)
         # Get the unit rates and store the value for each interval
-        return self.get_standard_unit_rates()
-
-    def _calculate_price(self, rates, amount) -> dict: 
-        price = {}
-        cost_iterator = iter(sorted(rates.keys()))
-        coststart = next(cost_iterator)
-        current_cost = coststart        
-        for interval_start in sorted(amount.keys()):
-            # Iterate over the cost data until we find an interval that starts after the current time        
-            # use the prior interval for the cost
-            while interval_start >= coststart:
-                current_cost = coststart
-                try:
-                    coststart = next(cost_iterator)
-                except StopIteration:
-                    break
-            day = interval_start.date()
-            # Then multiply the consumption by the rate to get the cost
-            price[day] = price.setdefault(day, 0) + round(round(amount[interval_start].consumption, 2)
-                                                        * rates[current_cost], 3)
-            # print(interval_start, amount[interval_start].consumption, rates[current_cost] )
-        return price
+        return self.get_unit_rates()
+
+    def _calculate_price(self, rates, amount) -> dict:
+        return frames.CostDict(pricing.daily_cost(rates, amount))
 
     def calculate_electricity_cost(self, ago: int = 7) -> dict:
         """Calculate the total cost for electricity for a day."""
         self.import_product
         self._set_startend(ago, ago)
         # Get the unit rates and store the value for each interval
-        rates = {entry.valid_from: entry.value_inc_vat for entry in self.get_standard_unit_rates()}
+        rates = {entry.valid_from: entry.value_inc_vat for entry in self.get_unit_rates()}
         # Get the consumption values and store the values for each interval
-        consumption = {entry.interval_start: entry for entry in self.get_electricity_consumption(ago, ago)}   
+        consumption = {entry.interval_start: entry for entry in self.get_electricity_consumption(ago, ago)}
         return self._calculate_price(rates,consumption)
 
     def calculate_electricity_gain(self, ago: int = 7) -> dict:
@@ -311,7 +471,493 @@ class OctopusClient():
         # Get the consumption values and store the values for each interval
         export = {entry.interval_start: entry for entry in self.get_electricity_export(ago, ago)}
         # Calculate the costs based on the rates and the consumption
-        return self._calculate_price(rates,export)        
+        return self._calculate_price(rates,export)
+
+    @property
+    def kraken(self):
+        """The client for the Kraken GraphQL API, which shares the session and rate limit of this client."""
+        if self._kraken is None:
+            from octopusapi.graphql import KrakenClient  # pylint: disable=import-outside-toplevel
+            self._kraken = KrakenClient(self._user, self.account_number, self._graphql_url,
+                                        self._session, self._limiter)
+        return self._kraken
+
+    def get_live_consumption(self, since: datetime = None,
+                             grouping: octopusapi.const.TelemetryGrouping = octopusapi.const.TelemetryGrouping.ONE_MINUTE
+                             ) -> list:
+        """Get the live consumption from every smart meter device on the account.
+
+        Readings come from the Home Mini telemetry in the GraphQL API, so they are available within
+        seconds rather than the next day. They are added to the store if one is set, keyed by device id.
+
+        Args:
+            since (datetime, optional): Only intervals starting after this time. Defaults to the last hour.
+            grouping (TelemetryGrouping, optional): The length of each interval. Defaults to one minute.
+
+        Returns:
+            list: usagedata entries in kWh
+        """
+        results = frames.ConsumptionList()
+        for device in self.kraken.devices():
+            readings = self.kraken.readings(device, since, grouping)
+            if self._store is not None:
+                self._store.upsert_consumption(device, readings)
+            results += readings
+        return results
+
+    def get_bill(self, days: int = 30, gas_units: str = "kWh",
+                 calorific_value: float = None) -> "bill.Bill":
+        """Rebuild the bill for each of the last number of days for electricity import, export and gas.
+
+        Consumption, unit rates and standing charge history for every fuel are fetched concurrently,
+        and each day is charged the standing charge which applied on that day.
+
+        Args:
+            days (int, optional): The number of days ending yesterday. Defaults to 30.
+            gas_units (str, optional): "kWh", or "m3" for a SMETS2 gas meter which reports volume. Defaults to "kWh".
+            calorific_value (float, optional): The gas calorific value in MJ/m3. Defaults to None, which uses
+                bill.GAS_CALORIFIC_VALUE.
+
+        Returns:
+            bill.Bill: The bill by day, with monthly totals available from its months property
+        """
+        # Built through a collection plan so that a bill collected with the same gas settings is identical
+        collection = plan.CollectionPlan(gas_units=gas_units, calorific_value=calorific_value)
+        return self.collect(collection.add(plan.Output.BILL, days))[plan.Output.BILL]
+
+    def get_energy_flows(self, days: int = 30, generation: list = None) -> "align.Aligned":
+        """Join import, export and any generation for each of the last number of days onto one half hour grid.
+
+        Consumption and unit rates for import and export are fetched concurrently.
+
+        Args:
+            days (int, optional): The number of days ending yesterday. Defaults to 30.
+            generation (list, optional): Generation readings with interval_start and consumption, for example
+                from an inverter. Defaults to None.
+
+        Returns:
+            align.Aligned: The net flow, self consumption and net cost of each half hour
+        """
+        from octopusapi import aggregate, align  # pylint: disable=import-outside-toplevel
+        data = self._fetch_datasets({dataset: days for dataset in (
+            plan.Dataset.IMPORT_CONSUMPTION, plan.Dataset.EXPORT_CONSUMPTION,
+            plan.Dataset.IMPORT_RATES, plan.Dataset.EXPORT_RATES)})
+        first, today = date.today() - timedelta(days=days), date.today()
+        return align.align(data[plan.Dataset.IMPORT_CONSUMPTION], data[plan.Dataset.EXPORT_CONSUMPTION], generation,
+                           data[plan.Dataset.IMPORT_RATES], data[plan.Dataset.EXPORT_RATES],
+                           datetime(first.year, first.month, first.day, tzinfo=aggregate.LONDON),
+                           datetime(today.year, today.month, today.day, tzinfo=aggregate.LONDON))
+
+    def future_rates(self, hours: int = 48, export: bool = False) -> list:
+        """Return the import, or export, unit rates published for the coming hours."""
+        now = datetime.now(timezone.utc)
+        window = {"period_from": now.strftime(DatetimeFormat.OCTOPUSDATETIME.value),
+                  "period_to": (now + timedelta(hours=hours)).strftime(DatetimeFormat.OCTOPUSDATETIME.value)}
+        tariff_code = self._account_info.export_tariff if export else self._account_info.import_tariff
+        return self._call_api(APIList.ElectricityStandardUnitRates,
+                              self._tariff_arguments(tariff_code), window).results
+
+    def published_rates(self, start: datetime, end: datetime, tariff_code: str = None, export: bool = False) -> list:
+        """Return the unit rates published for a period, reusing the parsed rates if they have not changed.
+
+        The request is conditional on the rates returned last time for the same period, so polling for
+        newly published rates only transfers and parses them when they change.
+
+        Args:
+            start (datetime): The start of the period
+            end (datetime): The end of the period
+            tariff_code (str, optional): The tariff. Defaults to the account's import or export tariff.
+            export (bool, optional): Use the account's export tariff. Defaults to False.
+
+        Returns:
+            list: The unit rates in the order returned by the API
+        """
+        if tariff_code is None:
+            tariff_code = self._account_info.export_tariff if export else self._account_info.import_tariff
+        window = {"period_from": start.astimezone(timezone.utc).strftime(DatetimeFormat.OCTOPUSDATETIME.value),
+                  "period_to": end.astimezone(timezone.utc).strftime(DatetimeFormat.OCTOPUSDATETIME.value)}
+        api_name = APIList.ElectricityStandardUnitRates
+        url = self._api_url(api_name, self._tariff_arguments(tariff_code), window)
+        if self._responses is None:
+            return self._call_unsharded(api_name, self._tariff_arguments(tariff_code), window).results
+        return self._call_conditional(api_name, url).results
+
+    def optimise_battery(self, parameters: "battery.Battery", hours: int = 48) -> "battery.Schedule":
+        """Plan battery charging and discharging over the unit rates published for the coming hours.
+
+        Household import and export are forecast from the same time of day over the last week.
+
+        Args:
+            parameters (battery.Battery): The battery to schedule
+            hours (int, optional): The number of hours to plan. Defaults to 48.
+
+        Returns:
+            battery.Schedule: The lowest cost schedule
+        """
+        from octopusapi import battery  # pylint: disable=import-outside-toplevel
+        import_rates = self.future_rates(hours)
+        export_rates = self.future_rates(hours, export=True) if getattr(self._account_info, "export_tariff", None) else []
+        now = datetime.now(timezone.utc)
+        start = now.replace(minute=30 if now.minute >= 30 else 0, second=0, microsecond=0)
+        series = battery.slot_series(import_rates, export_rates, start=start)
+        series.demand = battery.forecast(self.fetch(plan.Dataset.IMPORT_CONSUMPTION, 7), series.starts)
+        series.surplus = battery.forecast(self.fetch(plan.Dataset.EXPORT_CONSUMPTION, 7), series.starts)
+        return battery.optimise(series, parameters)
+
+    def backtest_battery(self, parameters: "battery.Battery", days: int = 365) -> "battery.Schedule":
+        """Replay the account's history to see what a battery would have saved.
+
+        Args:
+            parameters (battery.Battery): The battery to simulate
+            days (int, optional): The number of days of history to replay. Defaults to 365.
+
+        Returns:
+            battery.Schedule: The schedule with its cost and the cost without the battery
+        """
+        from octopusapi import battery  # pylint: disable=import-outside-toplevel
+        data = self._fetch_datasets({dataset: days for dataset in (
+            plan.Dataset.IMPORT_RATES, plan.Dataset.EXPORT_RATES,
+            plan.Dataset.IMPORT_CONSUMPTION, plan.Dataset.EXPORT_CONSUMPTION)})
+        start = datetime.combine(date.today() - timedelta(days=days), datetime.min.time()).astimezone(timezone.utc)
+        series = battery.slot_series(data[plan.Dataset.IMPORT_RATES], data[plan.Dataset.EXPORT_RATES],
+                                     data[plan.Dataset.IMPORT_CONSUMPTION], data[plan.Dataset.EXPORT_CONSUMPTION],
+                                     start=start, end=start + timedelta(days=days))
+        return battery.backtest(series, parameters)
+
+    def cheapest_windows(self, appliances: list, rates: list = None) -> dict:
+        """Find the cheapest times to run each of several appliances.
+
+        Args:
+            appliances (list): windows.Appliance entries describing each load
+            rates (list, optional): Unit rates already fetched. Defaults to the future import rates.
+
+        Returns:
+            dict: The windows.Window found for each appliance name
+        """
+        from octopusapi import windows  # pylint: disable=import-outside-toplevel
+        return windows.cheapest_windows(rates or self.future_rates(), appliances,
+                                        after=datetime.now(timezone.utc))
+
+    def compare_tariffs(self, days: int = 365, products: list = None,
+                        brand: str = "OCTOPUS_ENERGY") -> list:
+        """Simulate the cost of the account's electricity consumption on other tariffs.
+
+        Consumption is fetched once and each product's unit rates and standing charges for the
+        account's region are fetched concurrently.
+
+        Args:
+            days (int, optional): The number of days of consumption to simulate. Defaults to 365.
+            products (list, optional): The product codes to compare. Defaults to every import product
+                currently available from the brand.
+            brand (str, optional): The brand used when discovering products. Defaults to "OCTOPUS_ENERGY".
+
+        Returns:
+            list: compare.TariffQuote entries, cheapest first
+        """
+        from octopusapi import compare  # pylint: disable=import-outside-toplevel
+        consumption = pricing.ConsumptionSeries(self.fetch(plan.Dataset.IMPORT_CONSUMPTION, days))
+        if products is None:
+            products = [entry.code for entry in self._call_api(api_name=APIList.Products).results
+                        if entry.direction == octopusapi.const.Direction.IMPORT.value
+                        and entry.brand == brand and not entry.is_business]
+        details = self._fetch_concurrently([(APIList.Product, {"product_code": code}, None) for code in products])
+        tariffs = {}
+        for data in details:
+            tariff_code = compare.region_tariff(data, self._account_info.regionid)
+            if tariff_code is not None:
+                tariffs[tariff_code] = data
+        window = self._window(days, days)
+        calls = [(api_name, {"product_code": data.code, "tariff_code": tariff_code}, window)
+                 for tariff_code, data in tariffs.items()
+                 for api_name in (APIList.ElectricityStandardUnitRates, APIList.ElectricityStandingCharges)]
+        self.logger.info("Comparing %s tariffs", len(tariffs))
+        results = iter(self._fetch_concurrently(calls))
+        simulation = {tariff_code: (data, tariff_code, next(results).results, next(results).results)
+                      for tariff_code, data in tariffs.items()}
+        return compare.simulate(consumption, simulation)
+
+    def list_products(self, available_at: str | datetime = None) -> list:
+        """Return every product in the catalogue, fetching the pages of the listing concurrently.
+
+        Args:
+            available_at (str | datetime, optional): List the products available at this time. Defaults to now.
+        """
+        if isinstance(available_at, str):
+            available_at = dateutil.parser.parse(available_at)
+        # Without a time the API lists the products available now, and the URL stays the same from one
+        # call to the next so the cached listing can be revalidated
+        if available_at is not None:
+            available_at = datetime.strftime(available_at, DatetimeFormat.OCTOPUSDATETIME.value)
+        # Clear the product filters so that every product is listed
+        parameters = {"page": 1, "is_prepay": None, "is_green": None, "is_tracker": None, "is_business": None,
+                      "available_at": available_at}
+        first = self._call_api(APIList.Products, None, parameters, False)
+        listing = list(first.results)
+        if first.next and listing:
+            pages = math.ceil(first.count / len(listing))
+            calls = [(APIList.Products, None, {**parameters, "page": page}, False) for page in range(2, pages + 1)]
+            for result in self._fetch_concurrently(calls):
+                listing += result.results
+        return listing
+
+    def crawl_products(self, catalogue: "Catalogue" = None, available_at: str | datetime = None) -> "Catalogue":
+        """Refresh a local catalogue of products and their tariffs for every region.
+
+        Only products which are new, whose listing has changed or whose details are older than
+        catalogue.MAX_AGE have their details fetched. The details are fetched concurrently.
+
+        Args:
+            catalogue (Catalogue, optional): The catalogue to refresh. Defaults to a new in memory catalogue.
+            available_at (str | datetime, optional): Crawl the products available at this time. Defaults to now.
+
+        Returns:
+            Catalogue: The refreshed catalogue
+        """
+        from octopusapi.catalogue import Catalogue  # pylint: disable=import-outside-toplevel
+        catalogue = catalogue or Catalogue()
+        listing = self.list_products(available_at)
+        stale = catalogue.stale(listing)
+        self.logger.info("Catalogue lists %s products, fetching details for %s", len(listing), len(stale))
+        details = self._fetch_concurrently([(APIList.Product, {"product_code": entry.code}, None) for entry in stale])
+        catalogue.update(listing, details)
+        return catalogue
+
+    def _tariff_arguments(self, tariff_code: str) -> dict:
+        """Return the API arguments for a tariff code without changing the client settings."""
+        return {"tariff_code": tariff_code, "product_code": tariff_code[5:-2]}
+
+    def _dataset_calls(self, dataset: plan.Dataset, days: int, since: datetime = None, until: datetime = None) -> list:
+        """Return the API calls needed to fetch a dataset covering the last number of days,
+        or everything from since until now, or until until, if it is provided.
+        """
+        window = self._window(days, days)
+        if since is not None:
+            window = {"period_from": since.astimezone(timezone.utc).strftime(DatetimeFormat.OCTOPUSDATETIME.value),
+                      "period_to": (until or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime(
+                          DatetimeFormat.OCTOPUSDATETIME.value)}
+        properties = self._account_info.properties
+        if dataset is plan.Dataset.IMPORT_CONSUMPTION:
+            return [(APIList.ElectricityConsumption,
+                     {"mpan": meter_point.mpan, "electricity_serial_number": meter.serial_number},
+                     {**window, "group_by": None})
+                    for property in properties for meter_point in property.electricity_meter_points
+                    for meter in meter_point.meters if not meter_point.is_export]
+        if dataset is plan.Dataset.EXPORT_CONSUMPTION:
+            return [(APIList.ElectricityExport,
+                     {"export_mpan": meter_point.mpan, "export_serial_number": meter.serial_number},
+                     {**window, "group_by": None})
+                    for property in properties for meter_point in property.electricity_meter_points
+                    for meter in meter_point.meters if meter_point.is_export]
+        if dataset is plan.Dataset.GAS_CONSUMPTION:
+            return [(APIList.GasConsumption,
+                     {"mprn": meter_point.mprn, "gas_serial_number": meter.serial_number},
+                     {**window, "group_by": None})
+                    for property in properties for meter_point in property.gas_meter_points
+                    for meter in meter_point.meters]
+        tariff_code = {
+            plan.Dataset.IMPORT_RATES: "import_tariff",
+            plan.Dataset.EXPORT_RATES: "export_tariff",
+            plan.Dataset.IMPORT_STANDING_CHARGES: "import_tariff",
+            plan.Dataset.GAS_RATES: "gas_tariff",
+            plan.Dataset.GAS_STANDING_CHARGES: "gas_tariff",
+        }[dataset]
+        tariff_code = getattr(self._account_info, tariff_code, None)
+        if tariff_code is None:
+            return []
+        api_name = {
+            plan.Dataset.IMPORT_STANDING_CHARGES: APIList.ElectricityStandingCharges,
+            plan.Dataset.GAS_RATES: APIList.GasStandardUnitRates,
+            plan.Dataset.GAS_STANDING_CHARGES: APIList.GasStandingCharges,
+        }.get(dataset)
+        if api_name is not None:
+            return [(api_name, self._tariff_arguments(tariff_code), window)]
+        if self._is_dual_register(tariff_code):
+            # Day and night rates are fetched together and combined by _combine_results
+            return [(REGISTER_RATES[rate], self._tariff_arguments(tariff_code), window)
+                    for rate in (octopusapi.const.Rate.ECO7_DAY, octopusapi.const.Rate.ECO7_NIGHT)]
+        return [(APIList.ElectricityStandardUnitRates, self._tariff_arguments(tariff_code), window)]
+
+    def fetch(self, dataset: plan.Dataset | str, days: int = 7, since: datetime = None,
+              until: datetime = None) -> list:
+        """Fetch a dataset for every relevant meter or tariff concurrently.
+
+        Args:
+            dataset (plan.Dataset | str): The data required
+            days (int, optional): The number of days ending today. Defaults to 7.
+            since (datetime, optional): Fetch everything from this time until now instead. Defaults to None.
+            until (datetime, optional): Fetch from since until this time rather than now, for example to
+                include rates already published for later today. Defaults to None.
+
+        Returns:
+            list: The combined results
+        """
+        dataset = plan.Dataset(dataset)
+        calls = self._dataset_calls(dataset, days, since, until)
+        results = self._combine_results(calls, self._fetch_concurrently(calls))
+        if dataset.value.endswith(("rates", "charges")):
+            return frames.RateList(results)
+        return frames.ConsumptionList(results)
+
+    def _combine_results(self, calls: list, results: list) -> list:
+        """Combine the results of the calls for one dataset.
+
+        Day and night unit rates are combined into a single series of rates which switches between them
+        at the night register times, so that Economy 7 is priced in the same way as any other tariff.
+        """
+        combined = []
+        registers = {}
+        for (api_name, _, parameters), result in zip(calls, results):
+            if api_name in (APIList.ElectricityDayUnitRates, APIList.ElectricityNightUnitRates):
+                registers.setdefault(api_name, []).extend(result.results)
+                window = {"period_from": self._api.parameters.period_from,
+                          "period_to": self._api.parameters.period_to, **(parameters or {})}
+            else:
+                combined += result.results
+        if registers:
+            start, end = self._parse_window(window["period_from"], window["period_to"])
+            combined = pricing.register_rates(registers.get(APIList.ElectricityDayUnitRates, []),
+                                              registers.get(APIList.ElectricityNightUnitRates, []),
+                                              start, end, self._night_window) + combined
+        return combined
+
+    def iter_dataset(self, dataset: plan.Dataset | str, days: int = 7, since: datetime = None):
+        """Fetch a dataset and yield each page of results as it arrives.
+
+        Args:
+            dataset (plan.Dataset | str): The data required
+            days (int, optional): The number of days ending today. Defaults to 7.
+            since (datetime, optional): Fetch everything from this time until now instead. Defaults to None.
+
+        Yields:
+            tuple: The arguments identifying the meter or tariff, and the results from one page
+        """
+        calls = self._dataset_calls(plan.Dataset(dataset), days, since)
+        if any(api_name in (APIList.ElectricityDayUnitRates, APIList.ElectricityNightUnitRates)
+               for api_name, _, _ in calls):
+            # Day and night rates have to be combined, and rates are small enough to fetch whole
+            yield calls[0][1], self._combine_results(calls, self._fetch_concurrently(calls))
+            return
+        for api_name, arguments, parameters in calls:
+            for results in self._iter_api(api_name, arguments, parameters):
+                yield arguments, results
+
+    def collect(self, collection: plan.CollectionPlan) -> dict:
+        """Fetch the data needed by a collection plan concurrently and derive each of its outputs.
+
+        Args:
+            collection (plan.CollectionPlan): The outputs required
+
+        Returns:
+            dict: The result for each plan.Output
+        """
+        return collection.derive(self._fetch_datasets(collection.fetches))
+
+    def _fetch_datasets(self, fetches: dict) -> dict:
+        """Fetch several datasets concurrently.
+
+        Args:
+            fetches (dict): The number of days required for each plan.Dataset
+
+        Returns:
+            dict: The combined results for every plan.Dataset, empty where it was not fetched
+        """
+        calls = []
+        datasets = []
+        for dataset, days in fetches.items():
+            for call in self._dataset_calls(dataset, days):
+                calls.append(call)
+                datasets.append(dataset)
+        self.logger.info("Fetching %s datasets requires %s API calls", len(fetches), len(calls))
+        results = self._fetch_concurrently(calls)
+        data = {dataset: [] for dataset in plan.Dataset}
+        for dataset in fetches:
+            selected = [index for index, entry in enumerate(datasets) if entry is dataset]
+            data[dataset] = self._combine_results([calls[index] for index in selected],
+                                                  [results[index] for index in selected])
+        return data
+
+    def find_gaps(self, dataset: plan.Dataset | str = plan.Dataset.IMPORT_CONSUMPTION, days: int = 365,
+                  existing: dict = None) -> dict:
+        """Find the half hours missing from the consumption of each meter over the last number of days.
+
+        Args:
+            dataset (plan.Dataset | str, optional): A consumption dataset. Defaults to import consumption.
+            days (int, optional): The number of days ending today. Defaults to 365.
+            existing (dict, optional): The entries already held for each meter, keyed by "mpan/serial number".
+                Meters which are not included are read from the store if one is set, otherwise fetched.
+
+        Returns:
+            dict: The gaps.Gap entries for each meter
+        """
+        from octopusapi import gaps  # pylint: disable=import-outside-toplevel
+        return {meter: gaps.find_gaps(starts, start, end)
+                for meter, (_, starts, start, end) in self._gap_scans(dataset, days, existing).items()}
+
+    def backfill(self, dataset: plan.Dataset | str = plan.Dataset.IMPORT_CONSUMPTION, days: int = 365,
+                 existing: dict = None) -> "gaps.Backfill":
+        """Fetch only the half hours missing from the consumption of each meter.
+
+        Nearby gaps are coalesced into queries of at most one page each and every query is made
+        concurrently. Anything fetched is added to the store if one is set.
+
+        Args:
+            dataset (plan.Dataset | str, optional): A consumption dataset. Defaults to import consumption.
+            days (int, optional): The number of days ending today. Defaults to 365.
+            existing (dict, optional): The entries already held for each meter, keyed by "mpan/serial number".
+                Meters which are not included are read from the store if one is set, otherwise fetched.
+
+        Returns:
+            gaps.Backfill: The queries made, the entries fetched and the gaps which remain for each meter
+        """
+        from octopusapi import gaps  # pylint: disable=import-outside-toplevel
+        page_size = self._api.parameters.page_size or 100
+        scans = self._gap_scans(dataset, days, existing)
+        report = gaps.Backfill()
+        calls = []
+        meters = []
+        for meter, ((api_name, arguments, parameters), starts, start, end) in scans.items():
+            report.queries[meter] = gaps.coalesce(gaps.find_gaps(starts, start, end), page_size)
+            report.fetched[meter] = frames.ConsumptionList()
+            for gap in report.queries[meter]:
+                calls.append((api_name, arguments, {**parameters, **gap.window(DatetimeFormat.OCTOPUSDATETIME.value)}))
+                meters.append(meter)
+        self.logger.info("Backfilling %s meters requires %s API calls", len(scans), len(calls))
+        for meter, result in zip(meters, self._fetch_concurrently(calls)):
+            report.fetched[meter] += result.results
+        for meter, (_, starts, start, end) in scans.items():
+            found = [*starts, *(entry.interval_start for entry in report.fetched[meter])]
+            report.remaining[meter] = gaps.find_gaps(found, start, end)
+        return report
+
+    def _gap_scans(self, dataset: plan.Dataset | str, days: int, existing: dict = None) -> dict:
+        """Return the call, the interval starts present and the period covered for each meter of a dataset."""
+        dataset = plan.Dataset(dataset)
+        if not dataset.value.endswith("consumption"):
+            raise OctopusError(f"Gaps can only be found in consumption, not {dataset.value}.")
+        existing = existing or {}
+        scans = {}
+        unknown = []
+        for call in self._dataset_calls(dataset, days):
+            api_name, arguments, parameters = call
+            meter = "/".join(arguments[name] for name in STORE_METERS[api_name])
+            start, end = self._parse_window(parameters["period_from"], parameters["period_to"])
+            if meter in existing:
+                starts = [entry.interval_start for entry in existing[meter]]
+            elif self._store is not None:
+                starts = self._store.consumption(meter, start, end)["interval_start"]
+            else:
+                starts = []
+                unknown.append(meter)
+            scans[meter] = (call, starts, start, end)
+        # Meters with nothing held locally have their whole period fetched to be scanned
+        for meter, result in zip(unknown, self._fetch_concurrently([scans[meter][0] for meter in unknown])):
+            scans[meter] = (scans[meter][0], [entry.interval_start for entry in result.results], *scans[meter][2:])
+        return scans
+
+    def _parse_window(self, period_from: str, period_to: str) -> tuple:
+        """Return the period_from and period_to parameters as UTC datetimes."""
+        return tuple(datetime.strptime(value, DatetimeFormat.OCTOPUSDATETIME.value).replace(tzinfo=timezone.utc)
+                     for value in (period_from, period_to))
 
     def _delete_redundant(self, data: octopusapi.const.product) -> octopusapi.const.product:
         """Deletes entries in the product API data that is not relevant to the region ID
@@ -321,13 +967,14 @@ class OctopusClient():
                         "dual_register_electricity_tariffs",
                         "single_register_gas_tariffs",
                         "sample_quotes"]
+        # The product may be a cached response which is shared, so the regions are removed from a copy
+        data = copy.copy(data)
         for item in delete_items:
             if getattr(data, item) != {}:
-                for entry in octopusapi.const.RegionID:
-                    if entry != self._account_info.regionid:
-                        del getattr(data, item)[entry]
+                setattr(data, item, {entry: value for entry, value in getattr(data, item).items()
+                                     if entry == self._account_info.regionid})
         return data
-        
+
 
     @property
     def import_product(self) -> octopusapi.const.product:
@@ -371,55 +1018,25 @@ class OctopusClient():
     def price_ranges(self) -> dict:
         """Return a dict of prices broken down into peak/offpeak and standard."""
         self.import_product
-        data = self.get_standard_unit_rates()
-        price_list = []
-        price_dict = {}
-        within_date = False
-        for entry in data:
-            # Collect the prices for each date
-            if (entry.valid_to.date() == entry.valid_from.date()):
-                #if price_dict.get(entry.value_inc_vat) is None:
-                if entry.value_inc_vat not in price_list:
-                    price_list.append(entry.value_inc_vat)
-                within_date = True
-            else:                
-                if (within_date is False):
-                    continue
-                if entry.value_inc_vat not in price_list:                
-                    price_list.append(entry.value_inc_vat)
-                price_list.sort()
-                # Set the price labels depending on if we have 1, 2 or 3 prices per day
-                if len(price_list) == 1:
-                    price_dict[price_list[0]] = PriceType.STANDARD
-                elif len(price_list) == 2:
-                    price_dict[price_list[0]] = PriceType.OFFPEAK
-                    price_dict[price_list[1]] = PriceType.PEAK
-                elif len(price_list) == 3:
-                    price_dict[price_list[0]] = PriceType.OFFPEAK
-                    price_dict[price_list[1]] = PriceType.STANDARD
-                    price_dict[price_list[2]] = PriceType.PEAK
-                elif len(price_list) == 4:
-                    price_dict[price_list[0]] = PriceType.OFFPEAK
-                    price_dict[price_list[1]] = PriceType.OFFPEAK
-                    price_dict[price_list[2]] = PriceType.PEAK                    
-                    price_dict[price_list[3]] = PriceType.PEAK                                        
-                # Then reset the price list and start for the new date
-                price_list = []
-                if entry.value_inc_vat not in price_list:                
-                    price_list.append(entry.value_inc_vat)
-        print(price_dict)
-        return price_dict
+        return pricing.price_ranges(self.get_unit_rates())
+
+    @property
+    def tariff_schedule(self) -> "schedule.Schedule":
+        """Return the peak, off peak and standard half hours of each day inferred from the import unit rates."""
+        from octopusapi import schedule  # pylint: disable=import-outside-toplevel
+        self.import_product
+        return schedule.infer(self.get_unit_rates())
 
     @property
     def region_name(self) -> str:
         """Return the name of the region."""
         return self._account_info.regionid.value
-    
+
     @property
     def import_prices(self) -> octopusapi.const.rate:
         """Return a list of the prices over time."""
         self.import_product
-        return self.get_standard_unit_rates()
+        return self.get_unit_rates()
 
     @property
     def electricity_standing_charge(self) -> float | None:
@@ -444,7 +1061,7 @@ class OctopusClient():
     def current_import_price(self) -> float | None:
         """Get the current electricity import price."""
         self.import_product
-        for entry in self.get_standard_unit_rates():
+        for entry in self.get_unit_rates():
             if self._is_current(entry) is True:
                 return entry.value_inc_vat
         return None
@@ -468,64 +1085,258 @@ class OctopusClient():
                 return entry.value_inc_vat
         return None
 
-    def _call_api(self, api_name: octopusapi.const.Endpoint = APIList.Products) -> Callable:
-        """Initialise the arguments required to call one of the REST APIs and then call it returning the results."""
-        self.logger.info("Calling Octopus API: %s", api_name.name)        
+    def relay(self, api_name: octopusapi.const.Endpoint, path: str) -> bytes:
+        """Return the undecoded body of a request to the REST API, for example to pass it on to another client.
+
+        Args:
+            api_name (Endpoint): The endpoint the path belongs to, which decides whether the API key is sent
+            path (str): The path and query string, for example "/v1/products/?is_green=true"
+        """
+        if api_name.value.auth is True and self._user is None:
+            raise APIKeyError(api_name)
+        authorisation = HTTPBasicAuth(self._user, self._passwd) if api_name.value.auth else None
+        return self._get(f"{self._api.url}{path}", authorisation).content
+
+    def _call_api(self, api_name: octopusapi.const.Endpoint = APIList.Products,
+                  arguments: dict = None, parameters: dict = None, follow: bool = True) -> Callable:
+        """Initialise the arguments required to call one of the REST APIs and then call it returning the results.
+
+        Any arguments or parameters passed override the client settings for this call only, which allows
+        several calls to be made concurrently. If follow is False only the first page is returned.
+        """
+        if follow and self._sharded and (api_name in STORE_METERS or api_name in STORE_RATES):
+            apiparms = replace(self._api.parameters, **parameters) if parameters else self._api.parameters
+            if apiparms.period_from is not None and apiparms.period_to is not None:
+                return self._call_sharded(api_name, arguments, parameters)
+        return self._call_unsharded(api_name, arguments, parameters, follow)
+
+    def _call_sharded(self, api_name: octopusapi.const.Endpoint, arguments: dict = None, parameters: dict = None):
+        """Call a consumption or rates API by splitting its period into shards which are fetched concurrently.
+
+        The first page is fetched on its own to find the number of results. The rest of the period is
+        then split into shards of about one page each and the shards are merged back in order.
+        """
+        parameters = parameters or {}
+        apiparms = replace(self._api.parameters, **parameters)
+        start, end = self._parse_window(apiparms.period_from, apiparms.period_to)
+        first = self._call_unsharded(api_name, arguments, parameters, False)
+        order = shard.order_of(first.results, self._order(api_name, parameters))
+        shards = shard.remaining(first.results, first.count, start, end, order)
+        if not shards:
+            return first
+        self.logger.info("Fetching %s results from %s in %s shards", first.count, api_name.name, len(shards) + 1)
+        calls = [(api_name, arguments, {**parameters, "period_from": lower.strftime(DatetimeFormat.OCTOPUSDATETIME.value),
+                                        "period_to": upper.strftime(DatetimeFormat.OCTOPUSDATETIME.value)})
+                 for lower, upper in shards]
+        # Each shard is a single page so it is fetched without sharding it again. The threads may be
+        # nested inside a concurrent fetch, the number of requests in flight is bounded in _get
+        with ThreadPoolExecutor(max_workers=min(self._max_workers, len(calls))) as executor:
+            pages = list(executor.map(lambda call: self._call_unsharded(*call), calls))
+        # The first page may be a cached response which is shared and must not be changed
+        first = copy.copy(first)
+        first.results = shard.combine([first.results, *(page.results for page in pages)], order)
+        first.count = len(first.results)
+        first.next = None
+        return first
+
+    def _call_unsharded(self, api_name: octopusapi.const.Endpoint, arguments: dict = None,
+                        parameters: dict = None, follow: bool = True):
+        """Call one of the REST APIs in a single query, following its pages unless follow is False."""
+        self.logger.info("Calling Octopus API: %s", api_name.name)
+        url = self._api_url(api_name, arguments, parameters)
+        if api_name.value.conditional and self._responses is not None:
+            return self._call_conditional(api_name, url, follow, self._order(api_name, parameters))
+        response = self._rest_request(url, api_name.value.auth, follow, self._order(api_name, parameters))
+        # Call the API endpoint and return the results
+        return self._parse(api_name, response)
+
+    def _call_conditional(self, api_name: octopusapi.const.Endpoint, url: str, follow: bool = True,
+                          order: octopusapi.const.Order = None):
+        """Call an endpoint which rarely changes, reusing the parsed response if it has not changed.
+
+        The request is conditional on the ETag and Last-Modified returned with the cached response. If the
+        server ignores them the body is compared with the cached one by its hash, and only parsed if it
+        differs. A response with several pages is only cached when just its first page is requested.
+        """
+        key = (url, follow)
+        cached = self._responses.get(key)
+        authorisation = HTTPBasicAuth(self._user, self._passwd) if api_name.value.auth else None
+        response = self._get(url, authorisation, cached.headers if cached is not None else None)
+        validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+        if cached is not None and response.status_code == 304:
+            self.logger.debug("%s has not been modified", api_name.name)
+            validators = {name: value for name, value in validators.items() if value}
+            return self._responses.revalidated(key, replace(cached, **validators), sent=False)
+        body = conditional.digest(response.content)
+        if cached is not None and body == cached.digest:
+            self.logger.debug("%s is unchanged", api_name.name)
+            return self._responses.revalidated(key, replace(cached, **validators), sent=True)
+        first = self._decode(response)
+        single = not follow or not first.get("next")
+        results = self._rest_request(url, api_name.value.auth, follow, order, first)
+        parsed = self._parse(api_name, results)
+        if not single:
+            return parsed
+        return self._responses.replaced(key, conditional.CachedResponse(parsed, body, **validators))
+
+    def _iter_api(self, api_name: octopusapi.const.Endpoint, arguments: dict = None, parameters: dict = None):
+        """Call one of the REST APIs and yield the results from each page as it arrives."""
+        self.logger.info("Calling Octopus API: %s", api_name.name)
+        url = self._api_url(api_name, arguments, parameters)
+        merged = merge.OrderedMerge(self._order(api_name, parameters))
+        for page in self._rest_pages(url, api_name.value.auth, merged):
+            yield self._parse(api_name, page).results
+
+    def _parse(self, api_name: octopusapi.const.Endpoint, response: dict):
+        """Parse a response into its dataclass, or into a page of lazy views of the rows in lazy mode."""
+        if self._lazy:
+            page = views.lazy_page(api_name.value.response, response)
+            if page is not None:
+                return page
+        return api_name.value.response.parse_kwargs(self, api_name.value.response, **response)
+
+    def _order(self, api_name: octopusapi.const.Endpoint, parameters: dict = None) -> octopusapi.const.Order | None:
+        """Return the order of the results requested from an endpoint, or None if the endpoint decides."""
+        if octopusapi.const.APIParms.ORDER_BY not in api_name.value.parms:
+            return None
+        order_by = (parameters or {}).get("order_by", self._api.parameters.order_by)
+        return None if order_by is None else octopusapi.const.Order(order_by)
+
+    def _api_url(self, api_name: octopusapi.const.Endpoint, arguments: dict = None, parameters: dict = None) -> str:
+        """Return the URL for an API call using the client settings overridden by any arguments or parameters."""
         # If the API request requires a key and we do not have one
         if (api_name.value.auth is True) and (self._user is None):
             raise APIKeyError(api_name)
-        # Create a dictionary entry for the arguments required by the endpoint
-        arguments = {
-            entry.value: getattr(self._api.arguments, entry.value)
-            for entry in api_name.value.arguments
-        }  
-        # Create a parameter string including any parameters for the endpoint which have a defined value
-        parm_string = "&".join(
-            f"{entry.value}={getattr(self._api.parameters, entry.value)}"
-            for entry in api_name.value.parms
-            if getattr(self._api.parameters, entry.value) is not None
-        )        
-        # Create a URL from the supplied information
-        url = f"{self._api.url}/{api_name.value.endpoint.format(**arguments)}/?{parm_string}"             
-        # Call the API endpoint and return the results
-        return api_name.value.response.parse_kwargs(self, api_name.value.response, **self._rest_request(url, api_name.value.auth))
+        # The builder for each endpoint is compiled once and reads the settings without changing them
+        return self._api.builders[api_name].build(self._api.arguments, self._api.parameters, arguments, parameters)
 
-    def _rest_request(self, url: str, auth: bool = False) -> dict:
-        """Use the requests module to call the REST API and check the response."""
-        # Only pass the API key if it is required
-        authorisation = HTTPBasicAuth(self._user, self._passwd) if auth else None
+    def _fetch_concurrently(self, calls: list) -> list:
+        """Make several API calls concurrently.
+
+        Args:
+            calls (list): A list of (api_name, arguments, parameters) tuples
+
+        Returns:
+            list: The parsed response for each call in the same order as the calls
+        """
+        call_api = self._call_api if self._store is None else self._call_store
+        if len(calls) <= 1 or self._max_workers == 1:
+            return [call_api(*call) for call in calls]
+        with ThreadPoolExecutor(max_workers=min(self._max_workers, len(calls))) as executor:
+            return list(executor.map(lambda call: call_api(*call), calls))
+
+    def _call_store(self, api_name: octopusapi.const.Endpoint, arguments: dict = None,
+                    parameters: dict = None, follow: bool = True):
+        """Call an API using the local store as a cache for half hourly consumption and rates.
+
+        Consumption is only requested from the first half hour missing from the store and rates are
+        only requested if the store does not cover the whole period. Anything fetched is stored.
+        """
+        arguments = arguments or {}
+        parameters = parameters or {}
+        apiargs = replace(self._api.arguments, **arguments)
+        apiparms = replace(self._api.parameters, **parameters)
+        cacheable = api_name in STORE_RATES or (api_name in STORE_METERS and apiparms.group_by is None)
+        if not cacheable or not follow or apiparms.period_from is None or apiparms.period_to is None:
+            return self._call_api(api_name, arguments, parameters, follow)
+        start, end = self._parse_window(apiparms.period_from, apiparms.period_to)
+        if api_name in STORE_RATES:
+            kind = STORE_RATES[api_name]
+            if not self._store.covers(apiargs.tariff_code, kind, start, end):
+                self._store.upsert_rates(apiargs.tariff_code, kind,
+                                         self._call_api(api_name, arguments, parameters).results)
+            results = list(self._store.rates(apiargs.tariff_code, kind, start, end))
+            return SimpleNamespace(count=len(results), results=results)
+        meter = "/".join(getattr(apiargs, name) for name in STORE_METERS[api_name])
+        gap = self._store.first_gap(meter, start, end)
+        if gap is not None:
+            missing = {**parameters, "period_from": gap.strftime(DatetimeFormat.OCTOPUSDATETIME.value)}
+            self._store.upsert_consumption(meter, self._call_api(api_name, arguments, missing).results)
+        results = list(self._store.consumption(meter, start, end))
+        return SimpleNamespace(count=len(results), results=results)
+
+    def _rest_request(self, url: str, auth: bool = False, follow: bool = True,
+                      order: octopusapi.const.Order = None, first: dict = None) -> dict:
+        """Use the requests module to call the REST API and check the response.
+
+        Args:
+            url (str): The URL to query
+            auth (bool, optional): Whether the API key is required. Defaults to False.
+            follow (bool, optional): Whether to follow next links and combine every page. Defaults to True.
+            order (Order, optional): The order of the results. Defaults to inferring it from the results.
+            first (dict, optional): The first page if it has already been fetched. Defaults to None.
+        """
         # Initialize an empty dict for the response
         response = {}
-        # Iterate while we have a valid url in order to handle the requirement for multiple queries
-        while url is not None:
-            try:
-                results = self._session.get(url=url, auth=authorisation, timeout=60)
-                results.raise_for_status()
-                # Check the REST API response status
-            except requests.exceptions.RequestException as err:
-                self.logger.error("Requests error encountered: %s", err)
-                raise err
-            try:
-                results_json=results.json()
-            except requests.exceptions.JSONDecodeError as err:
-                self.logger.error("JSON decoder error enountered err: %s", err)
-                raise err   
-            if self.logger.isEnabledFor(logging.DEBUG):            
-                self.logger.debug("Formatted API results:\n %s", ujson.dumps(results_json, indent=2))
+        merged = merge.OrderedMerge(order)
+        for results_json in self._rest_pages(url, auth, merged, first):
             # If this is the first result then return the json data
             if not response:
                 response = results_json
             # Otherwise we are adding to an existing dict and we should concatenate the results
             else:
                 response["results"] += results_json["results"]
-                response["count"] +=  results_json["count"]
+                # The count is for the whole list so the latest page has the most recent value
+                response["count"] = results_json["count"]
+            if not follow:
+                return response
+        if "results" in response and merged.key is not None:
+            if response["count"] != len(response["results"]):
+                self.logger.warning("API reported %s results but %s were received, %s repeated rows were removed",
+                                    response["count"], len(response["results"]), merged.duplicates)
+            response["count"] = len(response["results"])
+        return response
+
+    def _rest_pages(self, url: str, auth: bool = False, merged: merge.OrderedMerge = None, first: dict = None):
+        """Call the REST API and yield each page of the response as it arrives.
+
+        Rows repeated from an earlier page are removed and the order of the rows is checked.
+        """
+        # Only pass the API key if it is required
+        authorisation = HTTPBasicAuth(self._user, self._passwd) if auth else None
+        merged = merged or merge.OrderedMerge()
+        # Iterate while we have a valid url in order to handle the requirement for multiple queries
+        while url is not None:
+            if first is not None:
+                results_json, first = first, None
+            else:
+                results_json = self._decode(self._get(url, authorisation))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Formatted API results:\n %s", ujson.dumps(results_json, indent=2))
+            if isinstance(results_json.get("results"), list):
+                try:
+                    results_json["results"] = merged.page(results_json["results"])
+                except merge.OrderError as err:
+                    raise OctopusError(f"Results from {url} are out of order: {err}") from err
+            yield results_json
             # If we are told this is not the last response in a list then we need to iterate
             if "next" in results_json:
                 url = results_json["next"]
             # Otherwise end the iteration
             else:
                 break
-        return response
+
+    def _get(self, url: str, authorisation: HTTPBasicAuth = None, headers: dict = None) -> requests.Response:
+        """Make a GET request, waiting for a free request slot and the rate limit, and check the response status."""
+        with self._requests:
+            if self._limiter is not None:
+                self._limiter.acquire()
+            try:
+                results = self._session.get(url=url, auth=authorisation, timeout=60, headers=headers)
+                # Check the REST API response status
+                results.raise_for_status()
+            except requests.exceptions.RequestException as err:
+                self.logger.error("Requests error encountered: %s", err)
+                raise err
+        return results
+
+    def _decode(self, results: requests.Response) -> dict:
+        """Decode the JSON body of a response."""
+        try:
+            return results.json()
+        except requests.exceptions.JSONDecodeError as err:
+            self.logger.error("JSON decoder error enountered err: %s", err)
+            raise err
 
     def _is_current(self, entry: dict) -> bool:
         """Determine if an entry is current based on the valid_from and valid_to fields."""
@@ -534,6 +1345,6 @@ class OctopusClient():
 
     def _is_between(self, entry: dict, time: datetime) -> bool:
         """Determine if an entry is the correct one based on the valid_from and valid_to fields."""
-        from_date = getattr(entry, APIConstants.VALID_FROM.value)        
-        to_date = getattr(entry, APIConstants.VALID_TO.value)           
+        from_date = getattr(entry, APIConstants.VALID_FROM.value)
+        to_date = getattr(entry, APIConstants.VALID_TO.value)
         return (from_date is None or from_date <= time) and (to_date is None or to_date >= time)
@@ -1,13 +1,19 @@
-"""This code contains dataclasses which enable the construction of REST API clients
+"""This code contains dataclasses which enable the construction of REST and GraphQL API clients
 
 RESTClient: The RESTClient data class represents the configuration for making API requests.
 It includes information such as the API URL, authentication method, supported API endpoints, arguments, parameters,
-and constants."""
+and constants.
+GraphQLClient: The GraphQLClient data class represents the configuration for making GraphQL requests, with the
+operations used and the operation which obtains a token."""
 
 from dataclasses import dataclass, field, fields, is_dataclass
 from datetime import datetime, date, time
 from enum import Enum
-from typing import get_origin
+from operator import attrgetter
+from string import Formatter
+from typing import Callable, get_origin
+from functools import lru_cache
+from urllib.parse import quote, quote_plus
 import logging
 
 import ciso8601
@@ -81,19 +87,16 @@ class baseclass:
             elif (get_origin(entry_type) is dict) and (bool(entry_value)):
                 # Create a new dict in case we have to change the index
                 new_dict = {}
-                for index, data in enumerate(entry_value):
+                for data in entry_value:
+                    value = entry_value[data]
                     # if the dict value is a dataclass
                     if is_dataclass(entry_type.__args__[1]):
-                        entry_value[data] = self.parse_kwargs(
-                            entry_type.__args__[1], **(entry_value[data])
-                        )
+                        value = self.parse_kwargs(entry_type.__args__[1], **value)
                     # if the dict index is an enum
-                    elif issubclass(entry_type.__args__[0], Enum):
-                        new_dict[getattr(entry_type.__args__[0], data)] = entry_value[
-                            data
-                        ]
+                    if issubclass(entry_type.__args__[0], Enum):
+                        new_dict[getattr(entry_type.__args__[0], data)] = value
                     else:
-                        new_dict[data] = entry_value[data]
+                        new_dict[data] = value
                 setattr(self, entry.name, new_dict)
 
 
@@ -109,6 +112,91 @@ class Endpoint:
     auth: str = None
     arguments: list = field(default_factory=list)
     parms: list = field(default_factory=list)
+    # Whether responses rarely change and are revalidated rather than fetched and parsed every time
+    conditional: bool = False
+
+
+@lru_cache(maxsize=4096)
+def _quote_path(value: str) -> str:
+    return quote(value, safe="")
+
+
+@lru_cache(maxsize=4096)
+def _quote_query(value: str) -> str:
+    return quote_plus(value)
+
+
+@dataclass(frozen=True)
+class URLBuilder:
+    """A URL builder compiled once for an endpoint.
+
+    The endpoint template is split into its literal text and argument names, and the getters for the
+    arguments and parameters are created up front, so building a URL only reads the values it needs.
+    Builders hold no mutable state and can be shared by any number of threads.
+
+    Attributes:
+        prefix: The API URL the endpoint path is added to
+        literals: The literal text of the path, one more entry than there are path arguments
+        arguments: The names of the arguments in the path, in order
+        parms: The names of the query string parameters, in order
+    """
+
+    prefix: str
+    literals: tuple
+    arguments: tuple
+    parms: tuple
+    _get_arguments: Callable = field(repr=False, compare=False)
+    _get_parms: Callable = field(repr=False, compare=False)
+
+    @classmethod
+    def compile(cls, url: str, endpoint: Endpoint) -> "URLBuilder":
+        """Compile the builder for an endpoint of the REST API at url."""
+        literals = []
+        arguments = []
+        for literal, name, _, _ in Formatter().parse(endpoint.endpoint):
+            literals.append(literal)
+            if name is not None:
+                arguments.append(name)
+        if len(literals) == len(arguments):
+            literals.append("")
+        parms = tuple(entry.value for entry in endpoint.parms)
+        arguments = tuple(arguments)
+        return cls(prefix=f"{url}/", literals=tuple(literals), arguments=arguments, parms=parms,
+                   _get_arguments=cls._getter(arguments), _get_parms=cls._getter(parms))
+
+    @staticmethod
+    def _getter(names: tuple) -> Callable:
+        """Return a function reading every named attribute as a tuple."""
+        if not names:
+            return lambda source: ()
+        getter = attrgetter(*names)
+        return getter if len(names) > 1 else lambda source: (getter(source),)
+
+    @staticmethod
+    def _values(names: tuple, getter: Callable, source, overrides: dict | None) -> tuple:
+        values = getter(source)
+        if overrides:
+            values = tuple(overrides.get(name, value) for name, value in zip(names, values))
+        return values
+
+    def build(self, arguments, parameters, argument_overrides: dict = None, parameter_overrides: dict = None) -> str:
+        """Return the URL for a request.
+
+        Args:
+            arguments: The client arguments for the path
+            parameters: The client parameters for the query string
+            argument_overrides (dict, optional): Argument values which replace the client ones. Defaults to None.
+            parameter_overrides (dict, optional): Parameter values which replace the client ones. Defaults to None.
+        """
+        values = self._values(self.arguments, self._get_arguments, arguments, argument_overrides)
+        path = [self.literals[0]]
+        for value, literal in zip(values, self.literals[1:]):
+            path += (_quote_path(str(value)), literal)
+        values = self._values(self.parms, self._get_parms, parameters, parameter_overrides)
+        # Values repeat between requests so their encodings are cached
+        query = "&".join(f"{name}={_quote_query(str(value))}" for name, value in zip(self.parms, values)
+                         if value is not None)
+        return f"{self.prefix}{''.join(path)}/?{query}"
 
 
 @dataclass
@@ -132,6 +220,7 @@ class RESTClient:
         apiargs: A dataclass describing the set of arguments used by the endpoints
         apiparms: A dataclass describing the set of parameters used by the endpoints
         constants: A list of constants
+        builders: The compiled URLBuilder for each endpoint
     """
 
     url: str
@@ -140,3 +229,44 @@ class RESTClient:
     arguments: APIArguments = None
     parameters: APIParameters = None
     constants: Enum = None
+    builders: dict = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        # Compile a URL builder for every endpoint once, they are never changed afterwards
+        self.builders = {api: URLBuilder.compile(self.url, api.value) for api in self.apilist}
+
+
+@dataclass(frozen=True)
+class Operation:
+    """Dataclass describing a GraphQL query or mutation and the data it returns.
+
+    Attributes:
+        document: The GraphQL document, with aliases giving the field names of the response dataclass
+        root: The top level field of the data returned
+        response: The dataclass each result is parsed into, None leaves the result as returned
+        auth: Whether the operation requires a token
+    """
+
+    document: str
+    root: str
+    response: object = None
+    auth: bool = True
+
+
+@dataclass
+class GraphQLClient:
+    """This dataclass defines the set of information necessary to use a GraphQL API.
+
+    Attributes:
+        url: The URL used for the GraphQL API
+        operations: An Enum of the Operations used
+        token: The Operation which obtains or refreshes a token
+        header: The request header which carries the token
+        constants: A list of constants
+    """
+
+    url: str
+    operations: Enum
+    token: Operation = None
+    header: str = "Authorization"
+    constants: Enum = None
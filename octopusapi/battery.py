@@ -0,0 +1,247 @@
+"""Cost minimising charge and discharge schedules for a home battery.
+
+The battery state of charge is split into a fixed number of levels and a dynamic program is
+solved backwards over the half hour slots. The grid cost of every possible change of charge in
+every slot is worked out in one numpy pass, and each step of the program is then a minimum over
+a small array of every level and every move at once. A year of history can be replayed a day at
+a time to see what the battery would have saved.
+
+numpy is needed for optimise() and backtest()."""
+
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from octopusapi import frames
+from octopusapi.aggregate import LONDON
+
+SLOT = timedelta(minutes=30)
+
+
+@dataclass
+class Battery:
+    """The parameters of a home battery.
+
+    Attributes:
+        capacity: The usable capacity in kWh
+        charge_power: The maximum charging power in kW
+        discharge_power: The maximum discharging power in kW
+        efficiency: The round trip efficiency
+        reserve: The charge in kWh which must always be kept
+        charge: The charge in kWh at the start of the schedule
+        levels: The number of steps the capacity is split into
+    """
+
+    capacity: float = 10
+    charge_power: float = 3.6
+    discharge_power: float = 3.6
+    efficiency: float = 0.9
+    reserve: float = 0
+    charge: float = 0
+    levels: int = 20
+
+
+@dataclass
+class SlotSeries:
+    """Half hourly prices and household energy flows without a battery.
+
+    Attributes:
+        starts: The start of each half hour slot
+        import_prices: The import unit rate for each slot in pence per kWh
+        export_prices: The export unit rate for each slot in pence per kWh
+        demand: The energy imported in each slot in kWh
+        surplus: The energy exported in each slot in kWh
+    """
+
+    starts: list = field(default_factory=list)
+    import_prices: list = field(default_factory=list)
+    export_prices: list = field(default_factory=list)
+    demand: list = field(default_factory=list)
+    surplus: list = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def window(self, first: int, last: int) -> "SlotSeries":
+        """Return the slots between two indexes."""
+        return SlotSeries(self.starts[first:last], self.import_prices[first:last],
+                          self.export_prices[first:last], self.demand[first:last], self.surplus[first:last])
+
+
+@dataclass
+class Schedule:
+    """A battery schedule and its cost.
+
+    Attributes:
+        starts: The start of each half hour slot
+        actions: The energy in kWh added to the battery in each slot, negative when discharging
+        charge: The charge in kWh at the end of each slot
+        cost: The cost in pence with the battery
+        baseline: The cost in pence without the battery
+    """
+
+    starts: list = field(default_factory=list)
+    actions: list = field(default_factory=list)
+    charge: list = field(default_factory=list)
+    cost: float = 0
+    baseline: float = 0
+
+    @property
+    def saving(self) -> float:
+        return self.baseline - self.cost
+
+
+def _price_at(rates: list, starts: list) -> list:
+    """Return the unit rate applying at the start of each slot, 0 where there is no rate."""
+    ordered = sorted(rates, key=lambda entry: entry.valid_from)
+    valid_from = [entry.valid_from for entry in ordered]
+    prices = []
+    for start in starts:
+        index = bisect_right(valid_from, start) - 1
+        valid = index >= 0 and (ordered[index].valid_to is None or ordered[index].valid_to > start)
+        prices.append(ordered[index].value_inc_vat if valid else 0)
+    return prices
+
+
+def slot_series(import_rates: list, export_rates: list = (), consumption: list = (), export: list = (),
+                start: datetime = None, end: datetime = None) -> SlotSeries:
+    """Align rates and consumption onto a half hour grid.
+
+    Args:
+        import_rates (list): Import unit rates
+        export_rates (list, optional): Export unit rates. Defaults to none.
+        consumption (list, optional): Imported energy by half hour. Defaults to none.
+        export (list, optional): Exported energy by half hour. Defaults to none.
+        start (datetime, optional): The first slot. Defaults to the first import rate.
+        end (datetime, optional): The end of the last slot. Defaults to the end of the last import rate.
+    """
+    start = start or min(entry.valid_from for entry in import_rates)
+    end = end or max(entry.valid_to for entry in import_rates if entry.valid_to is not None)
+    starts = []
+    while start < end:
+        starts.append(start)
+        start += SLOT
+    demand = {entry.interval_start: entry.consumption for entry in consumption}
+    surplus = {entry.interval_start: entry.consumption for entry in export}
+    return SlotSeries(starts=starts,
+                      import_prices=_price_at(import_rates, starts),
+                      export_prices=_price_at(export_rates, starts),
+                      demand=[demand.get(slot, 0) for slot in starts],
+                      surplus=[surplus.get(slot, 0) for slot in starts])
+
+
+def forecast(history: list, starts: list, days: int = 7) -> list:
+    """Forecast energy for future slots as the average for the same UK time of day over recent days."""
+    totals = {}
+    for entry in history:
+        # History and slots are compared in UK time, as consumption is returned with a BST offset in summer
+        local = entry.interval_start.astimezone(LONDON)
+        totals.setdefault((local.hour, local.minute), []).append(entry.consumption)
+    averages = {key: sum(values[-days:]) / len(values[-days:]) for key, values in totals.items()}
+    forecasts = []
+    for start in starts:
+        local = start.astimezone(LONDON)
+        forecasts.append(averages.get((local.hour, local.minute), 0))
+    return forecasts
+
+
+def _columns(np, series: SlotSeries) -> tuple:
+    """Return the net flow without a battery and the import and export prices of each slot as arrays."""
+    base = np.asarray(series.demand, dtype=float) - np.asarray(series.surplus, dtype=float)
+    return base, np.asarray(series.import_prices, dtype=float), np.asarray(series.export_prices, dtype=float)
+
+
+def _drawn(np, energy, one_way: float):
+    """Return the energy drawn from the grid to add energy to the battery, or supplied by taking it out."""
+    return np.where(energy > 0, energy / one_way, energy * one_way)
+
+
+def _grid_costs(np, flows, import_prices, export_prices):
+    return np.where(flows > 0, flows * import_prices, flows * export_prices)
+
+
+def optimise(series: SlotSeries, battery: Battery, terminal_value: float = None) -> Schedule:
+    """Find the charge and discharge schedule with the lowest cost.
+
+    Args:
+        series (SlotSeries): The prices and energy flows for each slot
+        battery (Battery): The battery parameters
+        terminal_value (float, optional): The value in pence per kWh of charge left at the end.
+            Defaults to the average import price, so the battery is not simply emptied at the end.
+
+    Returns:
+        Schedule: The schedule found
+    """
+    np = frames._numpy()  # pylint: disable=protected-access
+    levels = battery.levels
+    step = battery.capacity / levels
+    one_way = battery.efficiency ** 0.5
+    lowest = min(levels, int(round(battery.reserve / step)))
+    up = max(0, int(battery.charge_power / 2 / step))
+    down = max(0, int(battery.discharge_power / 2 / step))
+    moves = np.arange(-down, up + 1)
+    if terminal_value is None:
+        terminal_value = sum(series.import_prices) / len(series) if len(series) else 0
+    # The grid cost of each possible change of charge in every slot, with a row for each slot
+    base, import_prices, export_prices = _columns(np, series)
+    costs = _grid_costs(np, base[:, None] + _drawn(np, moves * step, one_way),
+                        import_prices[:, None], export_prices[:, None])
+    # The level reached by each move from each level, and whether it stays within the reserve and capacity
+    targets = np.arange(levels + 1)[:, None] + moves
+    allowed = (targets >= lowest) & (targets <= levels)
+    targets = np.clip(targets, 0, levels)
+    blocked = np.where(allowed, 0, np.inf)
+    rows = np.arange(levels + 1)
+    # The value of each level of charge at the end of the schedule
+    future = -rows * step * terminal_value * one_way
+    best = np.zeros((len(series), levels + 1), dtype=int)
+    for slot in range(len(series) - 1, -1, -1):
+        values = costs[slot] + future[targets] + blocked
+        best[slot] = values.argmin(axis=1)
+        future = values[rows, best[slot]]
+    # A level below the reserve with no move back above it stays where it is
+    choices = np.where(allowed.any(axis=1), moves[best], 0).tolist()
+    level = min(levels, max(lowest, int(round(battery.charge / step))))
+    schedule = Schedule(starts=list(series.starts))
+    taken = []
+    for choice in choices:
+        taken.append(choice[level])
+        level += taken[-1]
+        schedule.charge.append(level * step)
+    actions = np.array(taken, dtype=int) * step
+    schedule.actions = actions.tolist()
+    schedule.cost = float(_grid_costs(np, base + _drawn(np, actions, one_way), import_prices, export_prices).sum())
+    schedule.baseline = float(_grid_costs(np, base, import_prices, export_prices).sum())
+    return schedule
+
+
+def backtest(series: SlotSeries, battery: Battery, horizon: int = 48, step: int = 48) -> Schedule:
+    """Replay history, optimising each horizon in turn and carrying the charge forward.
+
+    Args:
+        series (SlotSeries): The historical prices and energy flows
+        battery (Battery): The battery parameters
+        horizon (int, optional): The number of slots optimised at a time. Defaults to 48.
+        step (int, optional): The number of slots of each schedule used before optimising again. Defaults to 48.
+
+    Returns:
+        Schedule: The combined schedule over the whole history
+    """
+    result = Schedule()
+    charge = battery.charge
+    for first in range(0, len(series), step):
+        plan = optimise(series.window(first, first + horizon),
+                        Battery(battery.capacity, battery.charge_power, battery.discharge_power,
+                                battery.efficiency, battery.reserve, charge, battery.levels))
+        used = min(step, len(plan.starts))
+        result.starts += plan.starts[:used]
+        result.actions += plan.actions[:used]
+        result.charge += plan.charge[:used]
+        if used:
+            charge = plan.charge[used - 1]
+    np = frames._numpy()  # pylint: disable=protected-access
+    base, import_prices, export_prices = _columns(np, series.window(0, len(result.actions)))
+    flows = base + _drawn(np, np.asarray(result.actions, dtype=float), battery.efficiency ** 0.5)
+    result.cost = float(_grid_costs(np, flows, import_prices, export_prices).sum())
+    result.baseline = float(_grid_costs(np, base, import_prices, export_prices).sum())
+    return result
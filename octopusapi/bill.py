@@ -0,0 +1,165 @@
+"""Daily and monthly bills rebuilt from consumption, unit rates and the history of standing charges.
+
+The bill for a day is the electricity imported priced at the unit rates applying to each half
+hour, plus the standing charge which applied on that day, less the credit for electricity
+exported, plus the same for gas. Standing charges change over time so the charge for each day
+is taken from the history of charges rather than from the current charge. Each fuel is priced in
+a single pass which walks its consumption and its rates together, so the cost of a bill grows
+with the amount of data rather than with the number of days times the number of rates."""
+
+from dataclasses import dataclass, fields
+from datetime import date, timedelta
+from typing import Iterable
+
+from octopusapi import frames, pricing
+
+# Gas meters which report volume are converted to energy with the standard correction factor
+GAS_VOLUME_CORRECTION = 1.02264
+# A typical calorific value in MJ per m3, the actual value varies a little from month to month
+GAS_CALORIFIC_VALUE = 39.2
+MJ_PER_KWH = 3.6
+
+def gas_factor(units: str = "kWh", calorific_value: float = GAS_CALORIFIC_VALUE) -> float:
+    """Return the factor converting gas consumption in the units reported by a meter to kWh.
+
+    Args:
+        units (str, optional): "kWh" for SMETS1 meters or "m3" for SMETS2 meters. Defaults to "kWh".
+        calorific_value (float, optional): The calorific value in MJ/m3. Defaults to GAS_CALORIFIC_VALUE.
+    """
+    if units == "kWh":
+        return 1.0
+    if units == "m3":
+        return GAS_VOLUME_CORRECTION * calorific_value / MJ_PER_KWH
+    raise ValueError(f"Unknown gas units {units}, expected kWh or m3.")
+
+
+@dataclass
+class BillLine:
+    """The bill for one day, or one month, in kWh and pence including VAT.
+
+    Attributes:
+        period: The day, or the first day of the month
+        import_kwh: The electricity imported
+        import_cost: The cost of the electricity imported
+        import_standing: The electricity standing charge
+        export_kwh: The electricity exported
+        export_credit: The payment for the electricity exported
+        gas_kwh: The gas used
+        gas_cost: The cost of the gas used
+        gas_standing: The gas standing charge
+    """
+
+    period: date
+    import_kwh: float = 0
+    import_cost: float = 0
+    import_standing: float = 0
+    export_kwh: float = 0
+    export_credit: float = 0
+    gas_kwh: float = 0
+    gas_cost: float = 0
+    gas_standing: float = 0
+
+    @property
+    def electricity(self) -> float:
+        """The electricity bill before any export credit."""
+        return round(self.import_cost + self.import_standing, 3)
+
+    @property
+    def gas(self) -> float:
+        """The gas bill."""
+        return round(self.gas_cost + self.gas_standing, 3)
+
+    @property
+    def total(self) -> float:
+        """The whole bill less the export credit."""
+        return round(self.electricity + self.gas - self.export_credit, 3)
+
+
+# The values summed into each line, in column order
+COLUMNS = tuple(item.name for item in fields(BillLine) if item.name != "period")
+
+
+class Bill:
+    """A bill broken down by day, with the same figures rolled up by month.
+
+    Args:
+        days (list): BillLine entries, one for each day of the bill in date order
+    """
+
+    def __init__(self, days: list) -> None:
+        self.days = days
+
+    @property
+    def months(self) -> list:
+        """BillLine entries for each month, with period set to the first day of the month."""
+        months = {}
+        for line in self.days:
+            month = months.setdefault(line.period.replace(day=1), BillLine(line.period.replace(day=1)))
+            for name in COLUMNS:
+                setattr(month, name, getattr(month, name) + getattr(line, name))
+        for month in months.values():
+            for name in COLUMNS:
+                setattr(month, name, round(getattr(month, name), 3))
+        return list(months.values())
+
+    @property
+    def total(self) -> float:
+        """The whole bill less the export credit in pence."""
+        return round(sum(line.total for line in self.days), 3)
+
+    def to_numpy(self, monthly: bool = False) -> dict:
+        """Return the periods as datetime64 and a float array for each column, in date order."""
+        np = frames._numpy()  # pylint: disable=protected-access
+        lines = self.months if monthly else self.days
+        columns = {"period": np.array([line.period for line in lines], dtype="datetime64[D]")}
+        for name in COLUMNS + ("total",):
+            columns[name] = np.fromiter((getattr(line, name) for line in lines), dtype="float64", count=len(lines))
+        return columns
+
+    def to_frame(self, monthly: bool = False, tz: str = frames.LOCAL):
+        """Return a DataFrame with a column for each figure, indexed by local midnight of each period."""
+        pd = frames._pandas()  # pylint: disable=protected-access
+        columns = self.to_numpy(monthly)
+        index = pd.DatetimeIndex(columns.pop("period"), name="period").tz_localize(tz)
+        return pd.DataFrame(columns, index=index)
+
+
+def build(start: date, end: date, import_consumption: Iterable = (), import_rates: Iterable = (),
+          import_charges: Iterable = (), export_consumption: Iterable = (), export_rates: Iterable = (),
+          gas_consumption: Iterable = (), gas_rates: Iterable = (), gas_charges: Iterable = (),
+          gas_conversion: float = 1.0) -> Bill:
+    """Rebuild the bill for each day from start to end inclusive.
+
+    Standing charges are added for every day covered by a charge, whether or not any consumption
+    was recorded, as they would be on a real bill.
+
+    Args:
+        start (date): The first day of the bill
+        end (date): The last day of the bill
+        import_consumption (Iterable, optional): Half hourly import consumption. Defaults to ().
+        import_rates (Iterable, optional): Import unit rates. Defaults to ().
+        import_charges (Iterable, optional): Electricity standing charges. Defaults to ().
+        export_consumption (Iterable, optional): Half hourly export. Defaults to ().
+        export_rates (Iterable, optional): Export unit rates. Defaults to ().
+        gas_consumption (Iterable, optional): Half hourly gas consumption. Defaults to ().
+        gas_rates (Iterable, optional): Gas unit rates. Defaults to ().
+        gas_charges (Iterable, optional): Gas standing charges. Defaults to ().
+        gas_conversion (float, optional): The factor from gas_factor converting gas consumption to kWh. Defaults to 1.0.
+
+    Returns:
+        Bill: The bill for each day
+    """
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    lines = {day: BillLine(day) for day in days}
+    for (amount, cost), consumption, rates, factor in (
+            (("import_kwh", "import_cost"), import_consumption, import_rates, 1.0),
+            (("export_kwh", "export_credit"), export_consumption, export_rates, 1.0),
+            (("gas_kwh", "gas_cost"), gas_consumption, gas_rates, gas_conversion)):
+        for day, (used, priced) in pricing.priced_days(consumption, rates, factor).items():
+            if day in lines:
+                setattr(lines[day], amount, round(used, 3))
+                setattr(lines[day], cost, round(priced, 3))
+    for name, charges in (("import_standing", import_charges), ("gas_standing", gas_charges)):
+        for day, charge in pricing.daily_standing_charge(charges, days).items():
+            setattr(lines[day], name, charge)
+    return Bill(list(lines.values()))
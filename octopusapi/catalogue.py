@@ -0,0 +1,228 @@
+"""A local index of the Octopus products catalogue and the tariffs of each product by region.
+
+Products and tariffs are held in SQLite so that tariff lookups and comparisons are local queries.
+The catalogue remembers when it was last refreshed and when the details of each product were
+fetched, so that a refresh only fetches the details of products which are new, whose listing
+has changed or whose details are older than a maximum age, and marks products which are no
+longer listed."""
+
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from octopusapi.const import RegionID, product, productsdata
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    code TEXT PRIMARY KEY,
+    direction TEXT,
+    brand TEXT,
+    full_name TEXT,
+    display_name TEXT,
+    term INTEGER,
+    is_variable INTEGER,
+    is_green INTEGER,
+    is_tracker INTEGER,
+    is_prepay INTEGER,
+    is_business INTEGER,
+    is_restricted INTEGER,
+    available_from TEXT,
+    available_to TEXT
+);
+CREATE INDEX IF NOT EXISTS products_direction ON products (direction, brand);
+CREATE INDEX IF NOT EXISTS products_flags ON products (is_variable, is_green, is_tracker, is_prepay, is_business);
+CREATE INDEX IF NOT EXISTS products_available ON products (available_from, available_to);
+CREATE TABLE IF NOT EXISTS tariffs (
+    tariff_code TEXT,
+    product_code TEXT,
+    region TEXT,
+    fuel TEXT,
+    registers TEXT,
+    payment TEXT,
+    standing_charge_inc_vat REAL,
+    standard_unit_rate_inc_vat REAL,
+    day_unit_rate_inc_vat REAL,
+    night_unit_rate_inc_vat REAL,
+    PRIMARY KEY (tariff_code, payment)
+);
+CREATE INDEX IF NOT EXISTS tariffs_product ON tariffs (product_code);
+CREATE INDEX IF NOT EXISTS tariffs_region ON tariffs (region, fuel, registers);
+CREATE TABLE IF NOT EXISTS details (
+    code TEXT PRIMARY KEY,
+    fetched TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# The product attributes holding tariffs, with the fuel and number of registers they describe
+TARIFF_GROUPS = {
+    "single_register_electricity_tariffs": ("electricity", "single"),
+    "dual_register_electricity_tariffs": ("electricity", "dual"),
+    "single_register_gas_tariffs": ("gas", "single"),
+}
+
+PAYMENTS = ("direct_debit_monthly", "direct_debit_quarterly", "varying")
+
+# Tariff prices change without the listing changing, so details are refetched at least this often
+MAX_AGE = timedelta(days=7)
+
+
+def _isoformat(value: datetime) -> str | None:
+    return value.astimezone(timezone.utc).isoformat() if isinstance(value, datetime) else value
+
+
+class Catalogue:
+    """A local index of products and tariffs.
+
+    Args:
+        path (str, optional): The SQLite database file. Defaults to an in memory database.
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    @property
+    def refreshed(self) -> datetime | None:
+        """The time the catalogue was last refreshed."""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'refreshed'").fetchone()
+        return datetime.fromisoformat(row["value"]) if row else None
+
+    def known(self) -> set:
+        """Return the codes of every product in the catalogue."""
+        return {row["code"] for row in self._db.execute("SELECT code FROM products")}
+
+    def stale(self, listing: list, max_age: timedelta = MAX_AGE, now: datetime = None) -> list:
+        """Return the products in a listing whose details need to be fetched.
+
+        These are the products which are not in the catalogue yet, which became available after
+        the last refresh, whose listing entry differs from the one stored, such as a new
+        available_to, or whose details were fetched longer ago than max_age.
+
+        Args:
+            listing (list): Every productsdata entry in the current listing
+            max_age (timedelta, optional): The age after which details are refetched. Defaults to MAX_AGE.
+            now (datetime, optional): The time of the refresh. Defaults to now.
+        """
+        now = now or datetime.now(timezone.utc)
+        stored = {row["code"]: tuple(row) for row in self._db.execute("SELECT * FROM products")}
+        fetched = {row["code"]: datetime.fromisoformat(row["fetched"])
+                   for row in self._db.execute("SELECT code, fetched FROM details")}
+        refreshed = self.refreshed
+        return [entry for entry in listing
+                if stored.get(entry.code) != self._product_row(entry)
+                or entry.code not in fetched or now - fetched[entry.code] > max_age
+                or (refreshed is not None and entry.available_from is not None and entry.available_from > refreshed)]
+
+    def update(self, listing: list, details: list, now: datetime = None) -> None:
+        """Store a product listing and the details fetched for some of its products.
+
+        Args:
+            listing (list): Every productsdata entry in the current listing
+            details (list): The product details fetched
+            now (datetime, optional): The time of the refresh. Defaults to now.
+        """
+        now = now or datetime.now(timezone.utc)
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._product_row(entry) for entry in listing])
+            for data in details:
+                self._db.execute("DELETE FROM tariffs WHERE product_code = ?", (data.code,))
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO tariffs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._tariff_rows(data))
+                self._db.execute("INSERT OR REPLACE INTO details VALUES (?, ?)", (data.code, now.isoformat()))
+            # Products which are no longer listed have been withdrawn
+            listed = [entry.code for entry in listing]
+            self._db.execute(
+                f"UPDATE products SET available_to = ? WHERE available_to IS NULL "
+                f"AND code NOT IN ({','.join('?' * len(listed))})", [now.isoformat(), *listed])
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('refreshed', ?)", (now.isoformat(),))
+
+    @staticmethod
+    def _product_row(entry: productsdata) -> tuple:
+        return (entry.code, entry.direction, entry.brand, entry.full_name, entry.display_name, entry.term,
+                entry.is_variable, entry.is_green, entry.is_tracker, entry.is_prepay, entry.is_business,
+                entry.is_restricted, _isoformat(entry.available_from), _isoformat(entry.available_to))
+
+    @staticmethod
+    def _tariff_rows(data: product) -> list:
+        rows = []
+        for attribute, (fuel, registers) in TARIFF_GROUPS.items():
+            for region, tariffs in (getattr(data, attribute) or {}).items():
+                for payment in PAYMENTS:
+                    tariff = getattr(tariffs, payment, None)
+                    if not tariff:
+                        continue
+                    rows.append((tariff.code, data.code, region.name if isinstance(region, RegionID) else region,
+                                 fuel, registers, payment, tariff.standing_charge_inc_vat,
+                                 tariff.standard_unit_rate_inc_vat, tariff.day_unit_rate_inc_vat,
+                                 tariff.night_unit_rate_inc_vat))
+        return rows
+
+    def products(self, direction: str = None, brand: str = None, available_at: datetime = None,
+                 **flags) -> list:
+        """Return the products matching the criteria passed.
+
+        Args:
+            direction (str, optional): IMPORT or EXPORT. Defaults to any.
+            brand (str, optional): The brand. Defaults to any.
+            available_at (datetime, optional): Only products available at this time. Defaults to any.
+            flags: Values for is_variable, is_green, is_tracker, is_prepay, is_business or is_restricted
+
+        Returns:
+            list: A dict for each product
+        """
+        clauses = []
+        values = []
+        if direction is not None:
+            clauses.append("direction = ?")
+            values.append(direction)
+        if brand is not None:
+            clauses.append("brand = ?")
+            values.append(brand)
+        if available_at is not None:
+            clauses.append("(available_from IS NULL OR available_from <= ?) "
+                           "AND (available_to IS NULL OR available_to > ?)")
+            values += [_isoformat(available_at)] * 2
+        for flag, value in flags.items():
+            if flag not in {"is_variable", "is_green", "is_tracker", "is_prepay", "is_business", "is_restricted"}:
+                raise ValueError(f"Unknown product flag {flag}")
+            clauses.append(f"{flag} = ?")
+            values.append(bool(value))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return [dict(row) for row in self._db.execute(f"SELECT * FROM products{where} ORDER BY code", values)]
+
+    def tariffs(self, region: RegionID | str, fuel: str = "electricity", registers: str = "single",
+                product_code: str = None, **criteria) -> list:
+        """Return the tariffs for a region, joined with the details of their product.
+
+        Args:
+            region (RegionID | str): The region
+            fuel (str, optional): electricity or gas. Defaults to "electricity".
+            registers (str, optional): single or dual. Defaults to "single".
+            product_code (str, optional): Only tariffs for this product. Defaults to any.
+            criteria: Any criteria accepted by products
+
+        Returns:
+            list: A dict for each tariff, cheapest standard unit rate first
+        """
+        codes = [entry["code"] for entry in self.products(**criteria)]
+        if product_code is not None:
+            codes = [code for code in codes if code == product_code]
+        if not codes:
+            return []
+        region = region.name if isinstance(region, RegionID) else region
+        query = (f"SELECT tariffs.*, products.display_name, products.direction, products.brand "
+                 f"FROM tariffs JOIN products ON products.code = tariffs.product_code "
+                 f"WHERE region = ? AND fuel = ? AND registers = ? "
+                 f"AND product_code IN ({','.join('?' * len(codes))}) "
+                 f"ORDER BY standard_unit_rate_inc_vat")
+        return [dict(row) for row in self._db.execute(query, [region, fuel, registers, *codes])]
@@ -0,0 +1,254 @@
+"""The octopus command, which writes consumption, costs and rates to stdout as CSV or JSON lines.
+
+Each subcommand imports only the modules it uses and writes rows as each page arrives from the
+API, so output can be piped into other tools without waiting for the whole period to be fetched.
+Rollups are written as each period is completed by a later interval. Credentials are read from
+octopus_apikey and octopus_account in the environment or in ~/.env, as the scripts do.
+
+    octopus usage --days 7 --group day
+    octopus peak --days 30 --format jsonl
+    octopus raw import_rates --since 2024-01-01T00:00Z"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from dataclasses import fields, is_dataclass
+from datetime import date, datetime, timezone
+from enum import Enum
+
+FORMATS = ("csv", "jsonl")
+DATASETS = {"import": "import_consumption", "export": "export_consumption", "gas": "gas_consumption"}
+GROUPS = ("none", "hour", "day", "week", "month", "quarter")
+
+
+def _env() -> dict:
+    """Return the settings in ~/.env overridden by any set in the environment."""
+    env = {}
+    path = os.path.expanduser("~/.env")
+    if os.path.exists(path):
+        from dotenv import dotenv_values  # pylint: disable=import-outside-toplevel
+        env.update(dotenv_values(path))
+    env.update({name.lower(): value for name, value in os.environ.items() if name.lower().startswith("octopus_")})
+    return env
+
+
+def _value(value):
+    """Convert a value into one which can be written as CSV or JSON."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def _row(entry) -> dict:
+    """Return every field of a parsed result, a dataclass or a namedtuple such as RegisterRate, as a dict."""
+    if is_dataclass(entry):
+        return {item.name: _value(getattr(entry, item.name)) for item in fields(entry)}
+    return {name: _value(value) for name, value in entry._asdict().items()}
+
+
+class Writer:
+    """Writes batches of rows to a stream, flushing after each batch.
+
+    Args:
+        stream: The text stream written to
+        output (str): "csv" or "jsonl"
+    """
+
+    def __init__(self, stream, output: str) -> None:
+        self.stream = stream
+        self.output = output
+        self._csv = None
+
+    def write(self, rows: list) -> None:
+        """Write a batch of rows, taking the CSV columns from the first row written."""
+        if not rows:
+            return
+        if self.output == "jsonl":
+            self.stream.writelines(json.dumps(row, default=str) + "\n" for row in rows)
+        else:
+            if self._csv is None:
+                self._csv = csv.DictWriter(self.stream, fieldnames=list(rows[0]), extrasaction="ignore")
+                self._csv.writeheader()
+            self._csv.writerows(rows)
+        self.stream.flush()
+
+
+def _client(args):
+    from octopusapi.api import OctopusClient  # pylint: disable=import-outside-toplevel
+    env = _env()
+    client = OctopusClient(apikey=args.apikey or env.get("octopus_apikey"),
+                           account=args.account or env.get("octopus_account"))
+    if args.page_size:
+        client.set_page_size(args.page_size)
+    return client
+
+
+def _since(args) -> datetime | None:
+    if args.since is None:
+        return None
+    since = datetime.fromisoformat(args.since.replace("Z", "+00:00"))
+    return since if since.tzinfo else since.replace(tzinfo=timezone.utc)
+
+
+def _rollups(pages, group: str, classify=None):
+    """Roll pages of consumption up into periods, yielding the rows of each period once it is complete.
+
+    Pages are in time order for each meter, so a period is complete once a later interval arrives.
+    """
+    from octopusapi.aggregate import period_end, period_start, rollup  # pylint: disable=import-outside-toplevel
+    from octopusapi.const import Group, PriceType  # pylint: disable=import-outside-toplevel
+    group = Group(group)
+    ranges = {pricetype.value: 0 for pricetype in PriceType} if classify is not None else {}
+    pending = {}
+
+    def rows(meter, entries):
+        return [{"meter": meter, "interval_start": _value(period.interval_start),
+                 "interval_end": _value(period.interval_end), "consumption": period.consumption,
+                 "count": period.count, "minimum": period.minimum, "maximum": period.maximum,
+                 **ranges, **period.ranges} for period in rollup(entries, group, classify)]
+
+    for arguments, results in pages:
+        meter = "/".join(arguments.values())
+        entries, end = pending.get(meter, ([], None))
+        completed = []
+        for entry in results:
+            if end is not None and entry.interval_start >= end:
+                completed += rows(meter, entries)
+                entries, end = [], None
+            if end is None:
+                end = period_end(period_start(entry.interval_start, group), group)
+            entries.append(entry)
+        pending[meter] = (entries, end)
+        yield completed
+    for meter, (entries, _) in pending.items():
+        yield rows(meter, entries)
+
+
+def _consumption(client, dataset: str, args, group: str, classify=None):
+    """Yield batches of half hourly rows, or of rollups if a group was chosen, as each page arrives."""
+    pages = client.iter_dataset(dataset, days=args.days, since=_since(args))
+    if group == "none":
+        for arguments, results in pages:
+            meter = "/".join(arguments.values())
+            yield [{"meter": meter, "interval_start": _value(entry.interval_start),
+                    "interval_end": _value(entry.interval_end), "consumption": entry.consumption}
+                   for entry in results]
+        return
+    yield from _rollups(pages, group, classify)
+
+
+def usage(client, args):
+    """Half hourly consumption, or consumption rolled up by period."""
+    yield from _consumption(client, DATASETS[args.dataset], args, args.group)
+
+
+def peak(client, args):
+    """Consumption split into peak, off peak and standard for each period."""
+    from octopusapi import schedule  # pylint: disable=import-outside-toplevel
+    # Rates are fetched whole first as they are small, consumption then streams page by page
+    tariff = schedule.infer(client.fetch("import_rates", days=args.days, since=_since(args)))
+    yield from _consumption(client, DATASETS["import"], args, args.group, tariff.classify)
+
+
+def monthly(client, args):
+    """Monthly consumption for import, export and gas."""
+    for name, dataset in DATASETS.items():
+        for rows in _consumption(client, dataset, args, "month"):
+            yield [{"dataset": name, **row} for row in rows]
+
+
+def cost(client, args):
+    """The daily bill, which is written once every fuel and rate has been fetched."""
+    bill = client.get_bill(args.days, gas_units=args.gas_units)
+    yield [{**_row(line), "electricity": line.electricity, "gas": line.gas, "total": line.total}
+           for line in (bill.months if args.group == "month" else bill.days)]
+
+
+def raw(client, args):
+    """Every attribute of every result of a dataset, including rates and standing charges."""
+    for arguments, results in client.iter_dataset(args.dataset, days=args.days, since=_since(args)):
+        source = "/".join(str(value) for value in arguments.values())
+        yield [{"source": source, **_row(entry)} for entry in results]
+
+
+def sync(client, args):
+    """Fetch the half hours missing from the local store for every consumption dataset."""
+    from octopusapi.store import Store  # pylint: disable=import-outside-toplevel
+    path = args.store or _env().get("octopus_store") or os.path.expanduser("~/.octopus.db")
+    with Store(path) as store:
+        client.set_store(store)
+        for name, dataset in DATASETS.items():
+            report = client.backfill(dataset, days=args.days)
+            yield [{"dataset": name, "meter": meter, "requests": len(report.queries[meter]),
+                    "fetched": len(report.fetched[meter]),
+                    "missing": sum(gap.slots for gap in report.remaining.get(meter, []))}
+                   for meter in report.queries]
+
+
+def _options(days: int) -> argparse.ArgumentParser:
+    """Return the options shared by every subcommand, with the default number of days for one subcommand."""
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--format", dest="output", choices=FORMATS, default="csv", help="Output format")
+    options.add_argument("--days", type=int, default=days, help="Number of days ending today")
+    options.add_argument("--since", default=None, help="Fetch from this ISO time until now instead of --days")
+    options.add_argument("--page-size", type=int, default=None, help="Results requested per page")
+    options.add_argument("--apikey", default=None, help="API key, defaults to octopus_apikey")
+    options.add_argument("--account", default=None, help="Account number, defaults to octopus_account")
+    options.add_argument("-v", "--verbose", action="store_true", help="Log progress to stderr")
+    return options
+
+
+def parser() -> argparse.ArgumentParser:
+    """Return the parser for the octopus command and its subcommands."""
+    top = argparse.ArgumentParser(prog="octopus", description="Octopus Energy data as CSV or JSON lines")
+    commands = top.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("usage", parents=[_options(7)], help=usage.__doc__)
+    command.add_argument("--dataset", choices=DATASETS, default="import", help="Meter to read")
+    command.add_argument("--group", choices=GROUPS, default="none", help="Period to roll up by")
+    command.set_defaults(run=usage)
+    command = commands.add_parser("peak", parents=[_options(7)], help=peak.__doc__)
+    command.add_argument("--group", choices=GROUPS[2:], default="day", help="Period to roll up by")
+    command.set_defaults(run=peak)
+    command = commands.add_parser("monthly", parents=[_options(365)], help=monthly.__doc__)
+    command.set_defaults(run=monthly)
+    command = commands.add_parser("cost", parents=[_options(30)], help=cost.__doc__)
+    command.add_argument("--group", choices=("day", "month"), default="day", help="Period of each line")
+    command.add_argument("--gas-units", choices=("kWh", "m3"), default="kWh", help="Units reported by the gas meter")
+    command.set_defaults(run=cost)
+    command = commands.add_parser("raw", parents=[_options(7)], help=raw.__doc__)
+    command.add_argument("dataset", help="Dataset name, for example import_consumption or import_rates")
+    command.set_defaults(run=raw)
+    command = commands.add_parser("sync", parents=[_options(365)], help=sync.__doc__)
+    command.add_argument("--store", default=None, help="SQLite store, defaults to octopus_store or ~/.octopus.db")
+    command.set_defaults(run=sync)
+    return top
+
+
+def main(argv: list = None) -> int:
+    """Run the octopus command."""
+    args = parser().parse_args(argv)
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO if args.verbose else logging.WARNING)
+    import requests  # pylint: disable=import-outside-toplevel
+    from octopusapi.api import OctopusError  # pylint: disable=import-outside-toplevel
+    writer = Writer(sys.stdout, args.output)
+    try:
+        with _client(args) as client:
+            for rows in args.run(client, args):
+                writer.write(rows)
+    except BrokenPipeError:
+        # The reader has gone away, for example head, so stop quietly without a traceback on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except (OctopusError, requests.exceptions.RequestException, ValueError) as err:
+        print(f"octopus: {err}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
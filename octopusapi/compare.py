@@ -0,0 +1,76 @@
+"""Price one consumption history against many tariffs to compare them."""
+
+from dataclasses import dataclass
+
+from octopusapi import pricing
+from octopusapi.const import RegionID, product
+
+
+@dataclass
+class TariffQuote:
+    """The simulated cost of a tariff for a consumption history.
+
+    Attributes:
+        product_code: The product the tariff belongs to
+        tariff_code: The tariff for the region
+        display_name: The product name
+        unit_cost: The cost in pence of the consumption simulated
+        standing_charge: The standing charges in pence over the days simulated
+        annual_cost: The cost in pounds scaled up to a year
+        coverage: The fraction of the consumption which the unit rates covered
+    """
+
+    product_code: str
+    tariff_code: str
+    display_name: str = ""
+    unit_cost: float = 0
+    standing_charge: float = 0
+    annual_cost: float = 0
+    coverage: float = 0
+
+
+def region_tariff(data: product, region: RegionID) -> str | None:
+    """Return the single register electricity tariff code for a product in a region."""
+    tariffs = data.single_register_electricity_tariffs.get(region)
+    if tariffs is None:
+        return None
+    for payment in (tariffs.direct_debit_monthly, tariffs.varying, tariffs.direct_debit_quarterly):
+        if payment:
+            return payment.code
+    return None
+
+
+def simulate(consumption: list | pricing.ConsumptionSeries, tariffs: dict) -> list:
+    """Price the same consumption against each tariff.
+
+    Args:
+        consumption (list | pricing.ConsumptionSeries): Half hourly consumption
+        tariffs (dict): (product, tariff code, unit rates, standing charges) keyed by tariff code
+
+    Returns:
+        list: A TariffQuote for each tariff, cheapest first
+    """
+    series = consumption if isinstance(consumption, pricing.ConsumptionSeries) \
+        else pricing.ConsumptionSeries(consumption)
+    if not series.days:
+        return []
+    scale = 365 / len(series.days)
+    quotes = []
+    for data, tariff_code, rates, charges in tariffs.values():
+        cost, covered = series.cost(rates)
+        if not covered:
+            # The tariff has no rates for the period so cannot be compared
+            continue
+        # Assume any consumption without a rate would have been charged at the average rate
+        cost *= series.total / covered
+        standing = sum(pricing.daily_standing_charge(charges, series.days).values())
+        quotes.append(TariffQuote(
+            product_code=data.code,
+            tariff_code=tariff_code,
+            display_name=data.display_name,
+            unit_cost=round(cost, 2),
+            standing_charge=round(standing, 2),
+            annual_cost=round((cost + standing) * scale / 100, 2),
+            coverage=round(covered / series.total, 3) if series.total else 0,
+        ))
+    return sorted(quotes, key=lambda quote: quote.annual_cost)
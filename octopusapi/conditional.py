@@ -0,0 +1,110 @@
+"""A cache of responses from slowly changing endpoints, revalidated with conditional requests.
+
+Accounts, products, meter points and standing charges rarely change but every call downloads
+and parses them again. The validators a server returns, ETag and Last-Modified, are kept with the
+parsed response and sent back as If-None-Match and If-Modified-Since, so an unchanged response is
+answered with 304 Not Modified and neither transferred nor parsed. Servers which do not support
+conditional requests still send the whole body, so a hash of the body is kept as well and the
+parsed response is reused when the body is byte for byte the same as before.
+
+Parsed responses are shared by every caller which receives them and must not be changed."""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+def digest(content: bytes) -> bytes:
+    """Return a short hash of a response body."""
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+@dataclass
+class CachedResponse:
+    """A parsed response with the validators and hash of the body it was parsed from.
+
+    Attributes:
+        parsed: The parsed response
+        digest: The hash of the response body
+        etag: The ETag header returned with the response
+        last_modified: The Last-Modified header returned with the response
+    """
+
+    parsed: object
+    digest: bytes
+    etag: str = None
+    last_modified: str = None
+
+    @property
+    def headers(self) -> dict:
+        """The headers which make a request conditional on the response having changed."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """A thread safe cache of parsed responses keyed by URL, discarding the least recently used.
+
+    Args:
+        size (int, optional): The most responses kept. Defaults to 256.
+    """
+
+    def __init__(self, size: int = 256) -> None:
+        self.size = max(1, size)
+        self.not_modified = 0
+        self.unchanged = 0
+        self.changed = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key) -> CachedResponse | None:
+        """Return the cached response for a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, entry: CachedResponse) -> None:
+        """Cache a response while holding the lock, discarding the least recently used if the cache is full."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def revalidated(self, key, entry: CachedResponse, sent: bool) -> object:
+        """Record that a cached response is still current and return its parsed value.
+
+        Args:
+            key: The key the response is cached under
+            entry (CachedResponse): The cached response, with any new validators
+            sent (bool): True if the server sent the body again rather than 304 Not Modified
+        """
+        with self._lock:
+            if sent:
+                self.unchanged += 1
+            else:
+                self.not_modified += 1
+            self._store(key, entry)
+        return entry.parsed
+
+    def replaced(self, key, entry: CachedResponse) -> object:
+        """Cache a response which is new or has changed and return its parsed value."""
+        with self._lock:
+            if key in self._entries:
+                self.changed += 1
+            self._store(key, entry)
+        return entry.parsed
+
+    def clear(self) -> None:
+        """Discard every cached response."""
+        with self._lock:
+            self._entries.clear()
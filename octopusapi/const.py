@@ -5,7 +5,7 @@ from enum import Enum
 from typing import List
 
 from requests.auth import HTTPBasicAuth
-from octopusapi.apiconstruct import baseclass, RESTClient, Endpoint
+from octopusapi.apiconstruct import baseclass, RESTClient, Endpoint, GraphQLClient, Operation
 
 
 class RegionID(Enum):
@@ -208,7 +208,8 @@ class account(baseclass):
 Account = Endpoint(auth=True,
                    endpoint="v1/accounts/{account}",
                    arguments=[APIArgs.ACCOUNT],
-                   response=account)
+                   response=account,
+                   conditional=True)
 
 
 @dataclass(slots=True)
@@ -263,7 +264,8 @@ class products(baseclass):
 Products = Endpoint(endpoint="v1/products",
                     parms=[APIParms.IS_PREPAY, APIParms.IS_GREEN, APIParms.IS_TRACKER,
                            APIParms.IS_BUSINESS, APIParms.AVAILABLE_AT, APIParms.PAGE],
-                    response=products)
+                    response=products,
+                    conditional=True)
 
 
 @dataclass(slots=True)
@@ -359,7 +361,8 @@ class product(baseclass):
 Product = Endpoint(endpoint="v1/products/{product_code}",
                    arguments=[APIArgs.PRODUCT_CODE],
                    parms=[APIParms.TARIFFS_ACTIVE_AT],
-                   response=product)
+                   response=product,
+                   conditional=True)
 
 
 @dataclass(slots=True)
@@ -371,7 +374,8 @@ class meterpoint(baseclass):
 
 ElectricityMeterPoints = Endpoint(endpoint="v1/electricity-meter-points/{mpan}",
                                   arguments=[APIArgs.MPAN],
-                                  response=meterpoint)
+                                  response=meterpoint,
+                                  conditional=True)
 
 
 @dataclass(slots=True, order=True)
@@ -395,7 +399,8 @@ ElectricityStandingCharges = Endpoint(
     endpoint="v1/products/{product_code}/electricity-tariffs/{tariff_code}/standing-charges",
     arguments=[APIArgs.PRODUCT_CODE, APIArgs.TARIFF_CODE],
     parms=[APIParms.PERIOD_FROM, APIParms.PERIOD_TO, APIParms.PAGE_SIZE],
-    response=rates)
+    response=rates,
+    conditional=True)
 
 ElectricityStandardUnitRates = Endpoint(
     endpoint="v1/products/{product_code}/electricity-tariffs/{tariff_code}/standard-unit-rates",
@@ -419,7 +424,8 @@ GasStandingCharges = Endpoint(
     endpoint="v1/products/{product_code}/gas-tariffs/{tariff_code}/standing-charges",
     arguments=[APIArgs.PRODUCT_CODE, APIArgs.TARIFF_CODE],
     parms=[APIParms.PERIOD_FROM, APIParms.PERIOD_TO, APIParms.PAGE_SIZE],
-    response=rates)
+    response=rates,
+    conditional=True)
 
 GasStandardUnitRates = Endpoint(
     endpoint="v1/products/{product_code}/gas-tariffs/{tariff_code}/standard-unit-rates",
@@ -482,6 +488,18 @@ class groupedusage(baseclass):
     usage: list[usagegroup] = field(default_factory=list)
 
 
+@dataclass(slots=True)
+class usagerollup:
+    """Consumption for a period built locally from half hourly data."""
+    interval_start: datetime
+    interval_end: datetime
+    consumption: float = 0
+    minimum: float = None
+    maximum: float = None
+    count: int = 0
+    ranges: dict = field(default_factory=dict)
+
+
 class APIList(Enum):
     """This enum lists all the defined API endpoints, making it easy to reference them.
     The Enum value is the instance of the Endpoint class that describes the endpoint.
@@ -522,3 +540,92 @@ Octopus = RESTClient(
     parameters=apiparms(),
     constants=Constants
 )
+
+
+@dataclass(slots=True)
+class krakentoken(baseclass):
+    token: str
+    refresh_token: str = None
+    refresh_expires_in: int = None
+    payload: dict = None
+
+
+ObtainKrakenToken = Operation(
+    auth=False,
+    root="obtainKrakenToken",
+    document="""mutation obtainKrakenToken($input: ObtainJSONWebTokenInput!) {
+  obtainKrakenToken(input: $input) {
+    token
+    refresh_token: refreshToken
+    refresh_expires_in: refreshExpiresIn
+    payload
+  }
+}""",
+    response=krakentoken)
+
+
+SmartDevices = Operation(
+    root="account",
+    document="""query smartDevices($accountNumber: String!) {
+  account(accountNumber: $accountNumber) {
+    electricity_agreements: electricityAgreements(active: true) {
+      meter_point: meterPoint {
+        meters(includeInactive: false) {
+          smart_devices: smartDevices {
+            device_id: deviceId
+          }
+        }
+      }
+    }
+  }
+}""")
+
+
+@dataclass(slots=True)
+class telemetry(baseclass):
+    read_at: datetime
+    consumption: float = None
+    consumption_delta: float = None
+    demand: float = None
+    cost_delta: float = None
+
+
+SmartMeterTelemetry = Operation(
+    root="smartMeterTelemetry",
+    document="""query smartMeterTelemetry($deviceId: String!, $start: DateTime, $end: DateTime,
+                           $grouping: TelemetryGrouping) {
+  smartMeterTelemetry(deviceId: $deviceId, start: $start, end: $end, grouping: $grouping) {
+    read_at: readAt
+    consumption
+    consumption_delta: consumptionDelta
+    demand
+    cost_delta: costDelta
+  }
+}""",
+    response=telemetry)
+
+
+class TelemetryGrouping(Enum):
+    """The intervals telemetry can be grouped into, with their length in seconds."""
+    TEN_SECONDS = 10
+    ONE_MINUTE = 60
+    FIFTEEN_MINUTES = 900
+    THIRTY_MINUTES = 1800
+    ONE_HOUR = 3600
+
+
+class GraphQLList(Enum):
+    """This enum lists all the defined GraphQL operations.
+    The Enum value is the instance of the Operation class that describes the operation.
+    """
+    ObtainKrakenToken = ObtainKrakenToken
+    SmartDevices = SmartDevices
+    SmartMeterTelemetry = SmartMeterTelemetry
+
+
+Kraken = GraphQLClient(
+    url="https://api.octopus.energy/v1/graphql/",
+    operations=GraphQLList,
+    token=ObtainKrakenToken,
+    constants=Constants
+)
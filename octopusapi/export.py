@@ -0,0 +1,163 @@
+"""Export consumption, unit rates and costs to partitioned Parquet or Arrow IPC files.
+
+Rows are written in bounded batches as each page arrives from the API, with an open writer per
+partition, so the memory used does not grow with the length of history exported. Consumption is
+partitioned by meter and month, rates by tariff and month, and costs by month, using the
+key=value directory layout which pyarrow and pandas read as a single dataset. Meters are keyed
+as elsewhere in the package, such as 1200000000000/21E1234567, with partition values URI encoded
+in the directory names as pyarrow's hive partitioning expects.
+
+pyarrow is an optional dependency which is only needed when exporting."""
+
+import os
+from datetime import timezone
+from urllib.parse import quote
+
+from octopusapi import pricing
+from octopusapi.api import OctopusClient, OctopusError
+from octopusapi.plan import Dataset
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def _pyarrow():
+    """Import pyarrow, which is only required for exports."""
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+        import pyarrow.ipc  # pylint: disable=import-outside-toplevel
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise OctopusError("Exporting to Parquet or Arrow requires the pyarrow package.") from err
+    return pyarrow
+
+
+def _schemas(pa) -> dict:
+    timestamp = pa.timestamp("s", tz="UTC")
+    return {
+        "consumption": pa.schema([("interval_start", timestamp), ("interval_end", timestamp),
+                                  ("consumption", pa.float64())]),
+        "rates": pa.schema([("valid_from", timestamp), ("valid_to", timestamp),
+                            ("value_exc_vat", pa.float64()), ("value_inc_vat", pa.float64())]),
+        "costs": pa.schema([("date", pa.date32()), ("cost", pa.float64())]),
+    }
+
+
+class PartitionedWriter:
+    """Writes batches of rows to files partitioned by directory.
+
+    Args:
+        root (str): The directory for the dataset
+        schema: The pyarrow schema of the rows
+        format (str, optional): parquet or arrow. Defaults to "parquet".
+        batch (int, optional): The number of rows buffered per partition before writing. Defaults to 10000.
+    """
+
+    def __init__(self, root: str, schema, format: str = "parquet", batch: int = 10000) -> None:
+        if format not in FORMATS:
+            raise OctopusError(f"Unknown export format {format}, expected one of {', '.join(FORMATS)}.")
+        self._pa = _pyarrow()
+        self._root = root
+        self._schema = schema
+        self._format = format
+        self._batch = batch
+        self._writers = {}
+        self._buffers = {}
+
+    def write(self, partition: tuple, row: tuple) -> None:
+        """Add a row to a partition, writing the partition's buffer once it is full.
+
+        Args:
+            partition (tuple): (key, value) pairs naming the partition
+            row (tuple): The values of each column in the schema
+        """
+        buffer = self._buffers.setdefault(partition, [])
+        buffer.append(row)
+        if len(buffer) >= self._batch:
+            self._flush(partition)
+
+    def _flush(self, partition: tuple) -> None:
+        rows = self._buffers.pop(partition, [])
+        if not rows:
+            return
+        table = self._pa.Table.from_arrays(
+            [self._pa.array(column, type=entry.type) for column, entry in zip(zip(*rows), self._schema)],
+            schema=self._schema)
+        writer = self._writers.get(partition)
+        if writer is None:
+            directory = os.path.join(self._root, *(f"{key}={quote(str(value), safe='')}" for key, value in partition))
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-0{FORMATS[self._format]}")
+            if self._format == "parquet":
+                writer = self._pa.parquet.ParquetWriter(path, self._schema)
+            else:
+                writer = self._pa.ipc.new_file(path, self._schema)
+            self._writers[partition] = writer
+        writer.write_table(table)
+
+    def close(self) -> None:
+        """Write any buffered rows and close every file."""
+        for partition in list(self._buffers):
+            self._flush(partition)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+def _month(value) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m")
+
+
+def export_history(client: OctopusClient, root: str, days: int = 365, format: str = "parquet",
+                   batch: int = 10000) -> dict:
+    """Stream consumption, export, unit rates and daily costs for the account to partitioned files.
+
+    Args:
+        client (OctopusClient): The client for the account
+        root (str): The directory to export to
+        days (int, optional): The number of days of history. Defaults to 365.
+        format (str, optional): parquet or arrow. Defaults to "parquet".
+        batch (int, optional): The number of rows buffered per partition. Defaults to 10000.
+
+    Returns:
+        dict: The number of rows written to each dataset
+    """
+    pa = _pyarrow()
+    schemas = _schemas(pa)
+    written = {}
+    rates = {}
+    # Rates are small so they are kept to price the consumption as it streams past
+    writer = PartitionedWriter(os.path.join(root, "rates"), schemas["rates"], format, batch)
+    for dataset in (Dataset.IMPORT_RATES, Dataset.EXPORT_RATES):
+        rates[dataset] = []
+        for arguments, results in client.iter_dataset(dataset, days):
+            for entry in results:
+                writer.write((("tariff", arguments["tariff_code"]), ("month", _month(entry.valid_from))),
+                             (entry.valid_from, entry.valid_to, entry.value_exc_vat, entry.value_inc_vat))
+            rates[dataset] += results
+            written["rates"] = written.get("rates", 0) + len(results)
+    writer.close()
+    costs = {}
+    writer = PartitionedWriter(os.path.join(root, "consumption"), schemas["consumption"], format, batch)
+    for dataset, rate_dataset in ((Dataset.IMPORT_CONSUMPTION, Dataset.IMPORT_RATES),
+                                  (Dataset.EXPORT_CONSUMPTION, Dataset.EXPORT_RATES),
+                                  (Dataset.GAS_CONSUMPTION, None)):
+        unit_rates = {entry.valid_from: entry.value_inc_vat for entry in rates.get(rate_dataset, [])}
+        for arguments, results in client.iter_dataset(dataset, days):
+            meter = "/".join(str(value) for value in arguments.values())
+            for entry in results:
+                writer.write((("dataset", dataset.value), ("meter", meter), ("month", _month(entry.interval_start))),
+                             (entry.interval_start, entry.interval_end, entry.consumption))
+            if unit_rates:
+                page = pricing.daily_cost(unit_rates, {entry.interval_start: entry for entry in results})
+                totals = costs.setdefault(dataset, {})
+                for day, cost in page.items():
+                    totals[day] = totals.get(day, 0) + cost
+            written[dataset.value] = written.get(dataset.value, 0) + len(results)
+    writer.close()
+    writer = PartitionedWriter(os.path.join(root, "costs"), schemas["costs"], format, batch)
+    for dataset, totals in costs.items():
+        for day, cost in sorted(totals.items()):
+            writer.write((("dataset", dataset.value), ("month", day.strftime("%Y-%m"))), (day, cost))
+        written["costs"] = written.get("costs", 0) + len(totals)
+    writer.close()
+    return written
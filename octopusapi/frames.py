@@ -0,0 +1,169 @@
+"""NumPy arrays and pandas DataFrames from client results.
+
+The client returns consumption and rates as lists and costs as dicts. These subclasses behave
+exactly as before but add to_numpy() and to_frame(), which fill each column straight into a
+contiguous array rather than building a Python list of rows first. The rows are parsed objects,
+so each time is read once as epoch seconds into an int64 array, which is then reinterpreted as
+datetime64 without a copy. Columns which already hold epoch seconds, such as those read from the
+store, are converted in a single call. DataFrames are indexed by a timezone aware DatetimeIndex
+in UK local time.
+
+numpy and pandas are optional dependencies which are only needed for these conversions."""
+
+from collections import defaultdict
+from datetime import datetime, timezone
+
+LOCAL = "Europe/London"
+
+
+def _numpy():
+    try:
+        import numpy  # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise ImportError("to_numpy() requires the numpy package.") from err
+    return numpy
+
+
+def _pandas():
+    try:
+        import pandas  # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise ImportError("to_frame() requires the pandas package.") from err
+    return pandas
+
+
+def _epoch(value) -> float:
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+    # Dates are taken as midnight UTC
+    return datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp()
+
+
+# The int64 value numpy reads as NaT
+_NAT = -2 ** 63
+
+
+def _times(np, values, count: int):
+    """Return a datetime64 array of UTC times, with NaT where a time is missing."""
+    seconds = np.fromiter((_NAT if value is None else int(_epoch(value)) for value in values),
+                          dtype="int64", count=count)
+    return seconds.view("datetime64[s]")
+
+
+def epoch_times(np, seconds: list):
+    """Return a datetime64 array from a list of UTC epoch seconds, with NaT where a time is None."""
+    if None in seconds:
+        seconds = [_NAT if value is None else value for value in seconds]
+    return np.array(seconds, dtype="int64").view("datetime64[s]")
+
+
+def _floats(np, values, count: int):
+    return np.fromiter(values, dtype="float64", count=count)
+
+
+def _index(pd, times, name: str, tz: str):
+    return pd.DatetimeIndex(times, name=name).tz_localize("UTC").tz_convert(tz)
+
+
+def to_frame(columns: dict, index: str, tz: str = LOCAL):
+    """Build a DataFrame from a dict of numpy columns, using one datetime64 column as the index."""
+    pd = _pandas()
+    data = {}
+    for name, values in columns.items():
+        if name == index:
+            continue
+        if values.dtype.kind == "M":
+            values = pd.DatetimeIndex(values).tz_localize("UTC").tz_convert(tz)
+        data[name] = values
+    return pd.DataFrame(data, index=_index(pd, columns[index], index, tz))
+
+
+class ConsumptionList(list):
+    """A list of consumption entries with interval_start, interval_end and consumption."""
+
+    def to_numpy(self) -> dict:
+        """Return a numpy array for each attribute, times as UTC datetime64."""
+        np = _numpy()
+        count = len(self)
+        return {
+            "interval_start": _times(np, (entry.interval_start for entry in self), count),
+            "interval_end": _times(np, (entry.interval_end for entry in self), count),
+            "consumption": _floats(np, (entry.consumption for entry in self), count),
+        }
+
+    def to_frame(self, tz: str = LOCAL):
+        """Return a DataFrame indexed by interval_start."""
+        return to_frame(self.to_numpy(), "interval_start", tz)
+
+
+class RateList(list):
+    """A list of unit rates or standing charges with valid_from, valid_to and values."""
+
+    def to_numpy(self) -> dict:
+        """Return a numpy array for each attribute, times as UTC datetime64 with NaT for open ended rates."""
+        np = _numpy()
+        count = len(self)
+        return {
+            "valid_from": _times(np, (entry.valid_from for entry in self), count),
+            "valid_to": _times(np, (entry.valid_to for entry in self), count),
+            "value_exc_vat": _floats(np, (entry.value_exc_vat for entry in self), count),
+            "value_inc_vat": _floats(np, (entry.value_inc_vat for entry in self), count),
+        }
+
+    def to_frame(self, tz: str = LOCAL):
+        """Return a DataFrame indexed by valid_from."""
+        return to_frame(self.to_numpy(), "valid_from", tz)
+
+
+class CostDict(dict):
+    """Costs keyed by date."""
+
+    def to_numpy(self) -> dict:
+        """Return the dates as datetime64 and the costs as floats, in date order."""
+        np = _numpy()
+        days = sorted(self)
+        return {"date": np.array(days, dtype="datetime64[D]"),
+                "cost": _floats(np, (self[day] for day in days), len(days))}
+
+    def to_frame(self, tz: str = LOCAL):
+        """Return a DataFrame indexed by local midnight of each date."""
+        pd = _pandas()
+        columns = self.to_numpy()
+        index = pd.DatetimeIndex(columns["date"], name="date").tz_localize(tz)
+        return pd.DataFrame({"cost": columns["cost"]}, index=index)
+
+
+class RangeDict(defaultdict):
+    """Consumption by price type keyed by period, as returned by get_electricity_consumption_byrange."""
+
+    def __init__(self, *args) -> None:
+        super().__init__(dict, *args)
+
+    def to_numpy(self) -> dict:
+        """Return the period starts as UTC datetime64 and a float array for each price type."""
+        np = _numpy()
+        periods = sorted(self)
+        names = sorted({name for values in self.values() for name in values})
+        columns = {"date": _times(np, periods, len(periods))}
+        for name in names:
+            columns[name] = _floats(np, (self[period].get(name, 0) for period in periods), len(periods))
+        return columns
+
+    def to_frame(self, tz: str = LOCAL):
+        """Return a DataFrame with a column for each price type, indexed by period."""
+        return to_frame(self.to_numpy(), "date", tz)
+
+
+def arrays(columns: dict) -> dict:
+    """Convert a dict of column lists into numpy arrays, times as UTC datetime64."""
+    np = _numpy()
+    result = {}
+    for name, values in columns.items():
+        sample = next((value for value in values if value is not None), None)
+        if isinstance(sample, datetime):
+            result[name] = _times(np, values, len(values))
+        elif isinstance(sample, (int, float)):
+            result[name] = _floats(np, values, len(values))
+        else:
+            result[name] = np.array(values, dtype=object)
+    return result
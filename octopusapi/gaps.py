@@ -0,0 +1,134 @@
+"""Find the half hours missing from consumption series and plan the queries which fill them.
+
+Smart meters often miss intervals or report them late, so series fetched or stored earlier have
+holes. A series is compared with the half hour grid it should cover and the missing intervals are
+coalesced into as few period_from/period_to queries as possible, so that repairing a long history
+only requests the parts which are missing rather than reloading all of it."""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
+
+SLOT = timedelta(minutes=30)
+_SECONDS = int(SLOT.total_seconds())
+# The most half hours which are present between two gaps for them to be queried together
+BRIDGE = 12
+
+
+def _epoch(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _datetime(value: int) -> datetime:
+    return datetime.fromtimestamp(value, timezone.utc)
+
+
+@dataclass(frozen=True)
+class Gap:
+    """A run of consecutive missing half hours.
+
+    Attributes:
+        start: The start of the first missing half hour
+        end: The end of the last missing half hour
+    """
+
+    start: datetime
+    end: datetime
+
+    @property
+    def slots(self) -> int:
+        """The number of half hours in the gap."""
+        return (_epoch(self.end) - _epoch(self.start)) // _SECONDS
+
+    def window(self, time_format: str) -> dict:
+        """Return the period_from and period_to parameters which query the gap."""
+        return {"period_from": self.start.strftime(time_format), "period_to": self.end.strftime(time_format)}
+
+
+def find_gaps(starts: Iterable[datetime], start: datetime, end: datetime) -> list:
+    """Return the runs of half hours in [start, end) which have no entry.
+
+    Args:
+        starts (Iterable[datetime]): The interval_start of every entry present, in any order
+        start (datetime): The start of the period which should be covered
+        end (datetime): The end of the period which should be covered
+
+    Returns:
+        list: The Gap entries in time order
+    """
+    # Meter readings start on whole half hours so the grid is aligned to them
+    first = -(-_epoch(start) // _SECONDS) * _SECONDS
+    last = _epoch(end)
+    gaps = []
+    expected = first
+    for present in sorted({_epoch(value) for value in starts}):
+        if present < expected:
+            continue
+        if present >= last:
+            break
+        if present > expected:
+            gaps.append(Gap(_datetime(expected), _datetime(present)))
+        expected = present + _SECONDS
+    if expected < last:
+        gaps.append(Gap(_datetime(expected), _datetime(expected + -(-(last - expected) // _SECONDS) * _SECONDS)))
+    return gaps
+
+
+def coalesce(gaps: list, page_size: int, bridge: int = BRIDGE) -> list:
+    """Merge nearby gaps into as few queries as possible which each return no more than one page.
+
+    Two gaps are queried together when no more than bridge half hours are present between them
+    and the span from the start of the first to the end of the second fits in a page, as
+    refetching a few half hours costs less than a second request. Gaps further apart are queried
+    separately so that only the missing intervals are fetched. A gap longer than a page is
+    queried on its own and its pages are followed.
+
+    Args:
+        gaps (list): Gap entries in time order
+        page_size (int): The number of results returned in each page
+        bridge (int, optional): The most half hours present between gaps which are queried together.
+            Defaults to BRIDGE.
+
+    Returns:
+        list: The Gap entries to query, in time order
+    """
+    queries = []
+    for gap in gaps:
+        if queries and Gap(queries[-1].end, gap.start).slots <= bridge and \
+                Gap(queries[-1].start, gap.end).slots <= page_size:
+            queries[-1] = Gap(queries[-1].start, gap.end)
+        else:
+            queries.append(gap)
+    return queries
+
+
+@dataclass
+class Backfill:
+    """The outcome of repairing the gaps in the consumption of each meter.
+
+    Attributes:
+        queries: The Gap entries queried for each meter
+        fetched: The entries returned for each meter
+        remaining: The Gap entries which are still missing for each meter
+    """
+
+    queries: dict = field(default_factory=dict)
+    fetched: dict = field(default_factory=dict)
+    remaining: dict = field(default_factory=dict)
+
+    @property
+    def requests(self) -> int:
+        """The number of queries made."""
+        return sum(len(queries) for queries in self.queries.values())
+
+    @property
+    def earliest(self) -> datetime | None:
+        """The start of the earliest gap queried, or None if nothing was missing."""
+        return min((queries[0].start for queries in self.queries.values() if queries), default=None)
+
+    @property
+    def missing(self) -> int:
+        """The number of half hours still missing across every meter."""
+        return sum(gap.slots for gaps in self.remaining.values() for gap in gaps)
@@ -0,0 +1,306 @@
+"""A local HTTP gateway which shares one Octopus client between many consumers.
+
+Home automation, dashboards, battery controllers and scripts often each create a client and poll
+the same rates and consumption. The gateway serves the REST API endpoints at the same paths as
+the Octopus API, together with derived views such as the current price and the daily cost, from
+a cache which is refreshed at most once per time to live. Concurrent requests for something which
+is not cached wait for a single upstream request rather than each making their own, upstream
+requests go through the client's rate limit, and the counters are served for Prometheus.
+
+Run it with: python octopus-gateway.py --port 8080"""
+
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import fields, is_dataclass
+from datetime import date, datetime, timedelta, timezone
+from enum import Enum
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from octopusapi import plan
+from octopusapi.aggregate import LONDON
+from octopusapi.api import OctopusClient, OctopusError
+from octopusapi.const import APIList
+
+
+def plain(value):
+    """Convert parsed results into values which can be written as JSON."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    if hasattr(value, "_asdict"):
+        return {name: plain(entry) for name, entry in value._asdict().items()}
+    if is_dataclass(value):
+        return {entry.name: plain(getattr(value, entry.name)) for entry in fields(value)}
+    if isinstance(value, dict):
+        return {key if isinstance(key, str) else plain(key): plain(entry) for key, entry in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(entry) for entry in value]
+    return value
+
+
+def _route(endpoint) -> re.Pattern:
+    """Return a pattern matching the paths of a REST API endpoint."""
+    parts = re.split(r"\{[^}]+\}", endpoint.endpoint)
+    return re.compile("/" + "[^/]+".join(re.escape(part) for part in parts) + "/?")
+
+
+# The pattern matching the path of each REST API endpoint
+ROUTES = [(_route(api.value), api) for api in APIList]
+
+
+class GatewayError(Exception):
+    """An error returned to the consumer with an HTTP status."""
+
+    def __init__(self, status: int, msg: str) -> None:
+        super().__init__(msg)
+        self.status = status
+
+
+class Gateway:
+    """A read through HTTP gateway in front of an Octopus client, served from a background thread.
+
+    Args:
+        client (OctopusClient): The client used for every upstream request
+        ttl (float, optional): The seconds rates, consumption and derived views are cached for. Defaults to 300.
+        slow_ttl (float, optional): The seconds responses from endpoints which rarely change are cached for.
+            Defaults to 3600.
+        size (int, optional): The most responses cached. Defaults to 1024.
+        host (str, optional): The address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): The port to listen on, 0 picks a free port. Defaults to 0.
+    """
+
+    def __init__(self, client: OctopusClient, ttl: float = 300, slow_ttl: float = 3600, size: int = 1024,
+                 host: str = "127.0.0.1", port: int = 0) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.ttl = ttl
+        self.slow_ttl = slow_ttl
+        self.size = max(1, size)
+        self.counters = {}
+        self._cache = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._views = {
+            "/price/current": self._current_price,
+            "/rates/today": self._rates_today,
+            "/cost/daily": self._daily_cost,
+            "/bill": self._bill,
+        }
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    def start(self) -> "Gateway":
+        """Start serving from a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve(self) -> None:
+        """Serve from the current thread until interrupted."""
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def read(self, key: str, ttl: float, load) -> bytes:
+        """Return a cached body, or load it, sharing a single load between concurrent requests.
+
+        Args:
+            key (str): The path and query string requested
+            ttl (float): The seconds the body is cached for
+            load (Callable): Returns the body when it is not cached
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.counters["cache_hits"] = self.counters.get("cache_hits", 0) + 1
+                return entry[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+            name = "cache_misses" if leader else "coalesced"
+            self.counters[name] = self.counters.get(name, 0) + 1
+        if not leader:
+            return flight.result()
+        started = time.perf_counter()
+        try:
+            body = load()
+        except Exception as err:
+            if not isinstance(err, GatewayError):
+                self._count("upstream_errors")
+            flight.set_exception(err)
+            raise
+        else:
+            flight.set_result(body)
+            self._store(key, body, ttl)
+        finally:
+            self._count("upstream_requests")
+            self._count("upstream_seconds", time.perf_counter() - started)
+            with self._lock:
+                self._flights.pop(key, None)
+        return body
+
+    def _store(self, key: str, body: bytes, ttl: float) -> None:
+        """Cache a body, discarding expired bodies and then the oldest if the cache is full."""
+        now = time.monotonic()
+        with self._lock:
+            self._cache.pop(key, None)
+            self._cache[key] = (now + ttl, body)
+            if len(self._cache) > self.size:
+                for stale in [name for name, (expires, _) in self._cache.items() if expires <= now]:
+                    del self._cache[stale]
+            while len(self._cache) > self.size:
+                del self._cache[next(iter(self._cache))]
+
+    def _relay(self, api, path: str) -> bytes:
+        """Fetch a REST API response, pointing its next and previous links at the gateway."""
+        body = self.client.relay(api, path)
+        return body.replace(f"{self.client.rest_url}/".encode(), f"{self.url}/".encode())
+
+    @staticmethod
+    def _days(query: dict, default: int) -> int:
+        try:
+            days = int(query.get("days", [default])[0])
+        except ValueError as err:
+            raise GatewayError(400, "days must be a whole number") from err
+        if not 0 < days <= 3660:
+            raise GatewayError(400, "days must be between 1 and 3660")
+        return days
+
+    def _current_price(self, query: dict):
+        # The rates overlapping the next half hour, rather than the client's period, which is fixed
+        now = datetime.now(timezone.utc)
+        rates = self.client.fetch(plan.Dataset.IMPORT_RATES, since=now, until=now + timedelta(minutes=30))
+        for entry in rates:
+            if entry.valid_from <= now and (entry.valid_to is None or now < entry.valid_to):
+                return {"value_inc_vat": entry.value_inc_vat}
+        return {"value_inc_vat": None}
+
+    def _rates_today(self, query: dict):
+        today = datetime.now(LONDON).date()
+        start = datetime(today.year, today.month, today.day, tzinfo=LONDON)
+        end = datetime.combine(today + timedelta(days=1), datetime.min.time(), LONDON)
+        return self.client.fetch(plan.Dataset.IMPORT_RATES, since=start, until=end)
+
+    def _daily_cost(self, query: dict):
+        days = self._days(query, 7)
+        return self.client.collect(plan.CollectionPlan().add(plan.Output.DAILY_COST, days))[plan.Output.DAILY_COST]
+
+    def _bill(self, query: dict):
+        days = self._days(query, 30)
+        gas_units = query.get("gas_units", ["kWh"])[0]
+        if gas_units not in ("kWh", "m3"):
+            raise GatewayError(400, "gas_units must be kWh or m3")
+        result = self.client.get_bill(days, gas_units=gas_units)
+        return {"days": result.days, "months": result.months, "total": result.total}
+
+    def get(self, target: str) -> tuple:
+        """Return the status, content type and body for a request.
+
+        Args:
+            target (str): The path and query string requested
+        """
+        parts = urlsplit(target)
+        self._count(f"route:{parts.path}" if parts.path in self._views or parts.path == "/metrics" else "route:api")
+        if parts.path == "/metrics":
+            return 200, "text/plain; version=0.0.4", self.metrics().encode()
+        view = self._views.get(parts.path)
+        if view is not None:
+            query = parse_qs(parts.query)
+            return 200, "application/json", self.read(
+                target, self.ttl, lambda: json.dumps(plain(view(query))).encode())
+        for pattern, api in ROUTES:
+            if pattern.fullmatch(parts.path):
+                path = parts.path if parts.path.endswith("/") else f"{parts.path}/"
+                path = f"{path}?{parts.query}" if parts.query else path
+                ttl = self.slow_ttl if api.value.conditional else self.ttl
+                return 200, "application/json", self.read(path, ttl, lambda: self._relay(api, path))
+        raise GatewayError(404, f"Unknown path {parts.path}")
+
+    def metrics(self) -> str:
+        """Return the counters in the Prometheus text format."""
+        with self._lock:
+            counters = dict(self.counters)
+            entries = len(self._cache)
+            flights = len(self._flights)
+        lines = ["# TYPE octopus_gateway_requests_total counter"]
+        lines += [f'octopus_gateway_requests_total{{route="{name[6:]}"}} {value}'
+                  for name, value in sorted(counters.items()) if name.startswith("route:")]
+        for name in ("cache_hits", "cache_misses", "coalesced", "upstream_requests", "upstream_errors"):
+            lines += [f"# TYPE octopus_gateway_{name}_total counter",
+                      f"octopus_gateway_{name}_total {counters.get(name, 0)}"]
+        lines += ["# TYPE octopus_gateway_upstream_seconds_total counter",
+                  f"octopus_gateway_upstream_seconds_total {counters.get('upstream_seconds', 0):.6f}",
+                  "# TYPE octopus_gateway_cache_entries gauge", f"octopus_gateway_cache_entries {entries}",
+                  "# TYPE octopus_gateway_in_flight gauge", f"octopus_gateway_in_flight {flights}"]
+        responses = self.client._responses  # pylint: disable=protected-access
+        if responses is not None:
+            for name in ("not_modified", "unchanged", "changed"):
+                lines += [f"# TYPE octopus_client_responses_{name}_total counter",
+                          f"octopus_client_responses_{name}_total {getattr(responses, name)}"]
+        return "\n".join(lines) + "\n"
+
+    def _handler(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Handles GET requests."""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                try:
+                    status, content_type, body = gateway.get(self.path)
+                except GatewayError as err:
+                    status, content_type, body = err.status, "application/json", err
+                except requests.exceptions.HTTPError as err:
+                    status = err.response.status_code if err.response is not None else 502
+                    content_type, body = "application/json", err
+                except (requests.exceptions.RequestException, OctopusError) as err:
+                    status, content_type, body = 502, "application/json", err
+                except Exception:  # pylint: disable=broad-except
+                    # Anything else is a fault in the gateway, which is logged rather than dropping the connection
+                    gateway.logger.exception("Failed to serve %s", self.path)
+                    status, content_type, body = 500, "application/json", "Internal server error"
+                if status != 200:
+                    body = json.dumps({"detail": str(body)}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
@@ -0,0 +1,210 @@
+"""A client for the Kraken GraphQL API, used for live telemetry from a smart meter Home Mini.
+
+The REST consumption endpoints are a day behind, while the GraphQL API returns the readings sent
+by a Home Mini within seconds. Requests are authorised with a token obtained from the API key,
+which is refreshed with the refresh token shortly before it expires. Readings are returned as
+usagedata entries so that they take the same path into the store and InfluxDB as REST data."""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from octopusapi import frames
+from octopusapi.api import OctopusError
+from octopusapi.const import GraphQLList, Kraken, TelemetryGrouping, usagedata
+
+# Kraken error codes for a token which has expired or is not valid
+TOKEN_ERRORS = {"KT-CT-1124", "KT-CT-1139"}
+
+# Tokens are refreshed this long before they expire
+TOKEN_MARGIN = 60
+
+# The most telemetry readings requested at once, longer periods are requested a page at a time
+TELEMETRY_PAGE = 360
+
+
+class KrakenClient:
+    """Client for the Kraken GraphQL API.
+
+    Args:
+        apikey (str): The apikey for the Octopus account
+        account (str): The account number
+        url (str, optional): The GraphQL URL, for example a local stand-in. Defaults to the Octopus API.
+        session (requests.Session, optional): A session to share with other clients. Defaults to a new one.
+        limiter (optional): A ratelimit.TokenBucket shared with other clients. Defaults to None.
+    """
+
+    def __init__(self, apikey: str, account: str, url: str = None, session: requests.Session = None,
+                 limiter=None) -> None:
+        if apikey is None:
+            raise OctopusError("The GraphQL API requires an API key.")
+        self.logger = logging.getLogger(__name__)
+        self._api = Kraken
+        self._url = url or self._api.url
+        self._apikey = apikey
+        self._account = account
+        self._session = session or requests.Session()
+        self._limiter = limiter
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires = 0
+        self._refresh_token = None
+        self._refresh_expires = 0
+
+    def _post(self, document: str, variables: dict, token: str = None) -> dict:
+        """Post a GraphQL document and return the JSON response."""
+        if self._limiter is not None:
+            self._limiter.acquire()
+        headers = {self._api.header: token} if token else {}
+        try:
+            response = self._session.post(self._url, json={"query": document, "variables": variables},
+                                          headers=headers, timeout=60)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as err:
+            self.logger.error("Requests error encountered: %s", err)
+            raise err
+
+    def _authorise(self) -> str:
+        """Return a valid token, refreshing it or obtaining a new one if it is about to expire."""
+        with self._lock:
+            now = time.time()
+            if self._token is not None and now < self._expires - TOKEN_MARGIN:
+                return self._token
+            attempts = [{"APIKey": self._apikey}]
+            if self._refresh_token is not None and now < self._refresh_expires - TOKEN_MARGIN:
+                # A refresh token which has been revoked is replaced by logging in with the API key
+                attempts.insert(0, {"refreshToken": self._refresh_token})
+            operation = self._api.token
+            for credentials in attempts:
+                self.logger.info("%s Kraken token", "Refreshing" if "refreshToken" in credentials else "Obtaining")
+                response = self._post(operation.document, {"input": credentials})
+                if not response.get("errors"):
+                    break
+            else:
+                raise OctopusError(f"Unable to obtain a Kraken token: {self._messages(response)}")
+            token = operation.response.parse_kwargs(self, operation.response, **response["data"][operation.root])
+            self._token = token.token
+            self._expires = (token.payload or {}).get("exp", now + 3600)
+            self._refresh_token = token.refresh_token
+            self._refresh_expires = token.refresh_expires_in or 0
+            return self._token
+
+    @staticmethod
+    def _messages(response: dict) -> str:
+        return "; ".join(error.get("message", "") for error in response.get("errors", []))
+
+    def execute(self, operation: GraphQLList, **variables):
+        """Run a GraphQL operation and return its result, parsed if the operation has a response dataclass.
+
+        A token which is rejected as expired is replaced and the operation is tried once more.
+        """
+        operation = operation.value
+        for attempt in range(2):
+            token = self._authorise() if operation.auth else None
+            response = self._post(operation.document, variables, token)
+            errors = response.get("errors") or []
+            codes = {error.get("extensions", {}).get("errorCode") for error in errors}
+            if errors and codes & TOKEN_ERRORS and attempt == 0:
+                with self._lock:
+                    self._token = None
+                continue
+            if errors:
+                raise OctopusError(f"GraphQL {operation.root} failed: {self._messages(response)}")
+            break
+        result = response["data"][operation.root]
+        if operation.response is None:
+            return result
+        if isinstance(result, list):
+            return [operation.response.parse_kwargs(self, operation.response, **entry) for entry in result]
+        return operation.response.parse_kwargs(self, operation.response, **result)
+
+    def devices(self) -> list:
+        """Return the device ids of every smart meter device on the account's electricity meters."""
+        account = self.execute(GraphQLList.SmartDevices, accountNumber=self._account) or {}
+        return [device["device_id"]
+                for agreement in account.get("electricity_agreements") or []
+                for meter in (agreement.get("meter_point") or {}).get("meters") or []
+                for device in meter.get("smart_devices") or []]
+
+    def telemetry(self, device: str, start: datetime = None, end: datetime = None,
+                  grouping: TelemetryGrouping = None) -> list:
+        """Return the telemetry readings from a device, or its latest reading if no start is given.
+
+        Kraken returns a limited number of readings for each request, so a longer period is
+        requested as consecutive windows of TELEMETRY_PAGE readings.
+
+        Args:
+            device (str): The device id
+            start (datetime, optional): The start of the readings. Defaults to None.
+            end (datetime, optional): The end of the readings. Defaults to now.
+            grouping (TelemetryGrouping, optional): The interval readings are grouped into. Defaults to None.
+
+        Returns:
+            list: telemetry entries in time order
+        """
+        variables = {"deviceId": device}
+        if grouping is not None:
+            variables["grouping"] = TelemetryGrouping(grouping).name
+        if start is None:
+            return sorted(self.execute(GraphQLList.SmartMeterTelemetry, **variables) or [],
+                          key=lambda entry: entry.read_at)
+        end = end or datetime.now(timezone.utc)
+        window = timedelta(seconds=TELEMETRY_PAGE * TelemetryGrouping(grouping or TelemetryGrouping.TEN_SECONDS).value)
+        readings = {}
+        while start < end:
+            stop = min(start + window, end)
+            page = self.execute(GraphQLList.SmartMeterTelemetry, start=start.astimezone(timezone.utc).isoformat(),
+                                end=stop.astimezone(timezone.utc).isoformat(), **variables) or []
+            # A reading on the boundary between windows is returned by both
+            readings.update((entry.read_at, entry) for entry in page)
+            start = stop
+        return [readings[read_at] for read_at in sorted(readings)]
+
+    def readings(self, device: str, since: datetime = None,
+                 grouping: TelemetryGrouping = TelemetryGrouping.ONE_MINUTE) -> list:
+        """Return the consumption in each interval after since as usagedata entries in kWh.
+
+        Args:
+            device (str): The device id
+            since (datetime, optional): Only intervals starting after this time. Defaults to the last hour.
+            grouping (TelemetryGrouping, optional): The length of each interval. Defaults to one minute.
+        """
+        grouping = TelemetryGrouping(grouping)
+        start = since or datetime.now(timezone.utc) - timedelta(hours=1)
+        length = timedelta(seconds=grouping.value)
+        return frames.ConsumptionList(
+            usagedata(consumption=round((entry.consumption_delta or 0) / 1000, 6),
+                      interval_start=entry.read_at.isoformat(),
+                      interval_end=(entry.read_at + length).isoformat())
+            for entry in self.telemetry(device, start, grouping=grouping)
+            if since is None or entry.read_at > since)
+
+    def poll(self, device: str, cadence: timedelta = timedelta(seconds=30), since: datetime = None,
+             grouping: TelemetryGrouping = TelemetryGrouping.TEN_SECONDS, stop: threading.Event = None):
+        """Poll a device and yield the readings which have arrived since the previous poll.
+
+        Args:
+            device (str): The device id
+            cadence (timedelta, optional): The time between polls. Defaults to 30 seconds.
+            since (datetime, optional): Yield readings after this time first. Defaults to the last hour.
+            grouping (TelemetryGrouping, optional): The length of each interval. Defaults to ten seconds.
+            stop (threading.Event, optional): Set to end polling. Defaults to polling forever.
+
+        Yields:
+            list: The new usagedata entries, which may be empty
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            readings = self.readings(device, since, grouping)
+            if readings:
+                since = readings[-1].interval_start
+            yield readings
+            stop.wait(cadence.total_seconds())
+
+    def close(self) -> None:
+        """Close the requests session."""
+        self._session.close()
@@ -0,0 +1,139 @@
+"""Merge pages of results into a single ordered stream without duplicates.
+
+Octopus list endpoints are paginated and a page is only fetched once the previous one has been
+read. If readings are published between two page fetches the rows shift, so the first rows of a
+page can repeat the end of the previous page. Results are ordered by the interval_start of
+consumption or the valid_from of rates, so repeats can be removed and the order checked while
+streaming by remembering only the last time seen and the rows seen at that time. Rates for
+different payment methods share a valid_from, so the natural key of a rate also includes its
+payment_method."""
+
+import heapq
+from datetime import datetime, timezone
+from typing import Callable, Iterable
+
+import ciso8601
+
+from octopusapi.const import Order
+
+# The time each kind of result is ordered by, in the order they are looked for
+KEYS = ("interval_start", "valid_from")
+# The fields which tell apart results with the same time, such as direct debit and other rates
+DISTINCT = ("payment_method",)
+
+# Rates with no valid_from apply from the beginning of time
+_EARLIEST = datetime.min.replace(tzinfo=timezone.utc)
+
+
+class OrderError(ValueError):
+    """Raised when results are not in the order expected."""
+
+
+def instant(value) -> datetime:
+    """Return a comparable time for a key which may be a datetime, an ISO 8601 string or None."""
+    if value is None:
+        return _EARLIEST
+    if isinstance(value, str):
+        value = ciso8601.parse_datetime(value)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def distinct(row) -> tuple:
+    """Return the fields which tell apart a raw or parsed result from others with the same time."""
+    if isinstance(row, dict):
+        return tuple(row.get(name) for name in DISTINCT)
+    return tuple(getattr(row, name, None) for name in DISTINCT)
+
+
+def row_key(results: list) -> Callable | None:
+    """Return a function giving the natural key of the raw JSON results passed, or None if they have none."""
+    name = next((name for name in KEYS if results and name in results[0]), None)
+    return None if name is None else lambda row: row[name]
+
+
+def attribute_key(entry) -> Callable | None:
+    """Return a function giving the natural key of parsed results like the one passed, or None if they have none."""
+    name = next((name for name in KEYS if hasattr(entry, name)), None)
+    return None if name is None else lambda row: getattr(row, name)
+
+
+class OrderedMerge:
+    """Removes repeated rows from successive pages and checks the rows are in order.
+
+    Args:
+        order (Order, optional): The order the rows should be in. Defaults to inferring it from
+            the first two rows with different keys.
+        key (Callable, optional): Returns the natural key of a row. Defaults to finding it from the first page.
+    """
+
+    def __init__(self, order: Order = None, key: Callable = None) -> None:
+        self.order = order
+        self.key = key
+        self.rows = 0
+        self.duplicates = 0
+        self._last = None
+        self._seen = set()
+
+    def _accept(self, row, page_start: bool) -> bool:
+        """Return whether a row is new, raising OrderError if it is out of order."""
+        value = instant(self.key(row))
+        fields = distinct(row)
+        last = self._last
+        if last is not None and value == last:
+            # Only a row with the whole natural key of one already seen is a repeat
+            if fields in self._seen:
+                self.duplicates += 1
+                return False
+        elif last is not None:
+            if self.order is None:
+                self.order = Order.FORWARD if value > last else Order.BACKWARD
+            if (value < last) == (self.order is Order.FORWARD):
+                # A shifted page starts with rows from before the end of the previous page
+                if page_start:
+                    self.duplicates += 1
+                    return False
+                raise OrderError(f"Result at {value.isoformat()} is out of order after {last.isoformat()}")
+            self._seen = set()
+        self._last = value
+        self._seen.add(fields)
+        self.rows += 1
+        return True
+
+    def page(self, results: list) -> list:
+        """Return the rows of the next page which have not been seen before."""
+        if self.key is None:
+            self.key = row_key(results)
+        if self.key is None:
+            return results
+        merged = []
+        for row in results:
+            if self._accept(row, page_start=not merged):
+                merged.append(row)
+        return merged
+
+    def stream(self, rows: Iterable):
+        """Yield the rows of an ordered stream which have not been seen before."""
+        for row in rows:
+            if self.key is None:
+                self.key = attribute_key(row)
+            if self.key is None or self._accept(row, page_start=False):
+                yield row
+
+
+def merge_streams(streams: list, order: Order):
+    """Merge several streams of parsed results, each already in order, into one stream without repeats.
+
+    Args:
+        streams (list): Iterables of parsed results, each in the same order
+        order (Order): The order of the results
+
+    Yields:
+        The results in order
+    """
+    streams = [list(stream) for stream in streams]
+    first = next((stream[0] for stream in streams if stream), None)
+    if first is None:
+        return
+    key = attribute_key(first)
+    merged = heapq.merge(*streams, key=lambda row: instant(key(row)), reverse=order is Order.BACKWARD)
+    yield from OrderedMerge(order, key).stream(merged)
@@ -0,0 +1,152 @@
+"""Collection plans describing the outputs required from a single collector run.
+
+A plan lists the derived outputs needed and how many days each should cover. The datasets
+required by every output are merged so that each endpoint is only queried once, for the longest
+window any output needs, and all of the outputs are then derived from the shared data."""
+
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from enum import Enum
+from typing import TYPE_CHECKING
+
+from octopusapi import frames, pricing
+from octopusapi.aggregate import LONDON
+from octopusapi.const import Group
+
+if TYPE_CHECKING:
+    from octopusapi import bill
+
+
+class Output(Enum):
+    DAILY_COST = "daily_cost"
+    DAILY_GAIN = "daily_gain"
+    PEAK_SPLIT = "peak_split"
+    MONTHLY_TOTALS = "monthly_totals"
+    BILL = "bill"
+
+
+class Dataset(Enum):
+    IMPORT_CONSUMPTION = "import_consumption"
+    EXPORT_CONSUMPTION = "export_consumption"
+    GAS_CONSUMPTION = "gas_consumption"
+    IMPORT_RATES = "import_rates"
+    EXPORT_RATES = "export_rates"
+    IMPORT_STANDING_CHARGES = "import_standing_charges"
+    GAS_RATES = "gas_rates"
+    GAS_STANDING_CHARGES = "gas_standing_charges"
+
+
+# The datasets which must be fetched to derive each output
+REQUIREMENTS = {
+    Output.DAILY_COST: (Dataset.IMPORT_CONSUMPTION, Dataset.IMPORT_RATES, Dataset.IMPORT_STANDING_CHARGES),
+    Output.DAILY_GAIN: (Dataset.EXPORT_CONSUMPTION, Dataset.EXPORT_RATES),
+    Output.PEAK_SPLIT: (Dataset.IMPORT_CONSUMPTION, Dataset.IMPORT_RATES),
+    Output.MONTHLY_TOTALS: (Dataset.IMPORT_CONSUMPTION, Dataset.EXPORT_CONSUMPTION, Dataset.GAS_CONSUMPTION),
+    Output.BILL: tuple(Dataset),
+}
+
+
+def _since(entries: list, start: date) -> list:
+    """Return the consumption entries which start on or after a UK date."""
+    return [entry for entry in entries if entry.interval_start.astimezone(LONDON).date() >= start]
+
+
+def _daily_price(rates: list, consumption: list, start: date) -> dict:
+    """Return the price per day of the consumption passed."""
+    cost = pricing.priced_days(_since(consumption, start), rates)
+    return frames.CostDict(sorted((day, round(priced, 3)) for day, (_, priced) in cost.items()))
+
+
+def _daily_cost(data: dict, start: date) -> dict:
+    cost = _daily_price(data[Dataset.IMPORT_RATES], data[Dataset.IMPORT_CONSUMPTION], start)
+    charges = pricing.daily_standing_charge(data[Dataset.IMPORT_STANDING_CHARGES], cost)
+    return frames.CostDict({day: cost[day] + charges.get(day, 0) for day in cost})
+
+
+def _daily_gain(data: dict, start: date) -> dict:
+    return _daily_price(data[Dataset.EXPORT_RATES], data[Dataset.EXPORT_CONSUMPTION], start)
+
+
+def _peak_split(data: dict, start: date) -> dict:
+    from octopusapi import aggregate, schedule  # pylint: disable=import-outside-toplevel
+    classify = schedule.infer(data[Dataset.IMPORT_RATES]).classify
+    return aggregate.rollup_all(_since(data[Dataset.IMPORT_CONSUMPTION], start), (Group.DAY, Group.MONTH), classify)
+
+
+def _monthly_totals(data: dict, start: date) -> dict:
+    from octopusapi import aggregate  # pylint: disable=import-outside-toplevel
+    return {dataset: aggregate.rollup(_since(data[dataset], start), Group.MONTH)
+            for dataset in REQUIREMENTS[Output.MONTHLY_TOTALS]}
+
+
+def _bill(data: dict, start: date, gas_conversion: float = 1.0) -> "bill.Bill":
+    from octopusapi import bill  # pylint: disable=import-outside-toplevel
+    return bill.build(start, date.today() - timedelta(days=1),
+                      data[Dataset.IMPORT_CONSUMPTION], data[Dataset.IMPORT_RATES], data[Dataset.IMPORT_STANDING_CHARGES],
+                      data[Dataset.EXPORT_CONSUMPTION], data[Dataset.EXPORT_RATES],
+                      data[Dataset.GAS_CONSUMPTION], data[Dataset.GAS_RATES], data[Dataset.GAS_STANDING_CHARGES],
+                      gas_conversion)
+
+
+DERIVATIONS = {
+    Output.DAILY_COST: _daily_cost,
+    Output.DAILY_GAIN: _daily_gain,
+    Output.PEAK_SPLIT: _peak_split,
+    Output.MONTHLY_TOTALS: _monthly_totals,
+    Output.BILL: _bill,
+}
+
+
+@dataclass
+class CollectionPlan:
+    """The outputs required from a collector run and the number of days each should cover.
+
+    Attributes:
+        outputs: The number of days, ending today, required for each output
+        gas_units: "kWh", or "m3" for a SMETS2 gas meter which reports volume
+        calorific_value: The gas calorific value in MJ/m3, None for bill.GAS_CALORIFIC_VALUE
+    """
+
+    outputs: dict = field(default_factory=dict)
+    gas_units: str = "kWh"
+    calorific_value: float = None
+
+    def add(self, output: Output | str, days: int = 7) -> "CollectionPlan":
+        """Add an output to the plan, returning the plan so that calls can be chained."""
+        output = Output(output)
+        self.outputs[output] = max(days, self.outputs.get(output, 0))
+        return self
+
+    @property
+    def gas_conversion(self) -> float:
+        """The factor converting gas consumption to kWh, as used by get_bill."""
+        from octopusapi import bill  # pylint: disable=import-outside-toplevel
+        if self.calorific_value is None:
+            return bill.gas_factor(self.gas_units)
+        return bill.gas_factor(self.gas_units, self.calorific_value)
+
+    @property
+    def fetches(self) -> dict:
+        """The datasets needed by the plan and the number of days of each which must be fetched."""
+        fetches = {}
+        for output, days in self.outputs.items():
+            for dataset in REQUIREMENTS[output]:
+                fetches[dataset] = max(days, fetches.get(dataset, 0))
+        return fetches
+
+    def derive(self, data: dict) -> dict:
+        """Derive every output in the plan from the fetched datasets.
+
+        Args:
+            data (dict): The entries fetched for each Dataset
+
+        Returns:
+            dict: The result for each Output
+        """
+        today = date.today()
+        derived = {}
+        for output, days in self.outputs.items():
+            # Only the bill prices gas, which is converted from the units the meter reports
+            options = {"gas_conversion": self.gas_conversion} if output is Output.BILL else {}
+            derived[output] = DERIVATIONS[output](data, today - timedelta(days=days), **options)
+        return derived
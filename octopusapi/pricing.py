@@ -0,0 +1,248 @@
+"""Pricing of half hourly consumption against unit rates."""
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime, time, timedelta, timezone
+
+from octopusapi.aggregate import LONDON
+from octopusapi.const import PriceType, Rate
+
+# The Economy 7 night register usually runs for seven hours from 00:30 GMT
+NIGHT = (time(0, 30), time(7, 30))
+
+# A unit rate produced by combining day and night rates, with the register it applies to
+RegisterRate = namedtuple("RegisterRate", ["valid_from", "valid_to", "value_exc_vat", "value_inc_vat",
+                                           "payment_method", "register"])
+
+# A unit rate with only the fields needed to price consumption against it
+_Span = namedtuple("_Span", ["valid_from", "valid_to", "value_inc_vat"])
+
+_EARLIEST = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def priced_days(consumption, rates, factor: float = 1.0) -> dict:
+    """Return the consumption and its cost for each UK day, walking the consumption and rates together.
+
+    Every daily figure is attributed to the local day an interval starts on, so the half hours
+    from 23:00 to 00:00 UTC during British Summer Time count towards the following day.
+
+    Args:
+        consumption (Iterable): Consumption entries with interval_start and consumption
+        rates (Iterable): Unit rates with valid_from, valid_to and value_inc_vat
+        factor (float, optional): Converts the consumption to kWh. Defaults to 1.0.
+
+    Returns:
+        dict: (kWh, pence) tuples keyed by date
+    """
+    entries = sorted(consumption, key=lambda entry: entry.interval_start)
+    ordered = sorted(rates, key=lambda entry: entry.valid_from or _EARLIEST)
+    totals = {}
+    index = 0
+    day = day_end = None
+    amount = cost = 0.0
+    for entry in entries:
+        start = entry.interval_start
+        # Only convert to local time when an interval falls outside the current day
+        if day_end is None or start >= day_end:
+            if day_end is not None:
+                totals[day] = (amount, cost)
+            day = start.astimezone(LONDON).date()
+            next_day = day + timedelta(days=1)
+            day_end = datetime(next_day.year, next_day.month, next_day.day, tzinfo=LONDON)
+            amount, cost = totals.get(day, (0.0, 0.0))
+        while index + 1 < len(ordered) and (ordered[index + 1].valid_from or _EARLIEST) <= start:
+            index += 1
+        value = entry.consumption * factor
+        amount += value
+        if ordered:
+            rate = ordered[index]
+            if (rate.valid_from or _EARLIEST) <= start and (rate.valid_to is None or start < rate.valid_to):
+                cost += value * rate.value_inc_vat
+    if day_end is not None:
+        totals[day] = (amount, cost)
+    return totals
+
+
+def daily_cost(rates: dict, amount: dict) -> dict:
+    """Calculate the cost per UK day of consumption.
+
+    Args:
+        rates (dict): Unit rates keyed by the time they are valid from
+        amount (dict): Consumption entries keyed by interval start
+
+    Returns:
+        dict: The cost for each date
+    """
+    starts = sorted(rates)
+    # Each rate applies until the next one starts
+    spans = [_Span(start, end, rates[start]) for start, end in zip(starts, starts[1:] + [None])]
+    return {day: round(cost, 3) for day, (_, cost) in priced_days(amount.values(), spans).items()}
+
+
+def price_ranges(data: list) -> dict:
+    """Return a dict of prices broken down into peak/offpeak and standard.
+
+    Args:
+        data (list): Unit rates as returned by the standard unit rates endpoint
+    """
+    price_list = []
+    price_dict = {}
+    within_date = False
+    for entry in data:
+        # Collect the prices for each date
+        if (entry.valid_to.date() == entry.valid_from.date()):
+            if entry.value_inc_vat not in price_list:
+                price_list.append(entry.value_inc_vat)
+            within_date = True
+        else:
+            if (within_date is False):
+                continue
+            if entry.value_inc_vat not in price_list:
+                price_list.append(entry.value_inc_vat)
+            price_list.sort()
+            # Set the price labels depending on if we have 1, 2 or 3 prices per day
+            if len(price_list) == 1:
+                price_dict[price_list[0]] = PriceType.STANDARD
+            elif len(price_list) == 2:
+                price_dict[price_list[0]] = PriceType.OFFPEAK
+                price_dict[price_list[1]] = PriceType.PEAK
+            elif len(price_list) == 3:
+                price_dict[price_list[0]] = PriceType.OFFPEAK
+                price_dict[price_list[1]] = PriceType.STANDARD
+                price_dict[price_list[2]] = PriceType.PEAK
+            elif len(price_list) == 4:
+                price_dict[price_list[0]] = PriceType.OFFPEAK
+                price_dict[price_list[1]] = PriceType.OFFPEAK
+                price_dict[price_list[2]] = PriceType.PEAK
+                price_dict[price_list[3]] = PriceType.PEAK
+            # Then reset the price list and start for the new date
+            price_list = []
+            if entry.value_inc_vat not in price_list:
+                price_list.append(entry.value_inc_vat)
+    return price_dict
+
+
+def _value_at(rates: list, starts: list, when: datetime):
+    """Return the rate in a list sorted by valid_from which applies at a time, or None."""
+    index = bisect_right(starts, when) - 1
+    if index < 0 or (rates[index].valid_to is not None and rates[index].valid_to <= when):
+        return None
+    return rates[index]
+
+
+def register_rates(day: list, night: list, start: datetime, end: datetime,
+                   night_window: tuple = NIGHT) -> list:
+    """Combine Economy 7 day and night unit rates into a single series of time of use rates.
+
+    The series switches between the night and day rate at the start and end of the night window
+    each day, and at every change in either rate, so it can be priced exactly like a standard or
+    Agile series by any of the pricing functions.
+
+    Args:
+        day (list): The day unit rates
+        night (list): The night unit rates
+        start (datetime): The start of the period required
+        end (datetime): The end of the period required
+        night_window (tuple, optional): The UTC start and end times of the night register. Defaults to NIGHT.
+
+    Returns:
+        list: RegisterRate entries in time order
+    """
+    earliest = datetime.min.replace(tzinfo=timezone.utc)
+    registers = {}
+    for register, rates in ((Rate.ECO7_DAY, day), (Rate.ECO7_NIGHT, night)):
+        ordered = sorted(rates, key=lambda entry: entry.valid_from or earliest)
+        registers[register] = (ordered, [entry.valid_from or earliest for entry in ordered])
+    # The series changes at every register switch and at every change of rate
+    bounds = {start, end}
+    day_start = datetime.combine(start.astimezone(timezone.utc).date() - timedelta(days=1), time(), timezone.utc)
+    while day_start < end:
+        bounds.update(day_start + timedelta(hours=switch.hour, minutes=switch.minute) for switch in night_window)
+        day_start += timedelta(days=1)
+    for rates, _ in registers.values():
+        bounds.update(when for entry in rates for when in (entry.valid_from, entry.valid_to)
+                      if when is not None and start < when < end)
+    bounds = sorted(when for when in bounds if start <= when <= end)
+    night_start, night_end = night_window
+    series = []
+    for lower, upper in zip(bounds, bounds[1:]):
+        clock = lower.astimezone(timezone.utc).time()
+        is_night = (night_start <= clock < night_end) if night_start < night_end else not night_end <= clock < night_start
+        register = Rate.ECO7_NIGHT if is_night else Rate.ECO7_DAY
+        entry = _value_at(*registers[register], lower)
+        if entry is None:
+            continue
+        previous = series[-1] if series else None
+        if (previous is not None and previous.valid_to == lower and previous.register is register
+                and previous.value_inc_vat == entry.value_inc_vat):
+            series[-1] = previous._replace(valid_to=upper)
+        else:
+            series.append(RegisterRate(lower, upper, entry.value_exc_vat, entry.value_inc_vat,
+                                       entry.payment_method, register))
+    return series
+
+
+def daily_standing_charge(charges: list, days) -> dict:
+    """Return the standing charge applying on each of the days passed.
+
+    The charge for a day is the one valid at the start of the day in UK time, which is when
+    standing charges change. Days without a charge are left out.
+
+    Args:
+        charges (list): Standing charges as returned by the standing charges endpoint
+        days (Iterable): The dates required
+    """
+    earliest = datetime.min.replace(tzinfo=timezone.utc)
+    ordered = sorted(charges, key=lambda entry: entry.valid_from or earliest)
+    starts = [entry.valid_from or earliest for entry in ordered]
+    result = {}
+    for day in days:
+        entry = _value_at(ordered, starts, datetime(day.year, day.month, day.day, tzinfo=LONDON))
+        if entry is not None:
+            result[day] = entry.value_inc_vat
+    return result
+
+
+class ConsumptionSeries:
+    """Half hourly consumption prepared once so it can be priced against many sets of rates.
+
+    Args:
+        consumption (list): Consumption entries with interval_start and consumption
+    """
+
+    def __init__(self, consumption: list) -> None:
+        entries = sorted(consumption, key=lambda entry: entry.interval_start)
+        self.starts = [entry.interval_start for entry in entries]
+        # Cumulative consumption so that the total for any range of intervals is a single subtraction
+        self.cumulative = [0.0]
+        for entry in entries:
+            self.cumulative.append(self.cumulative[-1] + entry.consumption)
+        self.days = sorted({start.astimezone(LONDON).date() for start in self.starts})
+
+    @property
+    def total(self) -> float:
+        """The total consumption."""
+        return self.cumulative[-1]
+
+    def cost(self, rates: list) -> tuple:
+        """Price the consumption against a set of unit rates.
+
+        Each rate is applied to the range of intervals it covers using the cumulative consumption,
+        so the work done depends on the number of rates rather than the number of intervals.
+
+        Args:
+            rates (list): Unit rates with valid_from, valid_to and value_inc_vat
+
+        Returns:
+            tuple: The cost and the consumption which was covered by a rate
+        """
+        cost = 0
+        covered = 0
+        for entry in rates:
+            first = 0 if entry.valid_from is None else bisect_left(self.starts, entry.valid_from)
+            last = len(self.starts) if entry.valid_to is None else bisect_left(self.starts, entry.valid_to)
+            if last > first:
+                amount = self.cumulative[last] - self.cumulative[first]
+                cost += amount * entry.value_inc_vat
+                covered += amount
+        return cost, covered
@@ -0,0 +1,39 @@
+"""A token bucket limiting the rate of requests made to the Octopus API.
+
+Concurrent and sharded fetches can issue many requests at once. Every request takes a token
+from a shared bucket which refills at a fixed rate, so bursts are allowed up to the size of the
+bucket while the long term rate never exceeds the limit, however many threads are fetching."""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """A thread safe token bucket.
+
+    Args:
+        rate (float): The number of tokens added each second
+        burst (int, optional): The most tokens the bucket holds. Defaults to 1.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        if rate <= 0:
+            raise ValueError("The rate limit must be greater than zero.")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Wait until a token is available and take it, returning the time waited in seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now, going into debt if necessary, so that waiting threads queue in order
+            self._tokens -= 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,278 @@
+"""Rolling statistics for half hourly consumption, updated as each new interval arrives.
+
+Baseload, rolling averages and peak demand are usually worked out by reading back the whole
+window after every load. Here each meter keeps the intervals of its windows in deques together
+with a running total, and monotonic deques which hold only the intervals which can still become
+the minimum or maximum of a window. Each new interval is added and the intervals which have left
+the window are dropped in constant time on average, so the statistics never recompute history.
+
+The state is checkpointed with to_dict() and restored with from_dict(), so a script which runs
+every day only has to feed in the intervals since its last run."""
+
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta, timezone
+from typing import Iterable
+
+from octopusapi.aggregate import LONDON
+
+SLOT = timedelta(minutes=30)
+_SECONDS = int(SLOT.total_seconds())
+_DAY = 86400
+
+
+def _epoch(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _datetime(value: int) -> datetime:
+    return datetime.fromtimestamp(value, timezone.utc)
+
+
+class RollingWindow:
+    """The total, minimum and maximum of the intervals in a sliding window of time.
+
+    Intervals must be pushed in time order.
+
+    Args:
+        span (int): The length of the window in seconds
+    """
+
+    __slots__ = ("span", "total", "_entries", "_low", "_high")
+
+    def __init__(self, span: int) -> None:
+        self.span = span
+        self.total = 0.0
+        self._entries = deque()
+        # Candidates for the minimum and maximum, with values increasing and decreasing from the front
+        self._low = deque()
+        self._high = deque()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def push(self, start: int, value: float) -> None:
+        """Add an interval and drop the intervals which are no longer in the window.
+
+        Args:
+            start (int): The start of the interval in seconds since the epoch
+            value (float): The consumption in the interval
+        """
+        self._entries.append((start, value))
+        self.total += value
+        while self._low and self._low[-1][1] >= value:
+            self._low.pop()
+        self._low.append((start, value))
+        while self._high and self._high[-1][1] <= value:
+            self._high.pop()
+        self._high.append((start, value))
+        self.expire(start)
+
+    def expire(self, start: int) -> None:
+        """Drop the intervals which start a whole span or more before an interval starting at start."""
+        cutoff = start - self.span
+        entries = self._entries
+        while entries and entries[0][0] <= cutoff:
+            self.total -= entries.popleft()[1]
+        while self._low and self._low[0][0] <= cutoff:
+            self._low.popleft()
+        while self._high and self._high[0][0] <= cutoff:
+            self._high.popleft()
+        if not entries:
+            # Restart the total so that rounding errors from the running sum cannot build up
+            self.total = 0.0
+
+    @property
+    def minimum(self) -> tuple | None:
+        """The start and value of the smallest interval in the window, or None if it is empty."""
+        return self._low[0] if self._low else None
+
+    @property
+    def maximum(self) -> tuple | None:
+        """The start and value of the largest interval in the window, or None if it is empty."""
+        return self._high[0] if self._high else None
+
+    def entries(self) -> list:
+        """The start and value of every interval in the window, in time order."""
+        return list(self._entries)
+
+
+@dataclass
+class Summary:
+    """The rolling statistics of one meter.
+
+    Attributes:
+        meter: The meter, as the MPAN or MPRN and serial number joined by "/"
+        through: The end of the last interval included
+        baseload: The lowest overnight demand in kW over the baseload window
+        averages: The average consumption per day in each window, keyed by the days in the window
+        peaks: The start and consumption of the largest half hour in each window, keyed by the days in the window
+    """
+
+    meter: str
+    through: datetime = None
+    baseload: float = None
+    averages: dict = field(default_factory=dict)
+    peaks: dict = field(default_factory=dict)
+
+
+class MeterStats:
+    """The rolling windows of one meter.
+
+    Args:
+        windows (tuple): The length in days of each window
+        night (tuple): The UK start and end times of the overnight period used for the baseload
+        baseload_days (int): The number of nights the baseload is the minimum over
+    """
+
+    def __init__(self, windows: tuple, night: tuple, baseload_days: int) -> None:
+        self.windows = {days: RollingWindow(days * _DAY) for days in windows}
+        self.night = night
+        self.overnight = RollingWindow(baseload_days * _DAY)
+        # The longest window keeps every interval needed to restore the others from a checkpoint
+        span = max(list(windows) + [baseload_days])
+        self._history = self.windows.get(span)
+        self._separate = self._history is None
+        if self._separate:
+            self._history = RollingWindow(span * _DAY)
+        self.last = None
+
+    def _is_overnight(self, start: int) -> bool:
+        begin, end = self.night
+        local = _datetime(start).astimezone(LONDON).time()
+        if begin <= end:
+            return begin <= local < end
+        return local >= begin or local < end
+
+    def push(self, start: int, value: float) -> bool:
+        """Add an interval, returning False if it is not later than the last interval added."""
+        if self.last is not None and start <= self.last:
+            return False
+        self.last = start
+        for window in self.windows.values():
+            window.push(start, value)
+        if self._separate:
+            self._history.push(start, value)
+        if self._is_overnight(start):
+            self.overnight.push(start, value)
+        else:
+            self.overnight.expire(start)
+        return True
+
+    def summary(self, meter: str) -> Summary:
+        """Return the statistics of the meter."""
+        summary = Summary(meter)
+        if self.last is None:
+            return summary
+        summary.through = _datetime(self.last + _SECONDS)
+        lowest = self.overnight.minimum
+        if lowest is not None:
+            # A half hour of consumption in kWh is an average demand of twice as many kW
+            summary.baseload = round(lowest[1] * 2, 3)
+        for days, window in self.windows.items():
+            if len(window):
+                # Averaged over the half hours present, so that missing intervals do not lower the average
+                summary.averages[days] = round(window.total * 48 / len(window), 3)
+                start, value = window.maximum
+                summary.peaks[days] = (_datetime(start), value)
+        return summary
+
+
+class RollingStats:
+    """Rolling statistics for any number of meters, fed with consumption in time order.
+
+    Intervals which are not later than the last interval of their meter are ignored, so feeding
+    overlapping periods is safe but intervals which arrive late are not included.
+
+    Args:
+        windows (tuple, optional): The length in days of each rolling window. Defaults to (7, 30).
+        night (tuple, optional): The UK start and end times of the overnight period used for the baseload.
+            Defaults to 00:30 to 04:30.
+        baseload_days (int, optional): The number of nights the baseload is the minimum over. Defaults to 7.
+    """
+
+    def __init__(self, windows: tuple = (7, 30), night: tuple = (time(0, 30), time(4, 30)),
+                 baseload_days: int = 7) -> None:
+        self.windows = tuple(windows)
+        self.night = tuple(night)
+        self.baseload_days = baseload_days
+        self._meters = {}
+
+    def __contains__(self, meter: str) -> bool:
+        return meter in self._meters
+
+    def _meter(self, meter: str) -> MeterStats:
+        stats = self._meters.get(meter)
+        if stats is None:
+            stats = self._meters[meter] = MeterStats(self.windows, self.night, self.baseload_days)
+        return stats
+
+    @property
+    def meters(self) -> list:
+        """The meters with statistics."""
+        return list(self._meters)
+
+    def update(self, meter: str, entries: Iterable) -> int:
+        """Add consumption entries for a meter, returning the number of new intervals.
+
+        Args:
+            meter (str): The meter the consumption is for
+            entries (Iterable): Consumption entries with interval_start and consumption
+        """
+        stats = self._meter(meter)
+        added = 0
+        for start, value in sorted((_epoch(entry.interval_start), entry.consumption) for entry in entries):
+            added += stats.push(start, value)
+        return added
+
+    def feed(self, pages: Iterable) -> int:
+        """Add the pages yielded by OctopusClient.iter_dataset for a consumption dataset.
+
+        Args:
+            pages (Iterable): Tuples of the arguments identifying the meter and the results of one page
+
+        Returns:
+            int: The number of new intervals
+        """
+        return sum(self.update("/".join(arguments.values()), results) for arguments, results in pages)
+
+    def through(self, meter: str = None) -> datetime | None:
+        """Return the end of the last interval of a meter, or the earliest for every meter.
+
+        This is the time to fetch from to bring the statistics up to date.
+        """
+        lasts = [stats.last for name, stats in self._meters.items()
+                 if (meter is None or name == meter) and stats.last is not None]
+        return _datetime(min(lasts) + _SECONDS) if lasts else None
+
+    def summary(self, meter: str) -> Summary:
+        """Return the statistics of a meter."""
+        return self._meter(meter).summary(meter)
+
+    def summaries(self) -> dict:
+        """Return the statistics of every meter, keyed by meter."""
+        return {meter: stats.summary(meter) for meter, stats in self._meters.items()}
+
+    def to_dict(self) -> dict:
+        """Return the state as a dictionary which can be written as JSON."""
+        return {
+            "windows": list(self.windows),
+            "night": [value.isoformat() for value in self.night],
+            "baseload_days": self.baseload_days,
+            "meters": {meter: {"last": stats.last, "entries": stats._history.entries()}
+                       for meter, stats in self._meters.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "RollingStats":
+        """Restore the state returned by to_dict."""
+        stats = cls(tuple(state["windows"]), tuple(time.fromisoformat(value) for value in state["night"]),
+                    state["baseload_days"])
+        for meter, saved in state["meters"].items():
+            restored = stats._meter(meter)
+            for start, value in saved["entries"]:
+                restored.push(start, value)
+            restored.last = saved["last"]
+        return stats
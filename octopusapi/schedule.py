@@ -0,0 +1,204 @@
+"""Infer the peak, off peak and standard periods of a tariff from its unit rates.
+
+Fixed time of use tariffs such as Go, Intelligent Go, Flux and Cosy charge a handful of prices
+at the same times every day, while dynamic tariffs such as Agile charge a different price in
+almost every half hour. The rates are laid out on the 48 half hours of each UK day. A day with
+no more than four prices is labelled from the rank of each price within the day, as
+price_ranges does, and consecutive days with the same labels are merged into one period. A day
+with more prices is labelled from the quantiles of its own prices, so the cheapest quarter of
+the half hours is off peak and the dearest quarter is peak.
+
+Classifying a time is then a lookup of its UK day and an index into that day's 48 labels."""
+
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable
+
+from octopusapi.aggregate import LONDON
+from octopusapi.const import PriceType
+
+SLOT = timedelta(minutes=30)
+SLOTS = 48
+# The labels of the prices of a fixed time of use day, from the cheapest, by the number of prices
+FIXED_LABELS = {
+    1: (PriceType.STANDARD,),
+    2: (PriceType.OFFPEAK, PriceType.PEAK),
+    3: (PriceType.OFFPEAK, PriceType.STANDARD, PriceType.PEAK),
+    4: (PriceType.OFFPEAK, PriceType.OFFPEAK, PriceType.PEAK, PriceType.PEAK),
+}
+# Days missing more half hours than this are only used if they are dynamic
+_INCOMPLETE = 2
+
+
+@dataclass(frozen=True)
+class Period:
+    """Days which share the same labels for each half hour.
+
+    Attributes:
+        start: The first day of the period
+        end: The day after the last day of the period
+        slots: The PriceType of each half hour from UK midnight, None where it is not known
+        dynamic: Whether the labels were taken from quantiles of a dynamic tariff's prices
+    """
+
+    start: date
+    end: date
+    slots: tuple
+    dynamic: bool = False
+
+
+def _slot(when: datetime) -> tuple:
+    """Return the UK day and the index of the half hour within it."""
+    local = when.astimezone(LONDON)
+    return local.date(), local.hour * 2 + local.minute // 30
+
+
+def _quantile(ordered: list, fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def day_prices(rates: Iterable, start: datetime = None, end: datetime = None) -> dict:
+    """Lay unit rates out on the half hours of each UK day.
+
+    Args:
+        rates (Iterable): Unit rates with valid_from, valid_to and value_inc_vat
+        start (datetime, optional): The start of the period. Defaults to the earliest valid_from.
+        end (datetime, optional): The end of the period. Defaults to the latest valid_to, or a day after
+            the latest valid_from if the last rate has no end.
+
+    Returns:
+        dict: A list of 48 prices for each day, None for the half hours without a rate
+    """
+    ordered = sorted((entry for entry in rates if entry.valid_from is not None or start is not None),
+                     key=lambda entry: entry.valid_from or start)
+    if not ordered:
+        return {}
+    start = start or ordered[0].valid_from
+    end = end or max(max((entry.valid_to for entry in ordered if entry.valid_to is not None), default=start),
+                     ordered[-1].valid_from + timedelta(days=1))
+    days = {}
+    for entry in ordered:
+        when = max(entry.valid_from or start, start)
+        stop = min(entry.valid_to or end, end)
+        while when < stop:
+            day, slot = _slot(when)
+            prices = days.get(day)
+            if prices is None:
+                prices = days[day] = [None] * SLOTS
+            # The repeated hour when the clocks go back keeps the first price
+            if prices[slot] is None:
+                prices[slot] = entry.value_inc_vat
+            when += SLOT
+    return days
+
+
+def label_day(prices: list, quantiles: tuple = (0.25, 0.75)) -> tuple:
+    """Return the PriceType of each half hour of a day and whether the day is dynamic.
+
+    Args:
+        prices (list): The price of each half hour, None where there is no rate
+        quantiles (tuple, optional): The fractions of the day's half hours below which prices are off peak
+            and above which they are peak on a dynamic day. Defaults to (0.25, 0.75).
+    """
+    known = sorted(price for price in prices if price is not None)
+    distinct = sorted(set(known))
+    labels = FIXED_LABELS.get(len(distinct))
+    if labels is not None:
+        types = dict(zip(distinct, labels))
+        return tuple(None if price is None else types[price] for price in prices), False
+    low, high = _quantile(known, quantiles[0]), _quantile(known, quantiles[1])
+    return tuple(None if price is None else PriceType.OFFPEAK if price <= low else
+                 PriceType.PEAK if price >= high else PriceType.STANDARD for price in prices), True
+
+
+def _compatible(first: tuple, second: tuple) -> bool:
+    return all(one is None or two is None or one is two for one, two in zip(first, second))
+
+
+class Schedule:
+    """The labels of each half hour of each day, with the periods they were merged into.
+
+    Days before the first period or after the last period take the labels of that period if it
+    is a fixed time of use period, so that a schedule inferred from recent rates also classifies
+    the times either side of them.
+
+    Args:
+        periods (list): The periods in date order
+    """
+
+    def __init__(self, periods: list) -> None:
+        self.periods = periods
+        self._starts = [period.start for period in periods]
+        self._days = {}
+        for period in periods:
+            for offset in range((period.end - period.start).days):
+                self._days[period.start + timedelta(days=offset)] = period.slots
+
+    def __len__(self) -> int:
+        return len(self.periods)
+
+    @property
+    def dynamic(self) -> bool:
+        """Whether any of the periods is dynamic."""
+        return any(period.dynamic for period in self.periods)
+
+    def table(self, day: date) -> tuple | None:
+        """Return the PriceType of each half hour of a UK day, or None if the day is not covered."""
+        slots = self._days.get(day)
+        if slots is None and self.periods:
+            # Other days take the labels of the fixed period before them, or failing that after them
+            index = bisect_right(self._starts, day)
+            for period in self.periods[max(0, index - 1):index + 1]:
+                if not period.dynamic:
+                    return period.slots
+        return slots
+
+    def period(self, day: date) -> Period | None:
+        """Return the period covering a UK day, or None."""
+        index = bisect_right(self._starts, day) - 1
+        if index >= 0 and day < self.periods[index].end:
+            return self.periods[index]
+        return None
+
+    def classify(self, when: datetime) -> PriceType:
+        """Return the PriceType of the half hour containing a time, STANDARD if it is not known."""
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        day, slot = _slot(when)
+        slots = self.table(day)
+        if slots is None:
+            return PriceType.STANDARD
+        return slots[slot] or PriceType.STANDARD
+
+    __call__ = classify
+
+
+def infer(rates: Iterable, start: datetime = None, end: datetime = None,
+          quantiles: tuple = (0.25, 0.75)) -> Schedule:
+    """Infer the schedule of peak, off peak and standard half hours from unit rates.
+
+    Args:
+        rates (Iterable): Unit rates with valid_from, valid_to and value_inc_vat
+        start (datetime, optional): The start of the period. Defaults to the earliest valid_from.
+        end (datetime, optional): The end of the period. Defaults to the end of the last rate.
+        quantiles (tuple, optional): The quantiles separating off peak, standard and peak on dynamic days.
+            Defaults to (0.25, 0.75).
+
+    Returns:
+        Schedule: The schedule, with a period for each run of days with the same labels
+    """
+    periods = []
+    for day, prices in sorted(day_prices(rates, start, end).items()):
+        slots, dynamic = label_day(prices, quantiles)
+        if not dynamic and prices.count(None) > _INCOMPLETE:
+            # Part of a fixed day cannot show which of its prices are peak and which off peak
+            continue
+        last = periods[-1] if periods else None
+        if last is not None and last.end == day and not (dynamic or last.dynamic) and \
+                _compatible(last.slots, slots):
+            merged = tuple(one if one is not None else two for one, two in zip(last.slots, slots))
+            periods[-1] = Period(last.start, day + timedelta(days=1), merged)
+        else:
+            periods.append(Period(day, day + timedelta(days=1), slots, dynamic))
+    return Schedule(periods)
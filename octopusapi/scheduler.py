@@ -0,0 +1,145 @@
+"""A simple scheduler for running collectors repeatedly from a long running process.
+
+Each job runs at a fixed interval with random jitter so that many clients do not poll the API
+at the same moment. The time of the last successful run is saved so that after downtime a job
+runs straight away and is told how far back it needs to catch up. A job which finds that its
+data has not been published yet raises NotReady and is retried with an exponential backoff."""
+
+import logging
+import random
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+import ujson
+
+
+class NotReady(Exception):
+    """Raised by a job when the data it needs has not been published yet."""
+
+    def __init__(self, msg: str, since: datetime = None):
+        super().__init__(msg)
+        # The point the job got to, so the retry only needs to fetch what is still missing
+        self.since = since
+
+
+@dataclass
+class Job:
+    """A collector to be run on a schedule.
+
+    Attributes:
+        name: The name of the job, used for logging and saved state
+        function: Called with the time from which data is needed, or None on the first run. It may
+            return the time its data now extends to, otherwise the time the run started is used
+        interval: The time between runs
+        jitter: The maximum random delay added to each run
+        retry: The delay before the first retry of a job which raised NotReady
+        last_run: The time the job last completed successfully
+        next_run: The time the job will next run
+        since: The time from which the job next needs data
+        attempts: The number of times in a row the job has not been ready
+    """
+
+    name: str
+    function: Callable
+    interval: timedelta
+    jitter: timedelta = timedelta(minutes=2)
+    retry: timedelta = timedelta(minutes=15)
+    last_run: datetime = None
+    next_run: datetime = None
+    since: datetime = None
+    attempts: int = 0
+
+    def schedule(self, delay: timedelta) -> None:
+        """Schedule the next run after a delay plus a random jitter."""
+        jitter = timedelta(seconds=random.uniform(0, self.jitter.total_seconds()))
+        self.next_run = datetime.now(timezone.utc) + delay + jitter
+
+
+@dataclass
+class Scheduler:
+    """Runs jobs at their scheduled times until stopped.
+
+    Attributes:
+        state_file: A JSON file used to save the last successful run of each job
+    """
+
+    state_file: str = None
+    jobs: list = field(default_factory=list)
+    stopped: threading.Event = field(default_factory=threading.Event)
+
+    def __post_init__(self) -> None:
+        self.logger = logging.getLogger(__name__)
+        self._state = self._load_state()
+
+    def _load_state(self) -> dict:
+        if self.state_file is None:
+            return {}
+        try:
+            with open(self.state_file, encoding="utf-8") as state:
+                return ujson.load(state)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self) -> None:
+        if self.state_file is None:
+            return
+        with open(self.state_file, "w", encoding="utf-8") as state:
+            ujson.dump(self._state, state)
+
+    def add(self, job: Job) -> None:
+        """Add a job, running it immediately if it was due while the process was not running."""
+        now = datetime.now(timezone.utc)
+        if job.name in self._state:
+            job.last_run = datetime.fromisoformat(self._state[job.name]["last_run"])
+            job.since = datetime.fromisoformat(self._state[job.name]["since"])
+        if job.last_run is None or job.last_run + job.interval <= now:
+            job.schedule(timedelta(0))
+        else:
+            job.schedule(job.last_run + job.interval - now)
+        self.logger.info("Job %s will next run at %s", job.name, job.next_run)
+        self.jobs.append(job)
+
+    def run_pending(self) -> None:
+        """Run every job which is due."""
+        for job in self.jobs:
+            if job.next_run > datetime.now(timezone.utc) or self.stopped.is_set():
+                continue
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        started = datetime.now(timezone.utc)
+        try:
+            since = job.function(job.since)
+        except NotReady as err:
+            job.attempts += 1
+            if err.since is not None:
+                job.since = err.since
+            delay = min(job.retry * 2 ** (job.attempts - 1), job.interval)
+            self.logger.info("Job %s not ready (%s), retrying in %s", job.name, err, delay)
+            job.schedule(delay)
+            return
+        except Exception as err:  # pylint: disable=broad-except
+            # A failure in one collector must not stop the others
+            self.logger.error("Job %s failed: %s", job.name, err)
+            job.schedule(job.interval)
+            return
+        job.attempts = 0
+        job.last_run = started
+        job.since = since or started
+        self._state[job.name] = {"last_run": job.last_run.isoformat(), "since": job.since.isoformat()}
+        self._save_state()
+        job.schedule(job.interval)
+
+    def run(self) -> None:
+        """Run jobs as they become due until stop is called."""
+        while not self.stopped.is_set():
+            self.run_pending()
+            wake = min((job.next_run for job in self.jobs), default=None)
+            delay = 60 if wake is None else (wake - datetime.now(timezone.utc)).total_seconds()
+            self.stopped.wait(max(1, delay))
+
+    def stop(self) -> None:
+        """Stop the scheduler after any job which is running has completed."""
+        self.stopped.set()
@@ -0,0 +1,78 @@
+"""Split a long consumption or rates query into time shards which can be fetched concurrently.
+
+A paginated query is read one page at a time because each page links to the next, so a long
+history costs one round trip per page. Instead the first page is fetched on its own, which gives
+the total number of results, and the rest of the period is split into shards expected to hold
+about one page each. The shards are fetched concurrently and merged back into one ordered list."""
+
+from datetime import datetime, timedelta, timezone
+
+from octopusapi import merge
+from octopusapi.const import Order
+
+SLOT = timedelta(minutes=30)
+
+
+def _floor(value: datetime) -> datetime:
+    """Round a time down to the start of its half hour in UTC."""
+    value = value.astimezone(timezone.utc)
+    return value.replace(minute=30 if value.minute >= 30 else 0, second=0, microsecond=0)
+
+
+def split(start: datetime, end: datetime, shards: int) -> list:
+    """Split [start, end) into a number of shards of about the same length on half hour boundaries.
+
+    Args:
+        start (datetime): The start of the period
+        end (datetime): The end of the period
+        shards (int): The number of shards required
+
+    Returns:
+        list: (start, end) tuples in time order
+    """
+    slots = max(1, int((end - start) / SLOT))
+    shards = max(1, min(shards, slots))
+    bounds = [start] + [_floor(start + (end - start) * index / shards) for index in range(1, shards)] + [end]
+    return [(lower, upper) for lower, upper in zip(bounds, bounds[1:]) if upper > lower]
+
+
+def order_of(results: list, order: Order = None) -> Order:
+    """Return the order of a page of results, inferring it from the results if it is not known."""
+    if order is not None:
+        return order
+    key = merge.attribute_key(results[0]) if results else None
+    if key is None or len(results) < 2:
+        return Order.FORWARD
+    return Order.BACKWARD if merge.instant(key(results[0])) > merge.instant(key(results[-1])) else Order.FORWARD
+
+
+def remaining(first: list, count: int, start: datetime, end: datetime, order: Order) -> list:
+    """Return the shards covering the part of [start, end) after the first page of results.
+
+    Args:
+        first (list): The results on the first page
+        count (int): The total number of results reported for the whole period
+        start (datetime): The start of the period
+        end (datetime): The end of the period
+        order (Order): The order of the results
+
+    Returns:
+        list: (start, end) tuples for the shards still to be fetched
+    """
+    if not first or count <= len(first):
+        return []
+    boundary = merge.instant(merge.attribute_key(first[-1])(first[-1]))
+    # Each shard should hold about as many results as the first page
+    shards = -(-(count - len(first)) // len(first))
+    if order is Order.FORWARD:
+        return split(max(boundary, start), end, shards)
+    return split(start, min(boundary, end), shards)
+
+
+def combine(pages: list, order: Order) -> list:
+    """Merge the results of several shards into one ordered list without repeats.
+
+    Shards which meet at a boundary can both hold the row at the boundary, and a rate which
+    spans the boundary is returned by both, so repeats are removed as the shards are merged.
+    """
+    return list(merge.merge_streams(pages, order))
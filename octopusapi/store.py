@@ -0,0 +1,268 @@
+"""A local SQLite store for consumption, unit rates and standing charges.
+
+The store keeps everything the client fetches so that it can be queried later without the
+network or InfluxDB, and so that the client can use it as a cache. Times are held as UTC epoch
+seconds so that range queries use the indexes directly and are unaffected by clock changes.
+
+A store can be shared by the threads fetching concurrently, which take turns to use its connection."""
+
+import sqlite3
+import threading
+from collections import namedtuple
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Iterable
+
+from octopusapi import frames
+
+SLOT = timedelta(minutes=30)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS consumption (
+    meter TEXT NOT NULL,
+    interval_start INTEGER NOT NULL,
+    interval_end INTEGER NOT NULL,
+    consumption REAL NOT NULL,
+    PRIMARY KEY (meter, interval_start)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rates (
+    tariff_code TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    valid_from INTEGER NOT NULL,
+    valid_to INTEGER,
+    value_exc_vat REAL,
+    value_inc_vat REAL,
+    payment_method TEXT NOT NULL DEFAULT '',
+    stored_at INTEGER,
+    PRIMARY KEY (tariff_code, kind, payment_method, valid_from)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rates_valid_from ON rates (tariff_code, valid_from);
+"""
+
+# Rows returned from the store have the same attribute names as the API dataclasses
+Reading = namedtuple("Reading", ["interval_start", "interval_end", "consumption"])
+Price = namedtuple("Price", ["valid_from", "valid_to", "value_exc_vat", "value_inc_vat", "payment_method"])
+
+
+def _epoch(value: datetime) -> int | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _datetime(value: int) -> datetime | None:
+    return None if value is None else datetime.fromtimestamp(value, timezone.utc)
+
+
+@dataclass
+class Series:
+    """A columnar range of rows from the store.
+
+    Times are kept as the epoch seconds read from the database, so to_numpy() converts a whole
+    column to datetime64 at once and datetimes are only built for the rows which are read.
+
+    Attributes:
+        columns: A list of values for each column name
+        row: The namedtuple each row is returned as
+        times: The names of the columns holding epoch seconds, None where there is no time
+    """
+
+    columns: dict = field(default_factory=dict)
+    row: type = None
+    times: tuple = ()
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), []))
+
+    def __iter__(self):
+        """Iterate over the rows, which have the same attributes as the API dataclasses."""
+        columns = [map(_datetime, values) if name in self.times else values for name, values in self.columns.items()]
+        return map(self.row._make, zip(*columns))
+
+    def __getitem__(self, name: str) -> list:
+        if name in self.times:
+            return [_datetime(value) for value in self.columns[name]]
+        return self.columns[name]
+
+    def to_numpy(self) -> dict:
+        """Return a numpy array for each column, times as UTC datetime64 with NaT where there is none."""
+        np = frames._numpy()  # pylint: disable=protected-access
+        result = {}
+        for name, values in self.columns.items():
+            if name in self.times:
+                result[name] = frames.epoch_times(np, values)
+            else:
+                result[name] = frames.arrays({name: values})[name]
+        return result
+
+    def to_frame(self, tz: str = frames.LOCAL):
+        """Return a DataFrame indexed by the first column."""
+        return frames.to_frame(self.to_numpy(), next(iter(self.columns)), tz)
+
+
+class Store:
+    """A SQLite store for time series fetched from the Octopus API.
+
+    Args:
+        path (str, optional): The database file. Defaults to an in memory database.
+        batch (int, optional): The number of rows written per statement. Defaults to 5000.
+    """
+
+    def __init__(self, path: str = ":memory:", batch: int = 5000) -> None:
+        self._batch = batch
+        # The connection is shared by every thread, so each use of it holds the lock
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # Write ahead logging lets readers carry on while the collector is writing
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        # Stores created before open ended rates were timed need the column adding
+        if "stored_at" not in [row[1] for row in self._db.execute("PRAGMA table_info(rates)")]:
+            self._db.execute("ALTER TABLE rates ADD COLUMN stored_at INTEGER")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _fetch(self, statement: str, parameters: tuple) -> list:
+        """Run a query and return every row while holding the lock."""
+        with self._lock:
+            return self._db.execute(statement, parameters).fetchall()
+
+    def _write(self, statement: str, rows: Iterable) -> int:
+        """Write rows in batches so that iterators are never held in memory in full."""
+        count = 0
+        rows = iter(rows)
+        with self._lock, self._db:
+            while batch := list(islice(rows, self._batch)):
+                self._db.executemany(statement, batch)
+                count += len(batch)
+        return count
+
+    def upsert_consumption(self, meter: str, entries: Iterable) -> int:
+        """Insert or update consumption for a meter, returning the number of rows written.
+
+        Args:
+            meter (str): The meter, for example "mpan/serial number"
+            entries (Iterable): Entries with interval_start, interval_end and consumption
+        """
+        return self._write(
+            "INSERT INTO consumption VALUES (?, ?, ?, ?) ON CONFLICT (meter, interval_start) "
+            "DO UPDATE SET interval_end = excluded.interval_end, consumption = excluded.consumption",
+            ((meter, _epoch(entry.interval_start), _epoch(entry.interval_end), entry.consumption)
+             for entry in entries))
+
+    def upsert_rates(self, tariff_code: str, kind: str, entries: Iterable) -> int:
+        """Insert or update unit rates or standing charges, returning the number of rows written.
+
+        The time they were stored is kept, as a rate with no end is only known to apply until then.
+
+        Args:
+            tariff_code (str): The tariff code
+            kind (str): The type of rate, for example standard, day, night or standing
+            entries (Iterable): Entries with valid_from, valid_to and values
+        """
+        stored_at = _epoch(datetime.now(timezone.utc))
+        return self._write(
+            "INSERT INTO rates VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (tariff_code, kind, payment_method, valid_from) DO UPDATE SET "
+            "valid_to = excluded.valid_to, value_exc_vat = excluded.value_exc_vat, "
+            "value_inc_vat = excluded.value_inc_vat, stored_at = excluded.stored_at",
+            ((tariff_code, kind, _epoch(entry.valid_from) or 0, _epoch(entry.valid_to),
+              entry.value_exc_vat, entry.value_inc_vat, entry.payment_method or "", stored_at)
+             for entry in entries))
+
+    def consumption(self, meter: str, start: datetime = None, end: datetime = None) -> Series:
+        """Return the consumption for a meter with an interval starting in [start, end)."""
+        rows = self._fetch(
+            "SELECT interval_start, interval_end, consumption FROM consumption "
+            "WHERE meter = ? AND interval_start >= ? AND interval_start < ? ORDER BY interval_start",
+            (meter, _epoch(start) or 0, _epoch(end) or 2 ** 62))
+        starts, ends, values = zip(*rows) if rows else ((), (), ())
+        return Series(columns={"interval_start": list(starts), "interval_end": list(ends),
+                               "consumption": list(values)}, row=Reading, times=("interval_start", "interval_end"))
+
+    def rates(self, tariff_code: str, kind: str = "standard", start: datetime = None,
+              end: datetime = None) -> Series:
+        """Return the rates for a tariff which apply at any time in [start, end)."""
+        rows = self._fetch(
+            "SELECT valid_from, valid_to, value_exc_vat, value_inc_vat, payment_method FROM rates "
+            "WHERE tariff_code = ? AND kind = ? AND valid_from < ? AND (valid_to IS NULL OR valid_to > ?) "
+            "ORDER BY valid_from",
+            (tariff_code, kind, _epoch(end) or 2 ** 62, _epoch(start) or 0))
+        columns = list(zip(*rows)) if rows else [(), (), (), (), ()]
+        return Series(columns={"valid_from": list(columns[0]),
+                               "valid_to": list(columns[1]),
+                               "value_exc_vat": list(columns[2]),
+                               "value_inc_vat": list(columns[3]),
+                               "payment_method": [value or None for value in columns[4]]},
+                      row=Price, times=("valid_from", "valid_to"))
+
+    def first_gap(self, meter: str, start: datetime, end: datetime) -> datetime | None:
+        """Return the start of the first half hour in [start, end) with no consumption, or None if complete."""
+        expected = _epoch(start)
+        last = _epoch(end)
+        for (interval_start,) in self._fetch(
+                "SELECT interval_start FROM consumption WHERE meter = ? AND interval_start >= ? "
+                "AND interval_start < ? ORDER BY interval_start", (meter, expected, last)):
+            if interval_start != expected:
+                break
+            expected += int(SLOT.total_seconds())
+        return None if expected >= last else _datetime(expected)
+
+    def covers(self, tariff_code: str, kind: str, start: datetime, end: datetime) -> bool:
+        """Return whether the stored rates for a tariff cover [start, end) without a gap.
+
+        A rate with no end only covers the time up to when it was stored, as the price may have
+        changed since, so periods after that are always fetched again.
+        """
+        reached = _epoch(start)
+        for valid_from, valid_to, stored_at in self._fetch(
+                "SELECT valid_from, valid_to, stored_at FROM rates WHERE tariff_code = ? AND kind = ? "
+                "AND valid_from < ? AND (valid_to IS NULL OR valid_to > ?) ORDER BY valid_from",
+                (tariff_code, kind, _epoch(end), reached)):
+            if valid_from > reached:
+                return False
+            reached = max(reached, valid_to if valid_to is not None else stored_at or valid_from)
+        return reached >= _epoch(end)
+
+    def compact(self, keep: timedelta = None) -> None:
+        """Reduce the size of the store.
+
+        Consecutive rates with the same values are merged into one, consumption older than keep is
+        deleted if it is given, and the database file is then checkpointed and vacuumed.
+        """
+        with self._lock, self._db:
+            if keep is not None:
+                cutoff = _epoch(datetime.now(timezone.utc) - keep)
+                self._db.execute("DELETE FROM consumption WHERE interval_start < ?", (cutoff,))
+            rows = self._db.execute(
+                "SELECT tariff_code, kind, payment_method, valid_from, valid_to, value_exc_vat, value_inc_vat, "
+                "stored_at FROM rates ORDER BY tariff_code, kind, payment_method, valid_from").fetchall()
+            merged = []
+            for row in rows:
+                previous = merged[-1] if merged else None
+                if (previous is not None and previous[:3] == row[:3] and previous[4] == row[3]
+                        and previous[5:7] == row[5:7]):
+                    # The merged rate keeps the later rate's end and the time it was stored
+                    merged[-1] = (*previous[:4], row[4], *previous[5:7], row[7])
+                else:
+                    merged.append(row)
+            if len(merged) < len(rows):
+                self._db.execute("DELETE FROM rates")
+                self._db.executemany(
+                    "INSERT INTO rates (tariff_code, kind, payment_method, valid_from, valid_to, value_exc_vat, "
+                    "value_inc_vat, stored_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", merged)
+        with self._lock:
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._db.execute("VACUUM")
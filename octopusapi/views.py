@@ -0,0 +1,155 @@
+"""Lazy views over the raw JSON rows of consumption and rates pages.
+
+Parsing a page into dataclasses builds an object for every row and parses both of its times,
+even when the caller only reads the consumption. A RecordList keeps the raw rows instead and
+returns a light view of each row, which converts a time the first time it is read and keeps the
+converted value in place of the string. Totalling the consumption, or looking at the first and
+last rows, then parses almost nothing.
+
+Views have the same attributes as the dataclasses they stand in for but are not dataclasses, so
+they cannot be passed to dataclasses.replace() or compared with each other."""
+
+from collections.abc import Sequence
+from dataclasses import MISSING, dataclass, fields
+from datetime import date, datetime
+from functools import lru_cache
+from typing import get_args, get_origin
+
+import ciso8601
+
+# Converters for the fields which are parsed from strings, every other field is used as it is
+CONVERTERS = {
+    datetime: ciso8601.parse_datetime,
+    date: lambda value: ciso8601.parse_datetime(value).date(),
+}
+SCALARS = {float, str, int, bool}
+
+
+@lru_cache(maxsize=None)
+def schema(cls) -> tuple | None:
+    """Return the converters and defaults of a row dataclass, or None if it has nested fields."""
+    converters = {}
+    defaults = {}
+    for entry in fields(cls):
+        if entry.type in CONVERTERS:
+            converters[entry.name] = CONVERTERS[entry.type]
+        elif entry.type not in SCALARS:
+            return None
+        if entry.default is not MISSING:
+            defaults[entry.name] = entry.default
+    return converters, defaults
+
+
+@lru_cache(maxsize=None)
+def row_type(cls) -> type | None:
+    """Return the row dataclass of a page dataclass with a list of flat results, or None."""
+    for entry in fields(cls):
+        if entry.name == "results" and get_origin(entry.type) is list:
+            row = get_args(entry.type)[0]
+            return row if schema(row) is not None else None
+    return None
+
+
+class RecordView:
+    """A view of one raw row with the attributes of its dataclass.
+
+    Args:
+        row (dict): The raw JSON row, which receives the converted times
+        rules (tuple): The converters and defaults returned by schema()
+    """
+
+    __slots__ = ("_row", "_rules")
+
+    def __init__(self, row: dict, rules: tuple) -> None:
+        self._row = row
+        self._rules = rules
+
+    def __getattr__(self, name: str):
+        converters, defaults = self._rules
+        try:
+            value = self._row[name]
+        except KeyError:
+            if name in defaults:
+                return defaults[name]
+            raise AttributeError(name) from None
+        if isinstance(value, str) and name in converters:
+            # Converted once and kept, so later reads of the same time cost a dict lookup
+            value = self._row[name] = converters[name](value)
+        return value
+
+    def __repr__(self) -> str:
+        return f"RecordView({self._row!r})"
+
+
+class RecordList(Sequence):
+    """A read only sequence of RecordView entries over a list of raw rows.
+
+    Args:
+        rows (list): The raw JSON rows
+        cls (type): The dataclass the rows stand in for
+    """
+
+    def __init__(self, rows: list, cls: type) -> None:
+        self._rows = rows
+        self._cls = cls
+        self._rules = schema(cls)
+        self._views = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RecordList(self._rows[index], self._cls)
+        if index < 0:
+            index += len(self._rows)
+        view = self._views.get(index)
+        if view is None:
+            view = self._views[index] = RecordView(self._rows[index], self._rules)
+        return view
+
+    def __iter__(self):
+        for index in range(len(self._rows)):
+            yield self[index]
+
+    def __repr__(self) -> str:
+        return f"RecordList({self._cls.__name__}, {len(self._rows)} rows)"
+
+    def column(self, name: str) -> list:
+        """Return the values of one attribute for every row, converting only that attribute."""
+        converters, defaults = self._rules
+        if name not in converters:
+            default = defaults.get(name)
+            return [row.get(name, default) for row in self._rows]
+        return [getattr(view, name) for view in self]
+
+
+@dataclass
+class LazyPage:
+    """A page of results whose rows are parsed lazily.
+
+    Attributes:
+        count: The number of results reported by the API
+        next: The URL of the next page
+        previous: The URL of the previous page
+        results: The rows as a RecordList
+    """
+
+    count: int = 0
+    next: str = None
+    previous: str = None
+    results: RecordList = None
+
+
+def lazy_page(cls: type, response: dict) -> LazyPage | None:
+    """Return a LazyPage for a response if its page dataclass has a list of flat rows, otherwise None.
+
+    Args:
+        cls (type): The page dataclass the response would be parsed into
+        response (dict): The JSON response
+    """
+    row = row_type(cls)
+    if row is None or not isinstance(response.get("results"), list):
+        return None
+    return LazyPage(count=response.get("count", len(response["results"])), next=response.get("next"),
+                    previous=response.get("previous"), results=RecordList(response["results"], row))
@@ -0,0 +1,183 @@
+"""Watch for the publication of the next day's unit rates and push them to subscribers.
+
+Agile and Flux prices for the next day are published once a day, usually around 16:00 UK time
+but not at a fixed moment. Rather than every consumer polling for them, a single watcher polls
+rarely while the rates cannot be due, often around the expected publication time and with a
+growing interval if they are late. Each poll is a conditional request for the same period, so
+unchanged rates are neither transferred nor parsed. When rates for later slots first appear the
+new rates are passed to every callback and asyncio queue which has subscribed."""
+
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta, timezone
+from typing import Callable
+
+from octopusapi.aggregate import LONDON
+
+
+@dataclass
+class Publication:
+    """Unit rates which have been published since the previous publication.
+
+    Attributes:
+        tariff_code: The tariff the rates are for, None for the account's tariff
+        rates: Every rate from the start of today, in time order
+        new: The rates which were not published before, in time order
+        through: The end of the last rate published
+    """
+
+    tariff_code: str
+    rates: list
+    new: list
+    through: datetime
+
+
+def _midnight(day) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=LONDON)
+
+
+def poll_delay(now: datetime, through: datetime | None, expected: time = time(16), lead: timedelta = timedelta(minutes=30),
+               fast: timedelta = timedelta(minutes=1), slow: timedelta = timedelta(hours=2), late: int = 0) -> timedelta:
+    """Return how long to wait before polling for rates again.
+
+    Args:
+        now (datetime): The current time
+        through (datetime | None): The end of the rates published so far, None if there are none
+        expected (time, optional): The UK time rates for the next day are expected. Defaults to 16:00.
+        lead (timedelta, optional): How long before and after the expected time to poll quickly. Defaults to 30 minutes.
+        fast (timedelta, optional): The interval when rates are due. Defaults to one minute.
+        slow (timedelta, optional): The longest interval. Defaults to two hours.
+        late (int, optional): The number of polls since the rates became overdue. Defaults to 0.
+    """
+    today = now.astimezone(LONDON).date()
+    tomorrow = today + timedelta(days=1)
+    due = datetime.combine(today, expected, LONDON)
+    if through is not None and through > _midnight(tomorrow):
+        # The next day is already published, so nothing is due until the expected time tomorrow
+        due = datetime.combine(tomorrow, expected, LONDON)
+        return max(fast, min(slow, due - lead - now))
+    if now < due - lead:
+        return max(fast, min(slow, due - lead - now))
+    if now <= due + lead:
+        return fast
+    # Late rates are polled for less and less often
+    return min(slow, fast * 2 ** late)
+
+
+@dataclass
+class RateWatcher:
+    """Polls a client for newly published unit rates and pushes them to subscribers.
+
+    Attributes:
+        client: The OctopusClient polled, which only needs the REST API
+        tariff_code: The tariff watched, defaulting to the account's import or export tariff
+        export: Watch the account's export tariff rather than its import tariff
+        expected: The UK time rates for the next day are expected
+        lead: How long before and after the expected time to poll quickly
+        fast: The interval when rates are due
+        slow: The longest interval
+        through: The end of the rates already published
+        stopped: Set to stop polling
+    """
+
+    client: object
+    tariff_code: str = None
+    export: bool = False
+    expected: time = time(16)
+    lead: timedelta = timedelta(minutes=30)
+    fast: timedelta = timedelta(minutes=1)
+    slow: timedelta = timedelta(hours=2)
+    through: datetime = None
+    stopped: threading.Event = field(default_factory=threading.Event)
+
+    def __post_init__(self) -> None:
+        self.logger = logging.getLogger(__name__)
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._late = 0
+
+    def subscribe(self, callback: Callable) -> Callable:
+        """Call a function with each Publication, returning the function so it can be used as a decorator.
+
+        Callbacks are called from the polling thread and should return quickly.
+        """
+        with self._lock:
+            self._callbacks.append(callback)
+        return callback
+
+    def unsubscribe(self, callback: Callable) -> None:
+        """Stop calling a function."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def queue(self, loop: asyncio.AbstractEventLoop = None) -> asyncio.Queue:
+        """Return an asyncio queue which receives each Publication.
+
+        Args:
+            loop (asyncio.AbstractEventLoop, optional): The event loop the queue belongs to. Defaults to the running loop.
+        """
+        loop = loop or asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        # Publications arrive on the polling thread and are handed to the event loop's thread
+        self.subscribe(lambda publication: loop.call_soon_threadsafe(queue.put_nowait, publication))
+        return queue
+
+    def poll(self, now: datetime = None) -> Publication | None:
+        """Poll once, returning a Publication and pushing it to subscribers if new rates have appeared."""
+        now = now or datetime.now(timezone.utc)
+        today = now.astimezone(LONDON).date()
+        # The period stays the same all day so that the request can be revalidated
+        start, end = _midnight(today), _midnight(today + timedelta(days=2))
+        rates = sorted(self.client.published_rates(start, end, self.tariff_code, self.export),
+                       key=lambda entry: entry.valid_from)
+        through = max((entry.valid_to or end for entry in rates), default=None)
+        if through is None or (self.through is not None and through <= self.through):
+            if (through is None or through <= end - timedelta(days=1)) and \
+                    now > datetime.combine(today, self.expected, LONDON) + self.lead:
+                self._late += 1
+            return None
+        new = [entry for entry in rates if self.through is None or (entry.valid_to or end) > self.through]
+        self.through = through
+        self._late = 0
+        publication = Publication(self.tariff_code, rates, new, through)
+        self.logger.info("Unit rates published through %s", through.isoformat())
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback(publication)
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception("Rate subscriber failed")
+        return publication
+
+    def delay(self, now: datetime = None) -> timedelta:
+        """Return how long to wait before the next poll."""
+        return poll_delay(now or datetime.now(timezone.utc), self.through, self.expected, self.lead,
+                          self.fast, self.slow, self._late)
+
+    def run(self) -> None:
+        """Poll until stopped, waiting for the adaptive delay between polls."""
+        while not self.stopped.is_set():
+            try:
+                self.poll()
+            except Exception:  # pylint: disable=broad-except
+                # Errors are logged and the watcher tries again after the usual delay
+                self.logger.exception("Polling for unit rates failed")
+            self.stopped.wait(self.delay().total_seconds())
+
+    def start(self) -> "RateWatcher":
+        """Start polling from a background thread."""
+        self.stopped.clear()
+        self._thread = threading.Thread(target=self.run, name="rate-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop polling."""
+        self.stopped.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,172 @@
+"""Find the cheapest times to run flexible loads from future unit rates.
+
+Unit rates are expanded once into a series of half hour slot prices, with their cumulative sum,
+which every appliance query then searches. The cost of a contiguous window is a difference of
+cumulative sums for each run of equal weights in the load profile, so a profile with a few
+levels costs little more than a flat load, and windows spanning a gap between rates are skipped.
+Non-contiguous windows select the cheapest slots directly."""
+
+import heapq
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+SLOT = timedelta(minutes=30)
+
+
+def _runs(profile: list) -> list:
+    """Return (first, end, weight) for each run of equal weights in a load profile."""
+    runs = []
+    for offset, weight in enumerate(profile):
+        if runs and runs[-1][2] == weight:
+            runs[-1][1] = offset + 1
+        else:
+            runs.append([offset, offset + 1, weight])
+    return runs
+
+
+@dataclass
+class Appliance:
+    """A flexible load to be scheduled.
+
+    Attributes:
+        name: The name of the appliance
+        hours: How long the appliance runs for, rounded up to whole half hours
+        power: The average power drawn in kW, used when there is no profile
+        contiguous: Whether the appliance must run in a single block
+        profile: Optional energy in kWh used in each half hour of a contiguous run
+        earliest: The earliest time the appliance may start
+        latest: The time by which the appliance must have finished
+    """
+
+    name: str
+    hours: float = 1
+    power: float = 1
+    contiguous: bool = True
+    profile: list = None
+    earliest: datetime = None
+    latest: datetime = None
+
+    @property
+    def slots(self) -> int:
+        """The number of half hour slots the appliance needs."""
+        if self.profile:
+            return len(self.profile)
+        return max(1, -int(-self.hours * 2 // 1))
+
+
+@dataclass
+class Window:
+    """The cheapest slots found for an appliance.
+
+    Attributes:
+        name: The name of the appliance
+        slots: The start time of each half hour slot used
+        cost: The cost in pence of running the appliance in those slots
+        energy: The energy used in kWh
+    """
+
+    name: str
+    slots: list = field(default_factory=list)
+    cost: float = 0
+    energy: float = 0
+
+    @property
+    def start(self) -> datetime:
+        return self.slots[0] if self.slots else None
+
+    @property
+    def end(self) -> datetime:
+        return self.slots[-1] + SLOT if self.slots else None
+
+    @property
+    def average_price(self) -> float:
+        return self.cost / self.energy if self.energy else 0
+
+
+class SlotPrices:
+    """Half hour slot prices built from unit rates, shared by many appliance queries.
+
+    Args:
+        rates (list): Unit rates as returned by get_standard_unit_rates
+        after (datetime, optional): Ignore slots starting before this time. Defaults to None.
+    """
+
+    def __init__(self, rates: list, after: datetime = None) -> None:
+        self.starts = []
+        self.prices = []
+        for entry in sorted(rates, key=lambda entry: entry.valid_from):
+            if entry.valid_to is None:
+                continue
+            start = entry.valid_from
+            if after is not None and start < after:
+                # Move to the first slot boundary at or after the time requested
+                start += SLOT * -((start - after) // SLOT)
+            while start < entry.valid_to:
+                self.starts.append(start)
+                self.prices.append(entry.value_inc_vat)
+                start += SLOT
+        self.cumulative = [0.0]
+        for price in self.prices:
+            self.cumulative.append(self.cumulative[-1] + price)
+        # The number of gaps between rates before each slot, equal at both ends of a contiguous window
+        self.breaks = [0]
+        for previous, start in zip(self.starts, self.starts[1:]):
+            self.breaks.append(self.breaks[-1] + (start != previous + SLOT))
+
+    def _bounds(self, appliance: Appliance) -> tuple:
+        """Return the index range of slots the appliance may use."""
+        first = 0 if appliance.earliest is None else bisect_left(self.starts, appliance.earliest)
+        last = len(self.starts) if appliance.latest is None else bisect_left(self.starts, appliance.latest)
+        return first, last
+
+    def _contiguous(self, appliance: Appliance, first: int, last: int) -> Window | None:
+        length = appliance.slots
+        cumulative = self.cumulative
+        if appliance.profile is None:
+            runs = [(0, length, appliance.power / 2)]
+            energy = appliance.power * length / 2
+        else:
+            runs = _runs(appliance.profile)
+            energy = sum(appliance.profile)
+        best = cost = None
+        for start in range(first, last - length + 1):
+            # A window may not span a gap between rates
+            if self.breaks[start + length - 1] != self.breaks[start]:
+                continue
+            total = sum(weight * (cumulative[start + end] - cumulative[start + begin]) for begin, end, weight in runs)
+            if cost is None or total < cost:
+                best, cost = start, total
+        if best is None:
+            return None
+        return Window(name=appliance.name, slots=self.starts[best:best + length], cost=cost, energy=energy)
+
+    def _cheapest(self, appliance: Appliance, first: int, last: int) -> Window:
+        chosen = sorted(heapq.nsmallest(appliance.slots, range(first, last), key=self.prices.__getitem__))
+        energy = appliance.power * len(chosen) / 2
+        return Window(name=appliance.name, slots=[self.starts[index] for index in chosen],
+                      cost=sum(self.prices[index] for index in chosen) * appliance.power / 2, energy=energy)
+
+    def find(self, appliance: Appliance) -> Window | None:
+        """Return the cheapest window for an appliance, or None if it does not fit in the slots available."""
+        first, last = self._bounds(appliance)
+        if last - first < appliance.slots:
+            return None
+        if appliance.contiguous:
+            return self._contiguous(appliance, first, last)
+        return self._cheapest(appliance, first, last)
+
+
+def cheapest_windows(rates: list | SlotPrices, appliances: list, after: datetime = None) -> dict:
+    """Find the cheapest window for each of several appliances against the same unit rates.
+
+    Args:
+        rates (list | SlotPrices): Unit rates, or slot prices which have already been built
+        appliances (list): The Appliance queries
+        after (datetime, optional): Ignore slots starting before this time. Defaults to None.
+
+    Returns:
+        dict: The Window found for each appliance name, None where the appliance does not fit
+    """
+    slots = rates if isinstance(rates, SlotPrices) else SlotPrices(rates, after)
+    return {appliance.name: slots.find(appliance) for appliance in appliances}
@@ -0,0 +1,346 @@
+"""Local stand-ins for the Octopus APIs, for testing and benchmarking offline.
+
+StandIn answers the Kraken GraphQL operations used by graphql.KrakenClient: it issues tokens for an
+API key, refreshes them, rejects expired tokens with the same error code as Kraken, lists the
+account's smart devices and returns synthetic telemetry for any period and grouping, at most
+page_size readings at a time as Kraken does. Tokens can be given a short lifetime so that
+refreshing is exercised, and the requests served are counted.
+
+RatesStandIn serves synthetic half hourly unit rates from the REST API path, publishing the next
+day's rates when told to, and answers conditional requests, for testing watcher.RateWatcher. Rates
+can be split into pages of page_size results linked by next, as the REST API does.
+
+They are used by the tests, and can be run for benchmarking with: python tests/standin.py --port 8765 [--rates]"""
+
+import argparse
+import hashlib
+import json
+import math
+import re
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from octopusapi.aggregate import LONDON
+from octopusapi.const import TelemetryGrouping
+
+
+class _Served:
+    """A server run from a background thread or the current thread."""
+
+    def __init__(self, host: str, port: int) -> None:
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    def start(self):
+        """Start serving from a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve(self) -> None:
+        """Serve from the current thread until interrupted."""
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, operation: str) -> None:
+        with self._lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+
+    def _handler(self):
+        raise NotImplementedError
+
+
+class StandIn(_Served):
+    """A Kraken GraphQL stand-in served from a background thread.
+
+    Args:
+        apikey (str, optional): The API key accepted. Defaults to "sk_test".
+        account (str, optional): The account number. Defaults to "A-TEST".
+        devices (tuple, optional): The smart device ids on the account. Defaults to one device.
+        token_lifetime (int, optional): The number of seconds a token is valid for. Defaults to 3600.
+        page_size (int, optional): The most telemetry readings returned by one request. Defaults to 1000.
+        host (str, optional): The address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): The port to listen on, 0 picks a free port. Defaults to 0.
+    """
+
+    def __init__(self, apikey: str = "sk_test", account: str = "A-TEST", devices: tuple = ("00-00-00-00-00-00-00-01",),
+                 token_lifetime: int = 3600, page_size: int = 1000, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.apikey = apikey
+        self.account = account
+        self.devices = tuple(devices)
+        self.token_lifetime = token_lifetime
+        self.page_size = page_size
+        self._tokens = {}
+        self._refresh_tokens = {}
+        super().__init__(host, port)
+
+    @property
+    def url(self) -> str:
+        return f"{self.address}/v1/graphql/"
+
+    def _issue(self) -> dict:
+        now = int(time.time())
+        token = secrets.token_hex(16)
+        refresh_token = secrets.token_hex(16)
+        with self._lock:
+            self._tokens[token] = now + self.token_lifetime
+            self._refresh_tokens[refresh_token] = now + 7 * 24 * 3600
+        return {"token": token, "refresh_token": refresh_token, "refresh_expires_in": now + 7 * 24 * 3600,
+                "payload": {"exp": now + self.token_lifetime, "iat": now}}
+
+    def _obtain_token(self, variables: dict) -> dict:
+        credentials = variables.get("input") or {}
+        self._count("refreshToken" if "refreshToken" in credentials else "APIKey")
+        with self._lock:
+            refreshable = self._refresh_tokens.pop(credentials.get("refreshToken"), 0) > time.time()
+        if credentials.get("APIKey") == self.apikey or refreshable:
+            return {"data": {"obtainKrakenToken": self._issue()}}
+        return self._error("Invalid data.", "KT-CT-1138")
+
+    @staticmethod
+    def _error(message: str, code: str) -> dict:
+        return {"data": None, "errors": [{"message": message, "extensions": {"errorCode": code}}]}
+
+    def expire(self) -> None:
+        """Expire every token issued so far, as if they had outlived their lifetime."""
+        with self._lock:
+            self._tokens = dict.fromkeys(self._tokens, 0)
+
+    def _authorised(self, token: str) -> dict | None:
+        """Return an error response if a token is missing, unknown or expired."""
+        with self._lock:
+            expires = self._tokens.get(token)
+        if expires is None:
+            return self._error("Invalid JWT.", "KT-CT-1139")
+        if expires <= time.time():
+            return self._error("Signature of the JWT has expired.", "KT-CT-1124")
+        return None
+
+    def _smart_devices(self, variables: dict) -> dict:
+        if variables.get("accountNumber") != self.account:
+            return self._error("Unauthorized.", "KT-CT-4321")
+        meters = [{"smart_devices": [{"device_id": device} for device in self.devices]}]
+        return {"data": {"account": {"electricity_agreements": [{"meter_point": {"meters": meters}}]}}}
+
+    @staticmethod
+    def demand(when: datetime) -> float:
+        """The synthetic demand in watts at a time, a daily cycle peaking in the early evening."""
+        hours = when.hour + when.minute / 60 + when.second / 3600
+        return round(400 + 300 * math.sin((hours - 12) / 24 * 2 * math.pi), 1)
+
+    def _telemetry(self, variables: dict) -> dict:
+        if variables.get("deviceId") not in self.devices:
+            return self._error("Device not found.", "KT-CT-4301")
+        seconds = TelemetryGrouping[variables.get("grouping") or "TEN_SECONDS"].value
+        end = datetime.fromisoformat(variables["end"]) if variables.get("end") else datetime.now(timezone.utc)
+        start = datetime.fromisoformat(variables["start"]) if variables.get("start") else end
+        # Readings start on whole intervals, with only the latest reading when no start is given
+        first = int(start.timestamp()) // seconds * seconds
+        if first < start.timestamp():
+            first += seconds
+        last = int(end.timestamp()) // seconds * seconds
+        readings = []
+        for stamp in range(first if variables.get("start") else last, last + 1, seconds):
+            read_at = datetime.fromtimestamp(stamp, timezone.utc)
+            demand = self.demand(read_at)
+            readings.append({"read_at": read_at.isoformat(), "demand": demand,
+                             "consumption_delta": round(demand * seconds / 3600, 3),
+                             "consumption": round(stamp / 3600 * 400, 1), "cost_delta": None})
+            if len(readings) == self.page_size:
+                # Longer periods are cut short, so they have to be requested a page at a time
+                break
+        return {"data": {"smartMeterTelemetry": readings}}
+
+    def respond(self, body: dict, token: str = None) -> dict:
+        """Return the response to a GraphQL request."""
+        document = body.get("query") or ""
+        variables = body.get("variables") or {}
+        if "obtainKrakenToken" in document:
+            self._count("obtainKrakenToken")
+            return self._obtain_token(variables)
+        for operation, respond in (("smartMeterTelemetry", self._telemetry), ("account", self._smart_devices)):
+            if f"{operation}(" in document:
+                self._count(operation)
+                return self._authorised(token) or respond(variables)
+        return self._error("Unknown operation.", "KT-CT-0000")
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Handles GraphQL POST requests."""
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self.send_error(400, "Request body is not JSON")
+                    return
+                data = json.dumps(standin.respond(body, self.headers.get("Authorization"))).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
+
+
+class RatesStandIn(_Served):
+    """A stand-in for the REST unit rates endpoints, publishing the next day's rates on request.
+
+    Rates are returned for every half hour up to the end of today in UK time until publish() is
+    called, or until publish_at if it is given, and up to the end of tomorrow after that.
+
+    Args:
+        publish_at (datetime, optional): The time the next day's rates are published. Defaults to when publish() is called.
+        page_size (int, optional): The most rates returned by one request. Defaults to no limit.
+        host (str, optional): The address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): The port to listen on, 0 picks a free port. Defaults to 0.
+    """
+
+    PATH = re.compile(r"/v1/products/[^/]+/electricity-tariffs/[^/]+/standard-unit-rates/?")
+
+    def __init__(self, publish_at: datetime = None, page_size: int = None, host: str = "127.0.0.1",
+                 port: int = 0) -> None:
+        self.publish_at = publish_at
+        self.page_size = page_size
+        self._published = threading.Event()
+        super().__init__(host, port)
+
+    @property
+    def url(self) -> str:
+        return self.address
+
+    def publish(self) -> None:
+        """Publish the next day's rates."""
+        self._published.set()
+
+    @staticmethod
+    def price(when: datetime) -> float:
+        """The synthetic price in pence at a time, expensive from 16:00 to 19:00 UK time."""
+        local = when.astimezone(LONDON)
+        return round((35.0 if 16 <= local.hour < 19 else 15.0) + local.day % 7 / 10, 2)
+
+    def published_through(self, now: datetime = None) -> datetime:
+        """Return the end of the rates published at a time."""
+        now = now or datetime.now(timezone.utc)
+        published = self._published.is_set() or (self.publish_at is not None and now >= self.publish_at)
+        day = now.astimezone(LONDON).date() + timedelta(days=2 if published else 1)
+        return datetime(day.year, day.month, day.day, tzinfo=LONDON).astimezone(timezone.utc)
+
+    def rates(self, query: dict, path: str = "") -> dict:
+        """Return the rates response for a query, newest first like the Octopus API."""
+        start = datetime.strptime(query["period_from"], "%Y-%m-%dT%H:%MZ").replace(tzinfo=timezone.utc)
+        end = min(datetime.strptime(query["period_to"], "%Y-%m-%dT%H:%MZ").replace(tzinfo=timezone.utc),
+                  self.published_through())
+        slot = datetime.fromtimestamp(int(start.timestamp()) // 1800 * 1800, timezone.utc)
+        results = []
+        while slot < end:
+            results.append({"value_exc_vat": round(self.price(slot) / 1.05, 4), "value_inc_vat": self.price(slot),
+                            "valid_from": slot.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                            "valid_to": (slot + timedelta(minutes=30)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                            "payment_method": None})
+            slot += timedelta(minutes=30)
+        results.reverse()
+        count = len(results)
+        following = None
+        if self.page_size:
+            page = int(query.get("page", 1))
+            results = results[(page - 1) * self.page_size:page * self.page_size]
+            if page * self.page_size < count:
+                following = f"{self.address}{path}?{urlencode({**query, 'page': page + 1})}"
+        return {"count": count, "next": following, "previous": None, "results": results}
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Handles GET requests for unit rates, answering If-None-Match with 304 Not Modified."""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                parts = urlsplit(self.path)
+                if not standin.PATH.fullmatch(parts.path):
+                    self.send_error(404, "Not found")
+                    return
+                query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+                if "period_from" not in query or "period_to" not in query:
+                    self.send_error(400, "period_from and period_to are required")
+                    return
+                data = json.dumps(standin.rates(query, parts.path)).encode()
+                etag = f'"{hashlib.blake2b(data, digest_size=8).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    standin._count("not_modified")  # pylint: disable=protected-access
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                standin._count("rates")  # pylint: disable=protected-access
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    """Serve a stand-in until interrupted."""
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Octopus APIs")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--rates", action="store_true", help="Serve REST unit rates rather than Kraken GraphQL")
+    parser.add_argument("--publish-at", default=None, help="ISO time the next day's rates are published")
+    parser.add_argument("--apikey", default="sk_test", help="API key accepted")
+    parser.add_argument("--account", default="A-TEST", help="Account number")
+    parser.add_argument("--token-lifetime", type=int, default=3600, help="Seconds each token is valid for")
+    parser.add_argument("--page-size", type=int, default=1000, help="Most telemetry readings returned per request")
+    args = parser.parse_args()
+    if args.rates:
+        publish_at = datetime.fromisoformat(args.publish_at) if args.publish_at else None
+        standin = RatesStandIn(publish_at=publish_at, port=args.port)
+        print(f"Rates stand-in listening on {standin.url}")
+    else:
+        standin = StandIn(apikey=args.apikey, account=args.account, token_lifetime=args.token_lifetime,
+                          page_size=args.page_size, port=args.port)
+        print(f"Kraken stand-in listening on {standin.url}")
+    standin.serve()
+
+
+if __name__ == "__main__":
+    main()
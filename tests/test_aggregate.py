@@ -0,0 +1,42 @@
+"""Tests for aggregate.rollup across the UK clock changes."""
+
+from datetime import datetime, timedelta, timezone
+
+from octopusapi import aggregate
+from octopusapi.const import Group, PriceType
+from octopusapi.store import Reading
+
+SLOT = timedelta(minutes=30)
+# Midnight at the start of 29 October 2023 in UK time, the day the clocks went back
+AUTUMN = datetime(2023, 10, 28, 23, tzinfo=timezone.utc)
+
+
+def readings(start: datetime, count: int) -> list:
+    return [Reading(start + SLOT * index, start + SLOT * (index + 1), 0.5) for index in range(count)]
+
+
+def test_days_follow_the_clock_change():
+    days = aggregate.rollup(readings(AUTUMN, 50 + 48), Group.DAY)
+    # The day the clocks go back has 25 hours
+    assert [(period.interval_start.isoformat(), period.count) for period in days] == [
+        ("2023-10-29T00:00:00+01:00", 50), ("2023-10-30T00:00:00+00:00", 48)]
+    assert days[0].consumption == 25.0
+    assert days[0].interval_end == days[1].interval_start
+
+
+def test_weeks_and_months():
+    usage = readings(AUTUMN, 50 + 48)
+    assert [period.interval_start.isoformat() for period in aggregate.rollup(usage, Group.WEEK)] == [
+        "2023-10-23T00:00:00+01:00", "2023-10-30T00:00:00+00:00"]
+    months = aggregate.rollup(usage, Group.MONTH)
+    assert [(period.interval_start.isoformat(), period.count) for period in months] == [
+        ("2023-10-01T00:00:00+01:00", 98)]
+
+
+def test_ranges_split_by_classifier():
+    def classify(when):
+        return PriceType.OFFPEAK if when.astimezone(aggregate.LONDON).hour < 7 else PriceType.PEAK
+
+    day = aggregate.rollup(readings(AUTUMN + timedelta(days=1, hours=1), 48), Group.DAY, classify)[0]
+    assert day.ranges[PriceType.OFFPEAK.value] == 7.0
+    assert day.ranges[PriceType.PEAK.value] == 17.0
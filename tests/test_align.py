@@ -0,0 +1,48 @@
+"""Tests for align.align joining import, export and generation onto one half hour grid."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from octopusapi import align
+from octopusapi.store import Price, Reading
+
+np = pytest.importorskip("numpy")
+
+SLOT = timedelta(minutes=30)
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+
+def readings(count: int, value: float, skip: tuple = (), step: timedelta = SLOT) -> list:
+    return [Reading(START + step * index, START + step * (index + 1), value)
+            for index in range(count) if index not in skip]
+
+
+def test_flows_and_costs():
+    aligned = align.align(readings(4, 1.0), readings(4, 0.5), readings(8, 0.5, step=SLOT / 2),
+                          import_rates=[Price(START, None, 20, 21.0, None)],
+                          export_rates=[Price(START, None, 15, 15.0, None)])
+    assert len(aligned) == 4
+    # Generation at quarter hours is summed into each half hour
+    assert aligned["generation_kwh"].tolist() == [1.0] * 4
+    assert aligned["self_consumed_kwh"].tolist() == [0.5] * 4
+    assert aligned["demand_kwh"].tolist() == [1.5] * 4
+    assert aligned["net_cost"].tolist() == [21.0 - 7.5] * 4
+
+
+def test_missing_half_hours_are_nan():
+    aligned = align.align(readings(4, 1.0, skip=(2,)), readings(4, 0.5))
+    assert np.isnan(aligned["import_kwh"][2])
+    assert aligned.missing["import_kwh"].tolist() == [False, False, True, False]
+    assert aligned.complete.tolist() == [True, True, False, True]
+    assert aligned.totals()["import_kwh"] == 3.0
+
+
+def test_empty_series_is_missing_but_absent_series_is_zero():
+    given = align.align(readings(4, 1.0), [])
+    assert given.missing["export_kwh"].all()
+    assert np.isnan(given["export_kwh"]).all()
+    absent = align.align(readings(4, 1.0))
+    assert "export_kwh" not in absent.missing
+    assert absent["export_kwh"].tolist() == [0.0] * 4
+    assert absent["net_kwh"].tolist() == [1.0] * 4
@@ -0,0 +1,54 @@
+"""Tests for bill.build and the pricing it shares with daily costs and collected bills."""
+
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from octopusapi import bill, plan, pricing
+from octopusapi.store import Price, Reading
+
+SLOT = timedelta(minutes=30)
+# Midnight at the start of 30 June 2024 in UK time, during British Summer Time
+SUMMER = datetime(2024, 6, 29, 23, tzinfo=timezone.utc)
+
+
+def readings(start: datetime, count: int, value: float = 1.0) -> list:
+    return [Reading(start + SLOT * index, start + SLOT * (index + 1), value) for index in range(count)]
+
+
+def test_summer_days_follow_uk_midnight():
+    consumption = readings(SUMMER, 96)
+    rates = [Price(SUMMER, SUMMER + timedelta(days=2), 9.5, 10.0, None)]
+    result = bill.build(date(2024, 6, 30), date(2024, 7, 1), import_consumption=consumption, import_rates=rates)
+    # 23:00 to 00:00 UTC is the first hour of the next UK day, so each day has all 48 half hours
+    assert [(line.period, line.import_kwh, line.import_cost) for line in result.days] == [
+        (date(2024, 6, 30), 48.0, 480.0), (date(2024, 7, 1), 48.0, 480.0)]
+
+
+def test_standing_charge_applies_to_each_day():
+    charges = [Price(SUMMER, None, 40.0, 42.0, None)]
+    result = bill.build(date(2024, 6, 30), date(2024, 7, 2), import_consumption=readings(SUMMER, 96),
+                        import_rates=[Price(SUMMER, None, 9.5, 10.0, None)], import_charges=charges)
+    assert [line.import_standing for line in result.days] == [42.0, 42.0, 42.0]
+    assert result.total == pytest.approx(960 + 3 * 42)
+
+
+def test_gas_in_cubic_metres_is_converted():
+    factor = bill.gas_factor("m3")
+    result = bill.build(date(2024, 6, 30), date(2024, 6, 30), gas_consumption=readings(SUMMER, 48, 0.1),
+                        gas_rates=[Price(SUMMER, None, 5.7, 6.0, None)], gas_conversion=factor)
+    assert result.days[0].gas_kwh == pytest.approx(4.8 * factor, abs=1e-3)
+    assert result.days[0].gas_cost == pytest.approx(4.8 * factor * 6.0, abs=1e-3)
+
+
+def test_collected_bill_uses_the_same_gas_factor():
+    assert plan.CollectionPlan(gas_units="m3").gas_conversion == bill.gas_factor("m3")
+    assert plan.CollectionPlan(gas_units="m3", calorific_value=40.0).gas_conversion == bill.gas_factor("m3", 40.0)
+    assert plan.CollectionPlan().gas_conversion == 1.0
+
+
+def test_daily_cost_uses_uk_days():
+    consumption = {entry.interval_start: entry for entry in readings(SUMMER, 96)}
+    # The price changes at 23:00 UTC, which is midnight in UK time
+    cost = pricing.daily_cost({SUMMER: 10.0, SUMMER + timedelta(days=1): 20.0}, consumption)
+    assert cost == {date(2024, 6, 30): 480.0, date(2024, 7, 1): 960.0}
@@ -0,0 +1,35 @@
+"""Tests for conditional.ResponseCache, which holds responses revalidated with conditional requests."""
+
+from octopusapi import conditional
+
+
+def entry(body: bytes, etag: str = None, last_modified: str = None) -> conditional.CachedResponse:
+    return conditional.CachedResponse(body.decode(), conditional.digest(body), etag, last_modified)
+
+
+def test_headers_make_the_request_conditional():
+    assert entry(b"{}", '"v1"', "Mon, 01 Jan 2024 00:00:00 GMT").headers == {
+        "If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    assert entry(b"{}").headers == {}
+
+
+def test_outcomes_are_counted():
+    cache = conditional.ResponseCache()
+    first = entry(b'{"count": 1}', '"v1"')
+    assert cache.replaced("products", first) == first.parsed
+    assert cache.revalidated("products", first, sent=False) == first.parsed
+    assert cache.revalidated("products", first, sent=True) == first.parsed
+    cache.replaced("products", entry(b'{"count": 2}', '"v2"'))
+    assert (cache.not_modified, cache.unchanged, cache.changed) == (1, 1, 1)
+    assert cache.get("products").etag == '"v2"'
+
+
+def test_least_recently_used_is_discarded():
+    cache = conditional.ResponseCache(size=2)
+    for key in ("a", "b"):
+        cache.replaced(key, entry(key.encode()))
+    assert cache.get("a") is not None
+    cache.replaced("c", entry(b"c"))
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
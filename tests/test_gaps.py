@@ -0,0 +1,29 @@
+"""Tests for finding the gaps in consumption and grouping them into queries."""
+
+from datetime import datetime, timedelta, timezone
+
+from octopusapi import gaps
+
+SLOT = timedelta(minutes=30)
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+
+def test_find_gaps():
+    starts = [START + SLOT * index for index in range(48) if index not in (3, 4, 10)]
+    assert gaps.find_gaps(starts, START, START + SLOT * 48) == [
+        gaps.Gap(START + SLOT * 3, START + SLOT * 5), gaps.Gap(START + SLOT * 10, START + SLOT * 11)]
+
+
+def test_missing_end_is_a_gap():
+    found = gaps.find_gaps([START, START + SLOT], START, START + SLOT * 6)
+    assert found == [gaps.Gap(START + SLOT * 2, START + SLOT * 6)]
+    assert found[0].slots == 4
+
+
+def test_nearby_gaps_are_queried_together():
+    found = [gaps.Gap(START, START + SLOT), gaps.Gap(START + SLOT * 3, START + SLOT * 4),
+             gaps.Gap(START + SLOT * 40, START + SLOT * 41)]
+    assert gaps.coalesce(found, page_size=100, bridge=12) == [
+        gaps.Gap(START, START + SLOT * 4), gaps.Gap(START + SLOT * 40, START + SLOT * 41)]
+    # Gaps are not joined into a query longer than a page
+    assert len(gaps.coalesce(found[:2], page_size=3, bridge=12)) == 2
@@ -0,0 +1,59 @@
+"""Tests for gateway.Gateway views, served from a client which returns fixed unit rates."""
+
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from octopusapi import plan
+from octopusapi.gateway import Gateway, GatewayError
+from octopusapi.store import Price
+
+SLOT = timedelta(minutes=30)
+
+
+class RatesClient:
+    """Answers fetch with half hourly rates around the period requested, recording each request."""
+
+    def __init__(self) -> None:
+        self.requests = []
+
+    def fetch(self, dataset, days: int = 7, since: datetime = None, until: datetime = None) -> list:
+        self.requests.append((dataset, since, until))
+        first = datetime.fromtimestamp(int(since.timestamp()) // 1800 * 1800, timezone.utc) - SLOT
+        return [Price(first + SLOT * index, first + SLOT * (index + 1), index, float(index), None)
+                for index in range(4)]
+
+
+@pytest.fixture
+def gateway():
+    with Gateway(RatesClient()) as served:
+        yield served
+
+
+def test_current_price_is_the_slot_containing_now(gateway):
+    status, _, body = gateway.get("/price/current")
+    assert status == 200
+    # The second slot returned starts at the half hour containing now
+    assert json.loads(body) == {"value_inc_vat": 1.0}
+    dataset, since, until = gateway.client.requests[0]
+    assert dataset is plan.Dataset.IMPORT_RATES
+    assert until - since == SLOT
+    assert abs(since - datetime.now(timezone.utc)) < timedelta(minutes=1)
+
+
+def test_views_are_cached(gateway):
+    first = gateway.get("/price/current")
+    assert gateway.get("/price/current") == first
+    assert len(gateway.client.requests) == 1
+    assert gateway.counters["cache_hits"] == 1
+    assert gateway.counters["cache_misses"] == 1
+
+
+def test_unknown_path_and_bad_query(gateway):
+    with pytest.raises(GatewayError) as unknown:
+        gateway.get("/nowhere")
+    assert unknown.value.status == 404
+    with pytest.raises(GatewayError) as invalid:
+        gateway.get("/cost/daily?days=none")
+    assert invalid.value.status == 400
@@ -0,0 +1,92 @@
+"""Tests for graphql.KrakenClient against the Kraken stand-in."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from octopusapi import graphql
+from octopusapi.api import OctopusError
+from octopusapi.const import TelemetryGrouping
+from standin import StandIn
+
+
+@pytest.fixture
+def kraken():
+    with StandIn() as standin:
+        yield standin
+
+
+def client(standin: StandIn, apikey: str = None) -> graphql.KrakenClient:
+    return graphql.KrakenClient(apikey or standin.apikey, standin.account, url=standin.url)
+
+
+def test_token_from_apikey(kraken):
+    kraken_client = client(kraken)
+    assert kraken_client.devices() == list(kraken.devices)
+    assert kraken_client.devices() == list(kraken.devices)
+    # The token is obtained once with the API key and reused until it is about to expire
+    assert kraken.requests["APIKey"] == 1
+    assert "refreshToken" not in kraken.requests
+    assert kraken.requests["account"] == 2
+
+
+def test_invalid_apikey(kraken):
+    with pytest.raises(OctopusError, match="Unable to obtain a Kraken token"):
+        client(kraken, apikey="sk_wrong").devices()
+
+
+def test_short_token_lifetime_refreshes():
+    # A token which expires within the refresh margin is refreshed before every request
+    with StandIn(token_lifetime=graphql.TOKEN_MARGIN // 2) as standin:
+        kraken_client = client(standin)
+        for _ in range(3):
+            assert kraken_client.devices() == list(standin.devices)
+        assert standin.requests["APIKey"] == 1
+        assert standin.requests["refreshToken"] == 2
+        assert standin.requests["account"] == 3
+
+
+def test_expired_token_is_retried_once(kraken):
+    kraken_client = client(kraken)
+    kraken_client.devices()
+    kraken.expire()
+    assert kraken_client.devices() == list(kraken.devices)
+    # The rejected request is made again with a refreshed token
+    assert kraken.requests["account"] == 3
+    assert kraken.requests["refreshToken"] == 1
+
+
+def test_token_rejected_twice_raises(kraken, monkeypatch):
+    kraken_client = client(kraken)
+    monkeypatch.setattr(kraken, "_authorised",
+                        lambda token: kraken._error("Signature of the JWT has expired.", "KT-CT-1124"))
+    with pytest.raises(OctopusError, match="smartMeterTelemetry failed"):
+        kraken_client.telemetry(kraken.devices[0])
+    assert kraken.requests["smartMeterTelemetry"] == 2
+    assert kraken.requests["obtainKrakenToken"] == 2
+
+
+def test_telemetry_is_paged(kraken, monkeypatch):
+    monkeypatch.setattr(graphql, "TELEMETRY_PAGE", 100)
+    kraken.page_size = 101
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    end = start + timedelta(hours=2)
+    readings = client(kraken).telemetry(kraken.devices[0], start, end, TelemetryGrouping.TEN_SECONDS)
+    # Every ten second reading from start to end inclusive, none lost or repeated between pages
+    assert [entry.read_at for entry in readings] == [start + timedelta(seconds=10 * step) for step in range(721)]
+    assert kraken.requests["smartMeterTelemetry"] == 8
+
+
+def test_telemetry_latest_reading(kraken):
+    readings = client(kraken).telemetry(kraken.devices[0])
+    assert len(readings) == 1
+    assert kraken.requests["smartMeterTelemetry"] == 1
+
+
+def test_readings_in_kwh(kraken):
+    since = datetime.now(timezone.utc) - timedelta(minutes=10)
+    readings = client(kraken).readings(kraken.devices[0], since, TelemetryGrouping.ONE_MINUTE)
+    assert 9 <= len(readings) <= 10
+    assert all(entry.interval_start > since for entry in readings)
+    assert all(entry.interval_end - entry.interval_start == timedelta(minutes=1) for entry in readings)
+    assert all(0 < entry.consumption < 1 for entry in readings)
@@ -0,0 +1,58 @@
+"""Tests for merging pages of results without repeats and splitting queries into shards."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from octopusapi import merge, shard
+from octopusapi.const import Order
+from octopusapi.store import Price, Reading
+
+SLOT = timedelta(minutes=30)
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+
+def rows(first: int, last: int) -> list:
+    return [{"interval_start": (START + SLOT * index).isoformat(), "consumption": 0.1}
+            for index in range(first, last)]
+
+
+def test_shifted_pages_are_deduplicated():
+    merged = merge.OrderedMerge()
+    # Newest first, and the second page repeats the end of the first after a new reading was published
+    pages = [rows(6, 10)[::-1], rows(3, 7)[::-1], rows(0, 3)[::-1]]
+    results = [row for page in pages for row in merged.page(page)]
+    assert [row["interval_start"] for row in results] == [row["interval_start"] for row in rows(0, 10)[::-1]]
+    assert merged.order is Order.BACKWARD
+    assert merged.duplicates == 1
+
+
+def test_rates_with_different_payment_methods_are_kept():
+    merged = merge.OrderedMerge()
+    page = [{"valid_from": START.isoformat(), "payment_method": "DIRECT_DEBIT"},
+            {"valid_from": START.isoformat(), "payment_method": "NON_DIRECT_DEBIT"}]
+    assert merged.page(page) == page
+    assert merged.page(page[1:]) == []
+
+
+def test_out_of_order_results_raise():
+    merged = merge.OrderedMerge(order=Order.FORWARD)
+    with pytest.raises(merge.OrderError):
+        merged.page(rows(1, 2) + rows(0, 1))
+
+
+def test_remaining_shards_cover_the_rest_of_the_period():
+    first = [Reading(START + SLOT * index, START + SLOT * (index + 1), 0.1) for index in range(10)]
+    shards = shard.remaining(first, 40, START, START + SLOT * 40, Order.FORWARD)
+    assert len(shards) == 3
+    assert shards[0][0] == first[-1].interval_start
+    assert shards[-1][1] == START + SLOT * 40
+    assert all(lower < upper for lower, upper in shards)
+    assert shard.remaining(first, 10, START, START + SLOT * 10, Order.FORWARD) == []
+
+
+def test_combine_removes_rates_repeated_across_shards():
+    spanning = Price(START + SLOT, START + SLOT * 3, 10, 10.5, None)
+    pages = [[Price(START, START + SLOT, 10, 10.5, None), spanning],
+             [spanning, Price(START + SLOT * 3, None, 11, 11.55, None)]]
+    assert shard.combine(pages, Order.FORWARD) == [pages[0][0], spanning, pages[1][1]]
@@ -0,0 +1,41 @@
+"""Tests for pricing, covering Economy 7 register rates and pricing consumption against them."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from octopusapi import pricing
+from octopusapi.const import Rate
+from octopusapi.store import Price, Reading
+
+SLOT = timedelta(minutes=30)
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def test_register_rates_switch_at_the_night_window():
+    day = [Price(None, None, 28.6, 30.0, None)]
+    night = [Price(None, None, 11.4, 12.0, None)]
+    series = pricing.register_rates(day, night, START, START + timedelta(days=1))
+    assert [(entry.valid_from.time().isoformat(), entry.register, entry.value_inc_vat) for entry in series] == [
+        ("00:00:00", Rate.ECO7_DAY, 30.0), ("00:30:00", Rate.ECO7_NIGHT, 12.0), ("07:30:00", Rate.ECO7_DAY, 30.0)]
+    assert series[-1].valid_to == START + timedelta(days=1)
+
+
+def test_register_rates_follow_a_price_change():
+    change = START + timedelta(hours=12)
+    day = [Price(None, change, 28.6, 30.0, None), Price(change, None, 31.4, 33.0, None)]
+    night = [Price(None, None, 11.4, 12.0, None)]
+    series = pricing.register_rates(day, night, START, START + timedelta(days=1))
+    assert [(entry.valid_from, entry.value_inc_vat) for entry in series if entry.register is Rate.ECO7_DAY] == [
+        (START, 30.0), (START + timedelta(hours=7, minutes=30), 30.0), (change, 33.0)]
+
+
+def test_consumption_priced_against_register_rates():
+    consumption = pricing.ConsumptionSeries(
+        [Reading(START + SLOT * index, START + SLOT * (index + 1), 1.0) for index in range(48)])
+    series = pricing.register_rates([Price(None, None, 28.6, 30.0, None)], [Price(None, None, 11.4, 12.0, None)],
+                                    START, START + timedelta(days=1))
+    cost, covered = consumption.cost(series)
+    # Fourteen half hours at the night rate and the other thirty four at the day rate
+    assert covered == 48
+    assert cost == pytest.approx(14 * 12.0 + 34 * 30.0)
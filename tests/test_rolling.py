@@ -0,0 +1,45 @@
+"""Tests for rolling.RollingStats, fed incrementally and restored from a checkpoint."""
+
+import json
+from datetime import datetime, timedelta, timezone
+
+from octopusapi.rolling import RollingStats
+from octopusapi.store import Reading
+
+SLOT = timedelta(minutes=30)
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def readings(first: int, last: int) -> list:
+    # 0.1 kWh overnight and 0.5 kWh during the day, with a peak at 18:00 on the sixth day
+    return [Reading(START + SLOT * index, START + SLOT * (index + 1),
+                    1.5 if index == 5 * 48 + 36 else 0.1 if index % 48 < 14 else 0.5) for index in range(first, last)]
+
+
+def test_summary():
+    stats = RollingStats(windows=(1, 7))
+    assert stats.update("1/A", readings(0, 48 * 10)) == 480
+    summary = stats.summary("1/A")
+    assert summary.through == START + timedelta(days=10)
+    assert summary.baseload == 0.2
+    assert summary.averages == {1: 18.4, 7: 18.543}
+    assert summary.peaks[7] == (START + timedelta(days=5, hours=18), 1.5)
+    # The peak has left the one day window
+    assert summary.peaks[1][1] == 0.5
+
+
+def test_late_and_repeated_intervals_are_ignored():
+    stats = RollingStats()
+    stats.update("1/A", readings(0, 96))
+    assert stats.update("1/A", readings(48, 100)) == 4
+    assert stats.through("1/A") == START + SLOT * 100
+
+
+def test_checkpoint_restores_the_same_statistics():
+    whole = RollingStats(windows=(1, 7))
+    whole.update("1/A", readings(0, 48 * 10))
+    resumed = RollingStats(windows=(1, 7))
+    resumed.update("1/A", readings(0, 48 * 4))
+    resumed = RollingStats.from_dict(json.loads(json.dumps(resumed.to_dict())))
+    resumed.update("1/A", readings(48 * 4, 48 * 10))
+    assert resumed.summaries() == whole.summaries()
@@ -0,0 +1,47 @@
+"""Tests for inferring the peak and off peak periods of a tariff from its unit rates."""
+
+from datetime import date, datetime, time, timedelta, timezone
+
+from octopusapi import schedule
+from octopusapi.aggregate import LONDON
+from octopusapi.const import PriceType
+from octopusapi.store import Price
+
+
+def fixed_day(day: date, cheap: tuple = (time(0, 30), time(4, 30)), prices: tuple = (8.5, 28.0)) -> list:
+    """The rates of a day with a cheap period each night, like Octopus Go."""
+    midnight = datetime.combine(day, time(), LONDON)
+    bounds = [midnight, midnight.replace(hour=cheap[0].hour, minute=cheap[0].minute),
+              midnight.replace(hour=cheap[1].hour, minute=cheap[1].minute), midnight + timedelta(days=1)]
+    values = (prices[1], prices[0], prices[1])
+    return [Price(lower.astimezone(timezone.utc), upper.astimezone(timezone.utc), value, value, None)
+            for lower, upper, value in zip(bounds, bounds[1:], values)]
+
+
+def test_fixed_days_merge_into_one_period():
+    rates = [entry for offset in range(7) for entry in fixed_day(date(2024, 3, 1) + timedelta(days=offset))]
+    inferred = schedule.infer(rates)
+    assert len(inferred) == 1
+    assert not inferred.dynamic
+    assert inferred.classify(datetime(2024, 3, 3, 1, tzinfo=LONDON)) is PriceType.OFFPEAK
+    assert inferred.classify(datetime(2024, 3, 3, 18, tzinfo=LONDON)) is PriceType.PEAK
+    # Later days take the labels of the last fixed period
+    assert inferred.classify(datetime(2024, 4, 1, 2, tzinfo=LONDON)) is PriceType.OFFPEAK
+
+
+def test_change_of_times_starts_a_new_period():
+    rates = fixed_day(date(2024, 3, 1)) + fixed_day(date(2024, 3, 2), cheap=(time(23, 0), time(23, 30)))
+    inferred = schedule.infer(rates)
+    assert len(inferred) == 2
+    assert inferred.classify(datetime(2024, 3, 2, 1, tzinfo=LONDON)) is PriceType.PEAK
+
+
+def test_dynamic_day_labelled_by_quantiles():
+    start = datetime(2024, 3, 1, tzinfo=LONDON)
+    rates = [Price(start + timedelta(minutes=30 * slot), start + timedelta(minutes=30 * (slot + 1)), slot, slot, None)
+             for slot in range(48)]
+    inferred = schedule.infer(rates)
+    assert inferred.dynamic
+    assert inferred.classify(start) is PriceType.OFFPEAK
+    assert inferred.classify(start + timedelta(hours=12)) is PriceType.STANDARD
+    assert inferred.classify(start + timedelta(hours=23)) is PriceType.PEAK
@@ -0,0 +1,52 @@
+"""Tests for fetching a long rates query as concurrent shards from the paged rates stand-in."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from octopusapi.api import OctopusClient
+from octopusapi.const import APIList, DatetimeFormat
+from standin import RatesStandIn
+
+TARIFF = "E-1R-AGILE-24-10-01-C"
+ARGUMENTS = {"tariff_code": TARIFF, "product_code": TARIFF[5:-2]}
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+WINDOW = {"period_from": START.strftime(DatetimeFormat.OCTOPUSDATETIME.value),
+          "period_to": (START + timedelta(days=14)).strftime(DatetimeFormat.OCTOPUSDATETIME.value)}
+
+
+@pytest.fixture
+def rates():
+    with RatesStandIn(page_size=48) as standin:
+        yield standin
+
+
+def fetch(url: str, sharded: bool):
+    with OctopusClient() as client:
+        client.set_rest_url(url)
+        client.set_sharding(sharded)
+        # pylint: disable-next=protected-access
+        return client._call_api(APIList.ElectricityStandardUnitRates, ARGUMENTS, WINDOW)
+
+
+def test_shards_match_following_pages(rates):
+    paged = fetch(rates.url, sharded=False)
+    assert rates.requests["rates"] == 14
+    sharded = fetch(rates.url, sharded=True)
+    assert sharded.count == paged.count == 14 * 48
+    assert [entry.valid_from for entry in sharded.results] == [entry.valid_from for entry in paged.results]
+    # Newest first, with every half hour once
+    starts = [entry.valid_from for entry in sharded.results]
+    assert starts == sorted(set(starts), reverse=True)
+    assert sharded.next is None
+
+
+def test_short_query_is_not_sharded(rates):
+    with OctopusClient() as client:
+        client.set_rest_url(rates.url)
+        client.set_sharding()
+        window = {**WINDOW, "period_to": (START + timedelta(hours=12)).strftime(DatetimeFormat.OCTOPUSDATETIME.value)}
+        # pylint: disable-next=protected-access
+        result = client._call_api(APIList.ElectricityStandardUnitRates, ARGUMENTS, window)
+    assert result.count == 24
+    assert rates.requests == {"rates": 1}
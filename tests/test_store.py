@@ -0,0 +1,106 @@
+"""Tests for store.Store, used directly and as the client's cache in front of the rates stand-in."""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from octopusapi.api import OctopusClient
+from octopusapi.const import APIList, DatetimeFormat
+from octopusapi.store import Price, Reading, Store
+from standin import RatesStandIn
+
+TARIFF = "E-1R-AGILE-24-10-01-C"
+SLOT = timedelta(minutes=30)
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+
+def readings(start: datetime, count: int) -> list:
+    return [Reading(start + SLOT * index, start + SLOT * (index + 1), 0.1 + index % 7 / 10) for index in range(count)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    with Store(str(tmp_path / "octopus.db"), batch=16) as shared:
+        yield shared
+
+
+def test_concurrent_use_of_one_store(store):
+    def work(meter: int) -> tuple:
+        name = f"mpan{meter}/serial"
+        for day in range(10):
+            start = START + timedelta(days=day)
+            store.upsert_consumption(name, readings(start, 48))
+            store.upsert_rates(TARIFF, f"kind{meter}", [Price(start, start + timedelta(days=1), 10, 10.5, None)])
+            assert len(store.consumption(name, START, start + timedelta(days=1))) == 48 * (day + 1)
+            assert store.first_gap(name, START, start + timedelta(days=1)) is None
+            assert store.covers(TARIFF, f"kind{meter}", START, start + timedelta(days=1))
+        return name, len(store.rates(TARIFF, f"kind{meter}", START, START + timedelta(days=10)))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(work, range(16)))
+    assert [count for _, count in results] == [10] * 16
+    assert all(len(store.consumption(name)) == 480 for name, _ in results)
+
+
+def test_first_gap(store):
+    store.upsert_consumption("meter", readings(START, 10) + readings(START + SLOT * 12, 4))
+    assert store.first_gap("meter", START, START + SLOT * 10) is None
+    assert store.first_gap("meter", START, START + SLOT * 16) == START + SLOT * 10
+    assert store.first_gap("meter", START + SLOT * 12, START + SLOT * 16) is None
+
+
+def test_covers_closed_rates(store):
+    store.upsert_rates(TARIFF, "standard", [Price(START, START + timedelta(days=1), 10, 10.5, None),
+                                            Price(START + timedelta(days=2), START + timedelta(days=3), 11, 11.55, None)])
+    assert store.covers(TARIFF, "standard", START, START + timedelta(days=1))
+    assert not store.covers(TARIFF, "standard", START, START + timedelta(days=3))
+    assert not store.covers(TARIFF, "night", START, START + timedelta(days=1))
+
+
+def test_covers_open_ended_rate_only_until_stored(store):
+    now = datetime.now(timezone.utc)
+    store.upsert_rates(TARIFF, "standing", [Price(START, None, 40, 42, None)])
+    # The rate is known to apply up to when it was stored, but not after
+    assert store.covers(TARIFF, "standing", START, now - timedelta(minutes=1))
+    assert not store.covers(TARIFF, "standing", START, now + timedelta(days=1))
+    assert not store.covers(TARIFF, "standing", now + timedelta(hours=1), now + timedelta(days=1))
+
+
+def test_open_ended_rate_replaced_by_price_change(store):
+    store.upsert_rates(TARIFF, "standing", [Price(START, None, 40, 42, None)])
+    change = START + timedelta(days=30)
+    store.upsert_rates(TARIFF, "standing", [Price(START, change, 40, 42, None), Price(change, None, 50, 52.5, None)])
+    rates = list(store.rates(TARIFF, "standing", START, change + timedelta(days=1)))
+    assert [(rate.valid_from, rate.valid_to, rate.value_inc_vat) for rate in rates] == [
+        (START, change, 42), (change, None, 52.5)]
+
+
+def test_compact_keeps_open_ended_rates_current(store):
+    store.upsert_rates(TARIFF, "standard", [Price(START, START + timedelta(days=1), 10, 10.5, None),
+                                            Price(START + timedelta(days=1), None, 10, 10.5, None)])
+    store.compact()
+    assert [(rate.valid_from, rate.valid_to) for rate in store.rates(TARIFF, "standard")] == [(START, None)]
+    assert store.covers(TARIFF, "standard", START, datetime.now(timezone.utc) - timedelta(minutes=1))
+
+
+def test_concurrent_client_calls_share_the_store(store):
+    def window(week: int) -> dict:
+        start = START + timedelta(weeks=week)
+        return {"period_from": start.strftime(DatetimeFormat.OCTOPUSDATETIME.value),
+                "period_to": (start + timedelta(weeks=1)).strftime(DatetimeFormat.OCTOPUSDATETIME.value)}
+
+    arguments = {"tariff_code": TARIFF, "product_code": TARIFF[5:-2]}
+    calls = [(APIList.ElectricityStandardUnitRates, arguments, window(week)) for week in range(12)]
+    with RatesStandIn() as rates, OctopusClient() as client:
+        client.set_rest_url(rates.url)
+        client.set_store(store)
+        client.set_max_workers(8)
+        first = client._fetch_concurrently(calls)  # pylint: disable=protected-access
+        assert rates.requests["rates"] == 12
+        again = client._fetch_concurrently(calls)  # pylint: disable=protected-access
+        # Every period is now answered from the store
+        assert rates.requests["rates"] == 12
+    assert [result.count for result in first] == [7 * 48] * 12
+    assert [[rate.valid_from for rate in result.results] for result in again] == \
+        [[rate.valid_from for rate in result.results] for result in first]
@@ -0,0 +1,79 @@
+"""Tests for watcher.RateWatcher against the unit rates stand-in."""
+
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from octopusapi.api import OctopusClient
+from octopusapi.watcher import RateWatcher
+from standin import RatesStandIn
+
+TARIFF = "E-1R-AGILE-24-10-01-C"
+
+
+@pytest.fixture
+def rates():
+    with RatesStandIn() as standin:
+        yield standin
+
+
+@pytest.fixture
+def client(rates):
+    with OctopusClient() as octopus:
+        octopus.set_rest_url(rates.url)
+        yield octopus
+
+
+def test_publication_pushed_to_callbacks(rates, client):
+    watcher = RateWatcher(client, tariff_code=TARIFF)
+    received = []
+    watcher.subscribe(received.append)
+    first = watcher.poll()
+    assert received == [first]
+    assert first.through == rates.published_through()
+    assert first.new == first.rates
+    assert [entry.valid_to for entry in first.rates[:-1]] == [entry.valid_from for entry in first.rates[1:]]
+    rates.publish()
+    second = watcher.poll()
+    assert received == [first, second]
+    # Only the next day's rates are new
+    assert second.through == first.through + timedelta(days=1)
+    assert second.new == [entry for entry in second.rates if entry.valid_from >= first.through]
+    assert second.new[0].valid_from == first.through
+
+
+def test_unchanged_rates_not_modified(rates, client):
+    watcher = RateWatcher(client, tariff_code=TARIFF)
+    received = []
+    watcher.subscribe(received.append)
+    assert watcher.poll() is not None
+    # The same period is requested again with the ETag and answered with 304 Not Modified
+    assert watcher.poll() is None
+    assert watcher.poll() is None
+    assert rates.requests == {"rates": 1, "not_modified": 2}
+    assert len(received) == 1
+    rates.publish()
+    assert watcher.poll() is not None
+    assert rates.requests == {"rates": 2, "not_modified": 2}
+    assert len(received) == 2
+
+
+def test_publication_pushed_to_queue(rates, client):
+    watcher = RateWatcher(client, tariff_code=TARIFF)
+
+    async def watch():
+        queue = watcher.queue()
+        # Polls run on another thread, as they do when the watcher is started
+        await asyncio.to_thread(watcher.poll)
+        first = await asyncio.wait_for(queue.get(), 5)
+        assert await asyncio.to_thread(watcher.poll) is None
+        rates.publish()
+        await asyncio.to_thread(watcher.poll)
+        second = await asyncio.wait_for(queue.get(), 5)
+        assert queue.empty()
+        return first, second
+
+    first, second = asyncio.run(watch())
+    assert second.through == first.through + timedelta(days=1)
+    assert len(second.new) == len(second.rates) - len(first.rates)
@@ -0,0 +1,45 @@
+"""Tests for finding the cheapest windows to run appliances."""
+
+from datetime import datetime, timezone
+
+from octopusapi import windows
+from octopusapi.store import Price
+
+SLOT = windows.SLOT
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+PRICES = [20, 18, 5, 6, 30, 4, 3, 25, 22, 21]
+
+
+def rates(prices: list = PRICES, skip: tuple = ()) -> list:
+    return [Price(START + SLOT * index, START + SLOT * (index + 1), price, price, None)
+            for index, price in enumerate(prices) if index not in skip]
+
+
+def test_contiguous_window():
+    window = windows.SlotPrices(rates()).find(windows.Appliance("dishwasher", hours=1, power=2))
+    assert window.start == START + SLOT * 5
+    assert window.cost == (4 + 3) * 2 / 2
+    assert window.energy == 2
+
+
+def test_window_does_not_span_a_gap():
+    # Without the rate at 02:30 the two cheapest neighbouring slots are no longer next to each other
+    window = windows.SlotPrices(rates(skip=(5,))).find(windows.Appliance("dishwasher", hours=1))
+    assert window.slots == [START + SLOT * 2, START + SLOT * 3]
+    assert windows.SlotPrices(rates(skip=(2, 5, 8))).find(windows.Appliance("long", hours=2)) is None
+
+
+def test_profile_weighted_window():
+    appliance = windows.Appliance("washer", profile=[2.0, 0.1, 0.1])
+    window = windows.SlotPrices(rates()).find(appliance)
+    best = min(range(len(PRICES) - 2),
+               key=lambda start: sum(weight * price for weight, price in zip(appliance.profile, PRICES[start:])))
+    assert window.start == START + SLOT * best
+    assert window.energy == sum(appliance.profile)
+
+
+def test_cheapest_slots_need_not_be_contiguous():
+    window = windows.SlotPrices(rates()).find(windows.Appliance("battery", hours=1.5, contiguous=False))
+    assert window.slots == [START + SLOT * index for index in (2, 5, 6)]
+    assert windows.cheapest_windows(rates(), [windows.Appliance("late", earliest=START + SLOT * 9, hours=1)]) == {
+        "late": None}